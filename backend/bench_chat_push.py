@@ -0,0 +1,73 @@
+"""
+Load test for push delivery (ChannelHub behind /ws/messages).
+
+Parks N idle subscribers on N idle channels, the same way ws_messages waits on
+a Subscription, then checks that:
+  1. an idle period costs no CPU (no timers or polling per subscriber), and
+  2. delivery latency on one busy channel does not grow with the idle count.
+
+Run from backend/:  python bench_chat_push.py
+"""
+import asyncio
+import time
+
+import server
+
+
+async def consumer(sub, received):
+    while True:
+        await sub.event.wait()
+        sub.event.clear()
+        for msg in sub.drain():
+            received.append((msg, time.perf_counter()))
+
+
+async def run(idle_subscribers, messages=2000, idle_window_s=2.0):
+    hub = server.ChannelHub(queue_size=256)
+    store = server.ChatStore(capacity=100, max_bytes=64 * 1024 * 1024)
+
+    idle_tasks = []
+    for i in range(idle_subscribers):
+        sub = hub.subscribe(f"idle-{i}")
+        idle_tasks.append(asyncio.create_task(consumer(sub, [])))
+
+    received = []
+    active = hub.subscribe("busy")
+    active_task = asyncio.create_task(consumer(active, received))
+    await asyncio.sleep(0)
+
+    cpu0 = time.process_time()
+    await asyncio.sleep(idle_window_s)
+    idle_cpu = time.process_time() - cpu0
+
+    latencies = []
+    for i in range(messages):
+        msg = store.append("busy", f"message {i}", "bench")
+        t0 = time.perf_counter()
+        hub.publish(msg)
+        while len(received) <= i:
+            await asyncio.sleep(0)
+        latencies.append(received[i][1] - t0)
+
+    for task in idle_tasks + [active_task]:
+        task.cancel()
+    latencies.sort()
+    return {
+        "idle_subscribers": idle_subscribers,
+        "idle_cpu_ms": idle_cpu * 1000,
+        "p50_us": latencies[len(latencies) // 2] * 1e6,
+        "p99_us": latencies[int(len(latencies) * 0.99)] * 1e6,
+    }
+
+
+def main():
+    for n in (0, 1000, 10000):
+        r = asyncio.run(run(n))
+        print(
+            f"idle={r['idle_subscribers']:>6}  idle CPU over 2s: {r['idle_cpu_ms']:.2f} ms  "
+            f"delivery p50 {r['p50_us']:.1f} us  p99 {r['p99_us']:.1f} us"
+        )
+
+
+if __name__ == "__main__":
+    main()
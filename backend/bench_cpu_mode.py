@@ -0,0 +1,128 @@
+"""
+Benchmark: CPU performance mode (see optimize_cpu_model) against the fp32 baseline.
+
+Each configuration runs in its own process (the knobs are read at model load and
+thread pools cannot be resized later), loads XTTS, synthesizes the same prompts
+with greedy decoding and reports the real-time factor (synthesis time / audio
+time, lower is better). Audio similarity to the fp32 output is reported as the
+duration ratio and the mean log-mel distance in dB after DTW alignment (0 dB for
+identical audio; quantization may change a token or two, which DTW absorbs).
+
+Speaker latents come from the latent store next to the sample, so every
+configuration conditions on the same fp32 latents.
+
+Needs the real model. Run from backend/:
+    python bench_cpu_mode.py speakers/<user>/en.wav [TORCH_THREADS=8 ...]
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+CONFIGS = {
+    "fp32": {},
+    "int8": {"CPU_QUANTIZE": "int8"},
+    "bf16": {"CPU_BF16": "1"},
+    "int8+bf16": {"CPU_QUANTIZE": "int8", "CPU_BF16": "1"},
+    "int8+compile": {"CPU_QUANTIZE": "int8", "TORCH_COMPILE": "1"},
+}
+PROMPTS = [
+    ("en", "Hello, this is a quick check of the CPU inference path."),
+    ("en", "The meeting moved to Thursday afternoon, so please update the calendar invite."),
+    ("hi", "नमस्ते, आज मौसम बहुत अच्छा है।"),
+]
+KNOBS = ("CPU_PERF_MODE", "CPU_QUANTIZE", "CPU_BF16", "TORCH_COMPILE", "TORCH_COMPILE_MODE")
+
+
+def worker(sample, out_dir, repeats=3):
+    import server
+
+    server.load_xtts_model()
+    gpt_latent, speaker_latent = server.get_speaker_latents(sample)
+    results = []
+    for i, (language, text) in enumerate(PROMPTS):
+        params = {**server.sampling_params(language, sample), "do_sample": False}
+        times = []
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            with server.torch.inference_mode(), server.autocast_context():
+                wav = server.run_inference_job(server.prepare_text(text, language), language, gpt_latent, speaker_latent, params)
+            times.append(time.perf_counter() - t0)
+        np.save(os.path.join(out_dir, f"{i}.npy"), wav)
+        results.append({"seconds": float(np.median(times)), "audio_s": len(wav) / server.SAMPLE_RATE})
+    print("RESULT " + json.dumps({"applied": server.cpu_optimizations, "prompts": results}))
+
+
+def log_mel(x, sr=24000, n_fft=1024, hop=256, n_mels=80):
+    frames = np.lib.stride_tricks.sliding_window_view(np.pad(x, n_fft // 2), n_fft)[::hop] * np.hanning(n_fft)
+    power = np.abs(np.fft.rfft(frames, axis=1)) ** 2
+    mel = lambda f: 2595 * np.log10(1 + f / 700)
+    edges = 700 * (10 ** (np.linspace(mel(0), mel(sr / 2), n_mels + 2) / 2595) - 1)
+    bins = np.fft.rfftfreq(n_fft, 1 / sr)
+    fb = np.maximum(0, np.minimum((bins - edges[:-2, None]) / (edges[1:-1, None] - edges[:-2, None]),
+                                  (edges[2:, None] - bins) / (edges[2:, None] - edges[1:-1, None])))
+    return 10 * np.log10(power @ fb.T + 1e-10)
+
+
+def dtw_mel_distance(a, b):
+    """Mean per-frame L1 log-mel distance (dB per band) along the cheapest alignment."""
+    A, B = log_mel(a), log_mel(b)
+    cost = np.abs(A[:, None, :] - B[None, :, :]).mean(axis=2)
+    acc = np.full((len(A) + 1, len(B) + 1), np.inf)
+    steps = np.zeros_like(acc)
+    acc[0, 0] = 0.0
+    for i in range(1, len(A) + 1):
+        for j in range(1, len(B) + 1):
+            prev = min((acc[i - 1, j - 1], steps[i - 1, j - 1]), (acc[i - 1, j], steps[i - 1, j]), (acc[i, j - 1], steps[i, j - 1]))
+            acc[i, j] = prev[0] + cost[i - 1, j - 1]
+            steps[i, j] = prev[1] + 1
+    return acc[-1, -1] / steps[-1, -1]
+
+
+def main():
+    sample = sys.argv[1]
+    env_overrides = dict(arg.split("=", 1) for arg in sys.argv[2:])
+    runs = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, knobs in CONFIGS.items():
+            out_dir = os.path.join(tmp, name)
+            os.makedirs(out_dir)
+            env = {k: v for k, v in os.environ.items() if k not in KNOBS}
+            env.update(env_overrides, **knobs)
+            proc = subprocess.run(
+                [sys.executable, __file__, "--worker", sample, out_dir],
+                env=env, capture_output=True, text=True,
+            )
+            lines = [l for l in proc.stdout.splitlines() if l.startswith("RESULT ")]
+            if proc.returncode != 0 or not lines:
+                print(f"{name:<14} failed:\n{proc.stderr[-2000:]}")
+                continue
+            runs[name] = json.loads(lines[-1][len("RESULT "):])
+            runs[name]["wavs"] = [np.load(os.path.join(out_dir, f"{i}.npy")) for i in range(len(PROMPTS))]
+
+    base = runs.get("fp32")
+    print(f"{len(PROMPTS)} prompts, greedy decoding; RTF = synthesis time / audio time")
+    for name, run in runs.items():
+        total = sum(p["seconds"] for p in run["prompts"])
+        audio = sum(p["audio_s"] for p in run["prompts"])
+        line = f"{name:<14} RTF {total / audio:6.3f}  ({total:6.2f}s for {audio:5.2f}s audio)"
+        if base is not None and name != "fp32":
+            dur = [len(w) / max(1, len(b)) for w, b in zip(run["wavs"], base["wavs"])]
+            dist = [dtw_mel_distance(w, b) for w, b in zip(run["wavs"], base["wavs"])]
+            line += (
+                f"  speedup {sum(p['seconds'] for p in base['prompts']) / total:5.2f}x"
+                f"  duration ratio {min(dur):.2f}-{max(dur):.2f}  log-mel distance {np.mean(dist):5.2f} dB"
+            )
+        print(line)
+        print(f"{'':<14} {run['applied']}")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--worker"]:
+        worker(sys.argv[2], sys.argv[3])
+    else:
+        main()
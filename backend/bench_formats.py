@@ -0,0 +1,53 @@
+"""
+Benchmark: size and encode cost of each output format (see AudioEncoder).
+
+Encodes 20 s of synthetic speech-like audio (the signal from test_trim_silence.py)
+at the rates clients typically ask for, and reports bytes per second of audio,
+kbps and encode CPU per second of audio, optionally across compression levels,
+so a format can be chosen per network class.
+
+Run from backend/:  python bench_formats.py [compression levels, e.g. 0 0.5 1]
+"""
+import sys
+import time
+
+import numpy as np
+
+import server
+from test_trim_silence import speech_like
+
+
+def encode_cost(x, sr, fmt, level, chunk_s=0.25):
+    enc = server.AudioEncoder(fmt, sr, 1, compression_level=level)
+    chunk = int(sr * chunk_s)
+    t0 = time.perf_counter()
+    enc.encode(np.zeros(0, dtype=np.float32))
+    for i in range(0, len(x), chunk):
+        enc.encode(x[i:i + chunk])
+    enc.close()
+    wall = time.perf_counter() - t0
+    return enc, wall
+
+
+def main():
+    levels = [float(v) for v in sys.argv[1:]] or [None]
+    seconds = 20.0
+    print(f"available: {', '.join(server.AVAILABLE_OUTPUT_FORMATS)}; {seconds:.0f}s per run, 250 ms chunks")
+    for sr in (16000, 24000, 48000):
+        x, _, _ = speech_like(sr, 0.0, seconds, 0.0, noise_db=-60)
+        for fmt in server.AVAILABLE_OUTPUT_FORMATS:
+            if fmt == "opus" and sr not in server.OPUS_RATES:
+                continue
+            for level in (levels if fmt in ("flac", "ogg", "opus") else [None]):
+                enc, wall = encode_cost(x, sr, fmt, level)
+                label = fmt if level is None else f"{fmt}@{level:g}"
+                print(
+                    f"{sr:>5} Hz  {label:<9} {enc.bytes_out / seconds:9.0f} B/s  "
+                    f"{enc.bytes_out * 8 / seconds / 1000:7.1f} kbps  "
+                    f"encode CPU {enc.encode_cpu_s * 1000 / seconds:6.2f} ms per audio s  "
+                    f"(wall {wall * 1000:6.1f} ms)"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,481 @@
+"""
+Offline benchmark suite for the backend, with machine-readable results.
+
+Runs without model weights or a GPU: the server is started with a deterministic
+stub in place of TTS.api.TTS (StubXtts below). The stub renders a speech-like
+waveform seeded by the text and costs a fixed time per character, so results
+measure the serving path (scheduler, segmentation, encoding, HTTP) rather than
+the model. Every /synthesize request uses a distinct text so the audio cache
+and single-flight never short-circuit it.
+
+Benchmarks:
+  synthesize     /synthesize latency percentiles, req/s and audio s/s at
+                 several concurrency levels (live server on 127.0.0.1)
+  chat           /send_message and /get_messages throughput across channel counts
+  preprocess     preprocess_and_save_sample across clip lengths (in-process)
+  trim_silence   trim_silence across clip lengths (in-process)
+
+Results are written as JSON (--out) and two result files can be compared; the
+comparison exits non-zero when a metric regressed by more than the threshold.
+
+Run from backend/:
+    python bench_suite.py [--quick] [--only synthesize,chat] [--out results.json]
+    python bench_suite.py compare old.json new.json [--threshold 0.15]
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import types
+import urllib.error
+import urllib.parse
+import urllib.request
+import wave
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+STUB_SR = 24000
+# Stub cost model: fixed overhead plus a per-character cost, spent sleeping so
+# the numbers do not depend on how fast this machine runs numpy
+STUB_BASE_MS = float(os.environ.get("BENCH_STUB_BASE_MS", 5))
+STUB_MS_PER_CHAR = float(os.environ.get("BENCH_STUB_MS_PER_CHAR", 0.5))
+STUB_AUDIO_S_PER_CHAR = 0.06  # ~16 characters per second of speech
+
+FULL = {
+    "synthesize": {"concurrency": [1, 4, 16], "requests": 64},
+    "chat": {"channels": [1, 10, 100], "messages": 2000},
+    "preprocess": {"lengths_s": [30, 60, 300], "repeats": 3},
+    "trim_silence": {"lengths_s": [1, 5, 30, 120], "repeats": 5},
+}
+QUICK = {
+    "synthesize": {"concurrency": [1, 4], "requests": 16},
+    "chat": {"channels": [1, 10], "messages": 200},
+    "preprocess": {"lengths_s": [30], "repeats": 1},
+    "trim_silence": {"lengths_s": [1, 5], "repeats": 2},
+}
+
+
+# ==============================
+# Deterministic TTS stub
+# ==============================
+def stub_waveform(text, sr=STUB_SR):
+    """Syllable-modulated harmonic tone; pitch and phase come from the text, so equal text gives equal audio."""
+    seed = zlib.crc32(text.encode("utf-8"))
+    n = max(1, int(sr * STUB_AUDIO_S_PER_CHAR * max(1, len(text))))
+    t = np.arange(n) / sr
+    f0 = 110 + seed % 90
+    voice = sum(np.sin(2 * np.pi * f0 * k * t + (seed >> k) % 7) / k for k in range(1, 6))
+    envelope = 0.55 + 0.45 * np.sin(2 * np.pi * 4 * t - np.pi / 2)
+    fade = np.minimum(1.0, np.minimum(t, t[-1] - t) / 0.01)
+    return (0.3 * voice * envelope * fade).astype(np.float32)
+
+
+class StubXtts:
+    """Just enough of Xtts for server.py: latents, inference and inference_stream."""
+
+    def __init__(self, torch):
+        self._torch = torch
+        self.tokenizer = types.SimpleNamespace(char_limits={"en": 250, "hi": 150})
+        self.config = types.SimpleNamespace(gpt_cond_len=6, gpt_cond_chunk_len=6, spk_emb_dim=512)
+
+    def eval(self):
+        return self
+
+    def _cost(self, text):
+        time.sleep((STUB_BASE_MS + STUB_MS_PER_CHAR * len(text)) / 1000)
+
+    def get_conditioning_latents(self, audio_path=None, gpt_cond_len=6, gpt_cond_chunk_len=6, **kwargs):
+        return self._torch.zeros(1, 32, 1024), self._torch.zeros(1, 512, 1)
+
+    def inference(self, text, language, gpt_cond_latent, speaker_embedding, **kwargs):
+        self._cost(text)
+        return {"wav": stub_waveform(text)}
+
+    def inference_stream(self, text, language, gpt_cond_latent, speaker_embedding, stream_chunk_size=20, **kwargs):
+        wav = stub_waveform(text)
+        chunks = range(0, len(wav), 4800)
+        for i in chunks:
+            self._cost(text[: max(1, len(text) // len(chunks))])
+            yield self._torch.from_numpy(wav[i:i + 4800])
+
+
+class StubTTS:
+    """Stands in for TTS.api.TTS."""
+
+    def __init__(self, model_name=None, progress_bar=False, **kwargs):
+        import torch
+
+        self.synthesizer = types.SimpleNamespace(tts_model=StubXtts(torch))
+
+    def to(self, device):
+        return self
+
+
+def install_stub_tts():
+    """Registers the stub as the TTS package so server.import_model_stack() picks it up."""
+    pkg = types.ModuleType("TTS")
+    api = types.ModuleType("TTS.api")
+    api.TTS = StubTTS
+    pkg.api = api
+    sys.modules["TTS"] = pkg
+    sys.modules["TTS.api"] = api
+
+
+def serve(port):
+    """Child process: the real app on the stub model (cwd holds the speakers/ directory)."""
+    install_stub_tts()
+    sys.path.insert(0, BACKEND_DIR)
+    import uvicorn
+
+    import server
+
+    uvicorn.run(server.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+# ==============================
+# Live server harness
+# ==============================
+SERVER_ENV = {
+    "AUDIO_CACHE_MB": "0",
+    "REPLICAS": "0",
+    "CPU_QUANTIZE": "none",
+    "CPU_BF16": "0",
+    "TORCH_COMPILE": "0",
+    "TORCH_THREADS": "1",
+    "PYTHONHASHSEED": "0",
+}
+
+
+def free_port():
+    import socket
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class BenchServer:
+    def __init__(self):
+        self.port = free_port()
+        self.base = f"http://127.0.0.1:{self.port}"
+        self.workdir = tempfile.mkdtemp(prefix="bench_suite_")
+        self.proc = None
+
+    def __enter__(self):
+        import soundfile as sf
+
+        os.makedirs(os.path.join(self.workdir, "speakers", "bench"))
+        sf.write(os.path.join(self.workdir, "speakers", "bench", "en.wav"), stub_waveform("bench speaker " * 40), STUB_SR)
+        env = {**os.environ, **SERVER_ENV, "PYTHONPATH": BACKEND_DIR}
+        self.log = open(os.path.join(self.workdir, "server.log"), "w")
+        self.proc = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "serve", "--port", str(self.port)],
+            cwd=self.workdir, env=env, stdout=self.log, stderr=subprocess.STDOUT,
+        )
+        deadline = time.monotonic() + 120
+        while time.monotonic() < deadline:
+            if self.proc.poll() is not None:
+                break
+            try:
+                if request("GET", self.base + "/readyz")[0] == 200:
+                    return self
+            except OSError:
+                pass
+            time.sleep(0.2)
+        with open(os.path.join(self.workdir, "server.log")) as f:
+            log = f.read()[-3000:]
+        self.__exit__()
+        raise RuntimeError("bench server did not become ready:\n" + log)
+
+    def __exit__(self, *exc):
+        if self.proc is not None and self.proc.poll() is None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(10)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+        self.log.close()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+def request(method, url, fields=None):
+    """(status, body, seconds) over a fresh connection, like a simple client would."""
+    data = urllib.parse.urlencode(fields).encode() if fields is not None else None
+    req = urllib.request.Request(url, data=data, method=method)
+    t0 = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=120) as resp:
+            body = resp.read()
+            status = resp.status
+    except urllib.error.HTTPError as e:
+        body, status = e.read(), e.code
+    return status, body, time.perf_counter() - t0
+
+
+def latency_summary(seconds):
+    ms = np.asarray(seconds) * 1000
+    if len(ms) == 0:
+        return {}
+    p50, p90, p99 = np.percentile(ms, [50, 90, 99])
+    return {"p50_ms": round(p50, 2), "p90_ms": round(p90, 2), "p99_ms": round(p99, 2), "mean_ms": round(ms.mean(), 2)}
+
+
+def wav_seconds(body):
+    with wave.open(io.BytesIO(body)) as w:
+        return w.getnframes() / w.getframerate()
+
+
+# ==============================
+# Benchmarks
+# ==============================
+SENTENCES = [
+    "The quick brown fox jumps over the lazy dog.",
+    "Please confirm the meeting moved to Thursday afternoon.",
+    "Your order has shipped and should arrive within three days.",
+    "Turn left at the next intersection, then continue straight.",
+]
+
+
+def bench_synthesize(server, concurrency, requests):
+    def one(tag):
+        text = f"Request {tag}. {SENTENCES[zlib.crc32(tag.encode()) % len(SENTENCES)]}"
+        fields = {"text": text, "language": "en", "user_id": "bench", "format": "wav"}
+        return request("POST", server.base + "/synthesize", fields)
+
+    for i in range(4):  # first requests pay for latents and lazy imports
+        one(f"warmup-{i}")
+    results = []
+    for level in concurrency:
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(level) as pool:
+            done = list(pool.map(one, (f"c{level}-{i}" for i in range(requests))))
+        wall = time.perf_counter() - t0
+        ok = [r for r in done if r[0] == 200]
+        audio = sum(wav_seconds(r[1]) for r in ok)
+        results.append({
+            "concurrency": level,
+            "requests": requests,
+            "errors": requests - len(ok),
+            **latency_summary([r[2] for r in ok]),
+            "req_per_s": round(len(ok) / wall, 2),
+            "audio_s_per_s": round(audio / wall, 2),
+        })
+        print_row("synthesize", results[-1])
+    return results
+
+
+def bench_chat(server, channels, messages):
+    results = []
+    for n in channels:
+        prefix = f"bench-{n}-{time.monotonic_ns()}"
+
+        def send(i):
+            fields = {"text": f"message {i} " + "x" * 40, "sender_id": f"u{i % 7}", "channel_id": f"{prefix}-{i % n}"}
+            return request("POST", server.base + "/send_message", fields)
+
+        def get(i):
+            return request("GET", f"{server.base}/get_messages?channel_id={prefix}-{i % n}")
+
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(8) as pool:
+            sent = list(pool.map(send, range(messages)))
+        send_wall = time.perf_counter() - t0
+        reads = max(n, messages // 4)
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(8) as pool:
+            got = list(pool.map(get, range(reads)))
+        get_wall = time.perf_counter() - t0
+        send_lat = latency_summary([r[2] for r in sent])
+        get_lat = latency_summary([r[2] for r in got])
+        results.append({
+            "channels": n,
+            "messages": messages,
+            "errors": sum(r[0] != 200 for r in sent + got),
+            "send_per_s": round(messages / send_wall, 1),
+            "send_p50_ms": send_lat["p50_ms"],
+            "send_p99_ms": send_lat["p99_ms"],
+            "get_per_s": round(reads / get_wall, 1),
+            "get_p50_ms": get_lat["p50_ms"],
+            "get_p99_ms": get_lat["p99_ms"],
+        })
+        print_row("chat", results[-1])
+    return results
+
+
+def median_time(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return float(np.median(times))
+
+
+def bench_preprocess(lengths_s, repeats):
+    import soundfile as sf
+
+    import server
+    from test_trim_silence import speech_like
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for length in lengths_s:
+            # padded with silence so the trimmed clip still meets the 30 s minimum
+            x, _, _ = speech_like(44100, 0.5, length, 0.5, noise_db=-55)
+            src, dst = os.path.join(tmp, f"in_{length}.wav"), os.path.join(tmp, "out.wav")
+            sf.write(src, np.stack([x, 0.8 * x], axis=1), 44100)
+            seconds = median_time(lambda: server.preprocess_and_save_sample(src, dst), repeats)
+            results.append({
+                "length_s": length,
+                "streaming": length >= server.STREAMING_PREPROCESS_MIN_S,
+                "seconds": round(seconds, 4),
+                "x_realtime": round(length / seconds, 1),
+            })
+            print_row("preprocess", results[-1])
+    return results
+
+
+def bench_trim_silence(lengths_s, repeats, sr=24000):
+    import server
+    from test_trim_silence import speech_like
+
+    results = []
+    for length in lengths_s:
+        x, _, _ = speech_like(sr, 0.25 * length, 0.5 * length, 0.25 * length, noise_db=-60)
+        seconds = median_time(lambda: server.trim_silence(x, sr), repeats)
+        results.append({"length_s": length, "seconds": round(seconds, 5), "x_realtime": round(length / seconds, 1)})
+        print_row("trim_silence", results[-1])
+    return results
+
+
+def print_row(bench, row):
+    print(f"{bench:<13} " + "  ".join(f"{k}={v}" for k, v in row.items()))
+
+
+# ==============================
+# Results and comparison
+# ==============================
+def run_meta():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True,
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "stub": {"base_ms": STUB_BASE_MS, "ms_per_char": STUB_MS_PER_CHAR},
+    }
+
+
+# Row keys that identify a row rather than measure it
+ROW_KEYS = ("concurrency", "channels", "length_s")
+LOWER_IS_BETTER = ("_ms", "seconds", "errors")
+HIGHER_IS_BETTER = ("_per_s", "x_realtime")
+
+
+def flatten(results):
+    """{"synthesize.concurrency=4.p50_ms": 12.3, ...} for every numeric metric."""
+    flat = {}
+    for bench, rows in results["results"].items():
+        for row in rows:
+            label = ",".join(f"{k}={row[k]}" for k in ROW_KEYS if k in row)
+            for key, value in row.items():
+                if key not in ROW_KEYS and isinstance(value, (int, float)) and not isinstance(value, bool):
+                    flat[f"{bench}.{label}.{key}"] = value
+    return flat
+
+
+def compare(old_path, new_path, threshold):
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    if old["meta"].get("stub") != new["meta"].get("stub"):
+        print(f"⚠️ stub cost model differs: {old['meta'].get('stub')} vs {new['meta'].get('stub')}")
+    a, b = flatten(old), flatten(new)
+    regressions = []
+    print(f"{old['meta'].get('commit')} -> {new['meta'].get('commit')} (threshold {threshold:.0%})")
+    for key in sorted(a.keys() & b.keys()):
+        before, after = a[key], b[key]
+        if key.endswith(LOWER_IS_BETTER):
+            worse = after > before * (1 + threshold) and after - before > (0 if key.endswith("errors") else 1e-3)
+        elif key.endswith(HIGHER_IS_BETTER):
+            worse = after < before * (1 - threshold)
+        else:
+            continue
+        change = (after - before) / before if before else 0.0
+        mark = "REGRESSED" if worse else ""
+        print(f"  {key:<55} {before:>10} -> {after:<10} {change:+7.1%} {mark}")
+        if worse:
+            regressions.append(key)
+    for key in sorted(a.keys() ^ b.keys()):
+        print(f"  {key:<55} only in {'old' if key in a else 'new'}")
+    if regressions:
+        print(f"❌ {len(regressions)} metric(s) regressed by more than {threshold:.0%}")
+        return 1
+    print("✅ no regressions")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    sub = parser.add_subparsers(dest="command")
+    run = sub.add_parser("run", help="run the benchmarks (default)")
+    for p in (parser, run):
+        p.add_argument("--quick", action="store_true", help="fewer levels and repeats, for a smoke run")
+        p.add_argument("--only", default=",".join(FULL), help="comma-separated benchmarks to run")
+        p.add_argument("--out", help="write results as JSON here")
+    cmp = sub.add_parser("compare", help="compare two result files")
+    cmp.add_argument("old")
+    cmp.add_argument("new")
+    cmp.add_argument("--threshold", type=float, default=0.15)
+    srv = sub.add_parser("serve", help=argparse.SUPPRESS)
+    srv.add_argument("--port", type=int, required=True)
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        sys.exit(compare(args.old, args.new, args.threshold))
+    if args.command == "serve":
+        serve(args.port)
+        return
+
+    plan = QUICK if args.quick else FULL
+    only = [name.strip() for name in args.only.split(",") if name.strip()]
+    unknown = set(only) - set(FULL)
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(sorted(unknown))}")
+    results = {"meta": {**run_meta(), "quick": args.quick}, "results": {}}
+
+    if "synthesize" in only or "chat" in only:
+        with BenchServer() as srv_:
+            if "synthesize" in only:
+                results["results"]["synthesize"] = bench_synthesize(srv_, **plan["synthesize"])
+            if "chat" in only:
+                results["results"]["chat"] = bench_chat(srv_, **plan["chat"])
+    if "preprocess" in only:
+        results["results"]["preprocess"] = bench_preprocess(**plan["preprocess"])
+    if "trim_silence" in only:
+        results["results"]["trim_silence"] = bench_trim_silence(**plan["trim_silence"])
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=1)
+        print(f"📝 wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""
+Microbenchmark: vectorized trim_silence vs the previous implementation.
+
+Uses the same synthetic speech-in-noise clips as test_trim_silence.py, at 5 s and
+60 s, and reports the median time per call and the realtime factor.
+
+Run from backend/:  python bench_trim_silence.py
+"""
+import time
+
+import numpy as np
+
+import server
+from test_trim_silence import legacy_trim_silence, speech_like, webrtcvad
+
+
+def median_time(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return float(np.median(times))
+
+
+def main():
+    print(f"webrtcvad installed: {webrtcvad is not None}")
+    for sr in (16000, 24000, 48000):
+        for duration in (5, 60):
+            x, _, _ = speech_like(sr, 0.5, duration - 1.0, 0.5, noise_db=-60)
+            repeats = 20 if duration == 5 else 5
+            old = median_time(lambda: legacy_trim_silence(x, sr), repeats)
+            new = median_time(lambda: server.trim_silence(x, sr), repeats)
+            print(
+                f"{sr:>5} Hz {duration:>3}s  legacy {old * 1000:8.2f} ms  "
+                f"vectorized {new * 1000:7.2f} ms  speedup {old / new:6.1f}x  "
+                f"(RTF {new / duration:.5f})"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,40 +1,79 @@
 # app.py
+import time
+_MODULE_T0 = time.perf_counter()
 import os
 import io
 import uuid
 import shutil
 import glob
-import time
+import importlib
 import traceback
 import math
+import bisect
+import heapq
+import itertools
+import queue
+import hashlib
+import json
+import re
+import unicodedata
+import struct
+import tempfile
+import tarfile
+import threading
+import contextvars
+import mmap
+import zlib
+import multiprocessing
+import weakref
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from functools import lru_cache, partial
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi import FastAPI, UploadFile, File, Form, Header, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 import asyncio
 
-# XTTS
-from TTS.api import TTS
+# XTTS + torch: imported by import_model_stack() on the background loader thread,
+# so the app is up (health, chat) before this multi-second import finishes
+TTS = None
+torch = None
+torchaudio = None
 
-# Audio & torch
-import torch
-import torchaudio
+def import_model_stack():
+    global TTS, torch, torchaudio, DEVICE
+    if TTS is not None:
+        return
+    import torch
+    import torchaudio
+    from TTS.api import TTS
 
-# Patch for PyTorch 2.6+ weight loading (keeps your existing patch)
-_original_load = torch.load
-def safe_load(*args, **kwargs):
-    if "weights_only" not in kwargs:
-        kwargs["weights_only"] = False
-    return _original_load(*args, **kwargs)
-torch.load = safe_load
+    # Patch for PyTorch 2.6+ weight loading (keeps your existing patch)
+    _original_load = torch.load
+    def safe_load(*args, **kwargs):
+        if "weights_only" not in kwargs:
+            kwargs["weights_only"] = False
+        return _original_load(*args, **kwargs)
+    torch.load = safe_load
 
-# Prefer "soundfile" backend for torchaudio to avoid torchcodec dependency
-try:
-    torchaudio.set_audio_backend("soundfile")
-    print("✅ Using torchaudio backend: soundfile")
-except Exception as e:
-    print(f"⚠️ Unable to set torchaudio backend: {e}")
+    # Prefer "soundfile" backend for torchaudio to avoid torchcodec dependency
+    try:
+        torchaudio.set_audio_backend("soundfile")
+        print("✅ Using torchaudio backend: soundfile")
+    except Exception as e:
+        print(f"⚠️ Unable to set torchaudio backend: {e}")
+
+    DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+
+    # Thread pools are sized before torch runs any parallel work (interop cannot change later)
+    if TORCH_THREADS > 0:
+        torch.set_num_threads(TORCH_THREADS)
+    if TORCH_INTEROP_THREADS > 0:
+        torch.set_interop_threads(TORCH_INTEROP_THREADS)
 
 # Optional libs - try to import, fallback if not installed
 try:
@@ -47,33 +86,23 @@ try:
 except Exception:
     raise RuntimeError("numpy must be installed: pip install numpy")
 
-# Optional but recommended for better preprocessing
-try:
-    import webrtcvad
-except Exception:
-    webrtcvad = None
-try:
-    import pyloudnorm as pyln
-except Exception:
-    pyln = None
-try:
-    import resampy
-except Exception:
-    resampy = None
-try:
-    import librosa
-except Exception:
-    librosa = None
-
-try:
-    import noisereduce as nr
-except Exception:
-    nr = None
+# Optional but recommended for better preprocessing (webrtcvad, pyloudnorm,
+# noisereduce, scipy.signal, safetensors): imported on first use, since scipy and
+# friends cost most of a second at startup and the spawned DSP workers pay it too
+_optional_modules = {}
 
-try:
-    from scipy import signal
-except Exception:
-    signal = None
+def optional_import(name):
+    """The module, or None if it is not installed. Imported once, on first use."""
+    try:
+        return _optional_modules[name]
+    except KeyError:
+        pass
+    try:
+        mod = importlib.import_module(name)
+    except Exception:
+        mod = None
+    _optional_modules[name] = mod
+    return mod
 
 # ==============================
 # FastAPI Setup
@@ -88,18 +117,867 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# ==============================
+# Speaker latent cache (LRU with byte budget)
+# ==============================
+class SpeakerCache:
+    """
+    LRU cache of speaker latents keyed by sample path.
+    Size is accounted in bytes of the tensors actually resident on the device, entries can
+    expire after a TTL, and pinned keys are never evicted or expired.
+    """
+    def __init__(self, max_bytes: int, ttl_s: float = 0.0):
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self._entries = OrderedDict()  # key -> (value, nbytes, inserted_at)
+        self._pinned = set()
+        self._lock = threading.Lock()
+        self.resident_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def value_nbytes(value):
+        return sum(t.numel() * t.element_size() for t in value if hasattr(t, "element_size"))
+
+    def _drop(self, key):
+        _, nbytes, _ = self._entries.pop(key)
+        self.resident_bytes -= nbytes
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, _, inserted_at = entry
+            if self.ttl_s > 0 and key not in self._pinned and time.monotonic() - inserted_at > self.ttl_s:
+                self._drop(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        nbytes = self.value_nbytes(value)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (value, nbytes, time.monotonic())
+            self.resident_bytes += nbytes
+            # Evict least recently used unpinned entries until we fit (the new entry always stays)
+            for old_key in list(self._entries):
+                if self.resident_bytes <= self.max_bytes:
+                    break
+                if old_key == key or old_key in self._pinned:
+                    continue
+                self._drop(old_key)
+                self.evictions += 1
+                print(f"🧹 Evicted {old_key} from speaker cache ({self.resident_bytes / 1e6:.1f} MB resident)")
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            self._drop(key)
+            return entry[0]
+
+    def pin(self, key):
+        with self._lock:
+            self._pinned.add(key)
+
+    def unpin(self, key):
+        with self._lock:
+            self._pinned.discard(key)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "pinned": sorted(self._pinned),
+                "resident_bytes": self.resident_bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_s": self.ttl_s,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+# ==============================
+# Synthesized audio cache (content-addressed)
+# ==============================
+class AudioCache:
+    """
+    Encoded audio bytes keyed by a hash of (text, language, speaker sample hash, sampling params,
+    output format). Files keep the .wav suffix whatever the negotiated format.
+    A bounded in-memory LRU tier sits in front of an optional on-disk tier laid out as
+    {disk_dir}/{speaker_hash[:16]}/{key}.wav so a re-cloned speaker can be dropped as a directory.
+    """
+    def __init__(self, max_bytes: int, disk_dir=None, disk_max_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._mem = OrderedDict()   # key -> (wav bytes, speaker_hash)
+        self._disk = OrderedDict()  # key -> (file path, size), least recently used first
+        self._lock = threading.Lock()
+        self.mem_bytes = 0
+        self.disk_bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._scan_disk()
+
+    def _scan_disk(self):
+        files = glob.glob(os.path.join(self.disk_dir, "*", "*.wav"))
+        for path in sorted(files, key=os.path.getmtime):
+            size = os.path.getsize(path)
+            self._disk[os.path.splitext(os.path.basename(path))[0]] = (path, size)
+            self.disk_bytes += size
+
+    def _disk_path(self, key, speaker_hash):
+        return os.path.join(self.disk_dir, speaker_hash[:16], f"{key}.wav")
+
+    def _put_mem(self, key, data, speaker_hash):
+        if len(data) > self.max_bytes:
+            return
+        old = self._mem.pop(key, None)
+        if old is not None:
+            self.mem_bytes -= len(old[0])
+        self._mem[key] = (data, speaker_hash)
+        self.mem_bytes += len(data)
+        while self.mem_bytes > self.max_bytes:
+            _, (old_data, _) = self._mem.popitem(last=False)
+            self.mem_bytes -= len(old_data)
+            self.evictions += 1
+
+    def get(self, key):
+        with self._lock:
+            entry = self._mem.get(key)
+            if entry is not None:
+                self._mem.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            disk_entry = self._disk.get(key)
+            if disk_entry is None:
+                self.misses += 1
+                return None
+        path = disk_entry[0]
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            with self._lock:
+                if self._disk.pop(key, None) is not None:
+                    self.disk_bytes -= disk_entry[1]
+                self.misses += 1
+            return None
+        speaker_hash = os.path.basename(os.path.dirname(path))
+        with self._lock:
+            if key in self._disk:
+                self._disk.move_to_end(key)
+            self._put_mem(key, data, speaker_hash)
+            self.disk_hits += 1
+        return data
+
+    def put(self, key, speaker_hash, data: bytes):
+        with self._lock:
+            self._put_mem(key, data, speaker_hash)
+        if not self.disk_dir or len(data) > self.disk_max_bytes:
+            return
+        path = self._disk_path(key, speaker_hash)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️ Audio cache disk write failed: {e}")
+            return
+        with self._lock:
+            old = self._disk.pop(key, None)
+            if old is not None:
+                self.disk_bytes -= old[1]
+            self._disk[key] = (path, len(data))
+            self.disk_bytes += len(data)
+            while self.disk_bytes > self.disk_max_bytes and self._disk:
+                _, (old_path, old_size) = self._disk.popitem(last=False)
+                self.disk_bytes -= old_size
+                self.evictions += 1
+                try:
+                    os.remove(old_path)
+                except OSError:
+                    pass
+
+    def invalidate_speaker(self, speaker_hash):
+        """Drops every entry synthesized from the given speaker sample (called when /clone rewrites it)."""
+        prefix = speaker_hash[:16]
+        with self._lock:
+            for key in [k for k, (_, h) in self._mem.items() if h[:16] == prefix]:
+                self.mem_bytes -= len(self._mem.pop(key)[0])
+            if self.disk_dir:
+                spk_dir = os.path.join(self.disk_dir, prefix)
+                for key in [k for k, (p, _) in self._disk.items() if os.path.dirname(p) == spk_dir]:
+                    self.disk_bytes -= self._disk.pop(key)[1]
+        if self.disk_dir:
+            shutil.rmtree(os.path.join(self.disk_dir, prefix), ignore_errors=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "mem_entries": len(self._mem),
+                "mem_bytes": self.mem_bytes,
+                "max_bytes": self.max_bytes,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self.disk_bytes,
+                "disk_max_bytes": self.disk_max_bytes if self.disk_dir else 0,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+# ==============================
+# Admission control + prioritized model access
+# ==============================
+# Every synthesis request is admitted against a per-class cap on requests in flight
+# (queued or running); over it the request is turned away at once with 429 and a
+# Retry-After instead of joining an unbounded queue. Admitted work carries its
+# priority class and a deadline: the scheduler and the model lock serve lower
+# classes first, and work whose deadline passed (or whose client hung up) is
+# dropped before it reaches the model.
+PRIORITIES = {"interactive": 0, "batch": 1, "background": 2}
+PRIORITY_NAMES = {v: k for k, v in PRIORITIES.items()}
+ADMISSION_LIMITS = {
+    "interactive": int(os.environ.get("ADMISSION_MAX_QUEUE", 32)),
+    "batch": int(os.environ.get("ADMISSION_MAX_QUEUE_BATCH", 4)),
+    "background": int(os.environ.get("ADMISSION_MAX_QUEUE_BACKGROUND", 8)),
+}
+# ms; 0 = no deadline
+ADMISSION_DEADLINES_MS = {
+    "interactive": float(os.environ.get("ADMISSION_DEADLINE_MS", 30000)),
+    "batch": float(os.environ.get("ADMISSION_DEADLINE_MS_BATCH", 0)),
+    "background": float(os.environ.get("ADMISSION_DEADLINE_MS_BACKGROUND", 0)),
+}
+
+class DeadlineExceeded(HTTPException):
+    def __init__(self):
+        super().__init__(status_code=503, detail="Deadline exceeded before synthesis could run", headers={"Retry-After": "1"})
+
+class ClientDisconnected(HTTPException):
+    def __init__(self):
+        super().__init__(status_code=499, detail="Client closed the request")
+
+def deadline_expired(deadline):
+    return deadline is not None and time.monotonic() > deadline
+
+class PriorityLock:
+    """
+    asyncio lock whose waiters are served by priority class (lower first), FIFO
+    within a class. release() hands the lock straight to the next waiter, and a
+    waiter can give up at its deadline (DeadlineExceeded).
+    """
+    def __init__(self):
+        self._locked = False
+        self._waiters = []  # heap of (priority, seq, future)
+        self._seq = itertools.count()
+        self.acquired = {p: 0 for p in PRIORITY_NAMES}
+
+    def locked(self):
+        return self._locked
+
+    async def acquire(self, priority=0, deadline=None):
+        if not self._locked:
+            self._locked = True
+            self.acquired[priority] += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            await asyncio.wait_for(future, timeout)
+        except BaseException as e:
+            if future.done() and not future.cancelled():
+                # the lock was handed over just as we gave up: pass it on
+                self.release()
+            if isinstance(e, asyncio.TimeoutError):
+                raise DeadlineExceeded() from None
+            raise
+        self.acquired[priority] += 1
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(True)
+                return
+        self._locked = False
+
+    @asynccontextmanager
+    async def hold(self, priority=0, deadline=None):
+        await self.acquire(priority, deadline)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self):
+        waiting = {name: 0 for name in PRIORITIES}
+        for priority, _, future in self._waiters:
+            if not future.done():
+                waiting[PRIORITY_NAMES[priority]] += 1
+        return {
+            "locked": self._locked,
+            "waiting": waiting,
+            "acquired": {PRIORITY_NAMES[p]: n for p, n in self.acquired.items()},
+        }
+
+class AdmissionTicket:
+    __slots__ = ("controller", "name", "priority", "deadline", "t0", "released")
+
+    def __init__(self, controller, name, deadline):
+        self.controller = controller
+        self.name = name
+        self.priority = PRIORITIES[name]
+        self.deadline = deadline
+        self.t0 = time.monotonic()
+        self.released = False
+
+    def finish(self, error=None):
+        """Leaves the queue; the outcome is taken from the exception that ended the request, if any."""
+        if self.released:
+            return
+        self.released = True
+        if error is None:
+            outcome = "completed"
+        elif isinstance(error, DeadlineExceeded):
+            outcome = "expired"
+        elif isinstance(error, (ClientDisconnected, asyncio.CancelledError, GeneratorExit)):
+            outcome = "disconnected"
+        else:
+            outcome = "failed"
+        self.controller._release(self, outcome)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.finish(exc)
+
+class AdmissionController:
+    def __init__(self, limits: dict, deadlines_ms: dict):
+        self.limits = limits
+        self.deadlines_ms = deadlines_ms
+        self.in_flight = {name: 0 for name in PRIORITIES}
+        self.counts = {
+            name: {"admitted": 0, "rejected": 0, "completed": 0, "expired": 0, "disconnected": 0, "failed": 0}
+            for name in PRIORITIES
+        }
+        self._waits = {name: deque(maxlen=1024) for name in PRIORITIES}
+        self._service_s = {name: 1.0 for name in PRIORITIES}  # EWMA of completed request time
+
+    def admit(self, priority="interactive", deadline_ms=None):
+        """A ticket for one request (use as a context manager), or 400/429 right away."""
+        if priority not in PRIORITIES:
+            raise HTTPException(status_code=400, detail=f"priority must be one of {list(PRIORITIES)}")
+        if self.in_flight[priority] >= self.limits[priority]:
+            self.counts[priority]["rejected"] += 1
+            raise HTTPException(
+                status_code=429,
+                detail=f"Synthesis queue is full ({self.in_flight[priority]} {priority} requests in flight)",
+                headers={"Retry-After": str(self.retry_after(priority))},
+            )
+        if deadline_ms is None:
+            deadline_ms = self.deadlines_ms[priority]
+        deadline = time.monotonic() + deadline_ms / 1000.0 if deadline_ms and deadline_ms > 0 else None
+        self.in_flight[priority] += 1
+        self.counts[priority]["admitted"] += 1
+        return AdmissionTicket(self, priority, deadline)
+
+    def _release(self, ticket, outcome):
+        self.in_flight[ticket.name] -= 1
+        self.counts[ticket.name][outcome] += 1
+        if outcome == "completed":
+            self._service_s[ticket.name] += 0.2 * ((time.monotonic() - ticket.t0) - self._service_s[ticket.name])
+
+    def retry_after(self, priority):
+        """Seconds until the queue ahead has likely drained, from recent service times."""
+        return max(1, math.ceil(self.in_flight[priority] * self._service_s[priority] / max(1, self.limits[priority]) * 2))
+
+    def record_wait(self, priority: int, seconds: float):
+        """Time a piece of admitted work spent queued before the model picked it up."""
+        self._waits[PRIORITY_NAMES[priority]].append(seconds)
+
+    def stats(self):
+        classes = {}
+        for name in PRIORITIES:
+            waits = sorted(self._waits[name])
+            pct = lambda q: round(waits[min(len(waits) - 1, int(q * len(waits)))] * 1000, 1) if waits else None
+            classes[name] = {
+                "in_flight": self.in_flight[name],
+                "limit": self.limits[name],
+                "deadline_ms": self.deadlines_ms[name] or None,
+                **self.counts[name],
+                "wait_ms_p50": pct(0.5),
+                "wait_ms_p95": pct(0.95),
+                "wait_ms_max": round(waits[-1] * 1000, 1) if waits else None,
+                "service_ms_ewma": round(self._service_s[name] * 1000, 1),
+            }
+        return classes
+
+admission = AdmissionController(ADMISSION_LIMITS, ADMISSION_DEADLINES_MS)
+
+async def run_until_disconnected(request: Request, aw):
+    """
+    Awaits aw, cancelling it (ClientDisconnected) if the client hangs up first, so
+    queued segments of an abandoned request never reach the model.
+    """
+    async def disconnected():
+        # the body has been read, so the next message is the disconnect
+        while (await request.receive())["type"] != "http.disconnect":
+            pass
+
+    work = asyncio.ensure_future(aw)
+    watch = asyncio.ensure_future(disconnected())
+    try:
+        await asyncio.wait({work, watch}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watch.cancel()
+    if not work.done():
+        work.cancel()
+        print("🔌 Client disconnected, dropped its queued synthesis")
+        raise ClientDisconnected()
+    return work.result()
+
+class GuardedStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that closes its body iterator and then calls on_close however
+    the response ends. A BackgroundTask is not enough when the request holds the
+    model or an admission slot: Starlette skips it when sending fails, e.g. when the
+    client left before the first byte and the body iterator never started.
+    """
+    def __init__(self, content, on_close, **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            try:
+                # runs the generator's own cleanup now rather than whenever it is collected
+                await self.body_iterator.aclose()
+            finally:
+                self.on_close()
+
+# ==============================
+# Single-flight deduplication
+# ==============================
+# Identical work that is already running is joined instead of repeated: latent
+# encoding by speaker path (sync, called from model threads) and synthesis by
+# request fingerprint (the audio cache key). The first caller does the work, the
+# others wait for its result, and an exception reaches every one of them.
+class _Flight:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+class SingleFlight:
+    """Thread-safe single-flight for blocking calls."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.leaders = 0
+        self.shared = 0
+        self.errors = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.leaders += 1
+            else:
+                flight.waiters += 1
+                self.shared += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = fn()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            self.errors += 1
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def stats(self):
+        with self._lock:
+            in_flight = len(self._flights)
+        return {"in_flight": in_flight, "leaders": self.leaders, "shared": self.shared, "errors": self.errors}
+
+class AsyncSingleFlight:
+    """
+    Single-flight for coroutines. The work runs as its own task, so one caller
+    going away does not cancel it for the others; it is cancelled only once every
+    caller has gone.
+    """
+    def __init__(self):
+        self._flights = {}  # key -> [task, callers]
+        self.leaders = 0
+        self.shared = 0
+        self.errors = 0
+        self.abandoned = 0
+
+    async def do(self, key, coro_fn):
+        """Returns (result, shared): shared is True when another caller's work was joined."""
+        entry = self._flights.get(key)
+        shared = entry is not None
+        if shared:
+            entry[1] += 1
+            self.shared += 1
+        else:
+            task = asyncio.ensure_future(coro_fn())
+            entry = self._flights[key] = [task, 1]
+            self.leaders += 1
+            task.add_done_callback(lambda t: self._finished(key, t))
+        try:
+            return await asyncio.shield(entry[0]), shared
+        except asyncio.CancelledError:
+            entry[1] -= 1
+            if entry[1] == 0 and not entry[0].done():
+                self.abandoned += 1
+                entry[0].cancel()
+            raise
+
+    def _finished(self, key, task):
+        if self._flights.get(key, [None])[0] is task:
+            del self._flights[key]
+        if not task.cancelled() and task.exception() is not None:
+            self.errors += 1
+
+    def stats(self):
+        return {
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "shared": self.shared,
+            "errors": self.errors,
+            "abandoned": self.abandoned,
+        }
+
+latent_flight = SingleFlight()
+synthesis_flight = AsyncSingleFlight()
+
+# ==============================
+# Metrics: per-request stage spans + Prometheus /metrics
+# ==============================
+# A Trace follows one request (or one sample preprocessing) through its stages.
+# span(stage) records into the trace of the current context: it is carried into
+# asyncio tasks and to_thread calls by contextvars, into run_model calls by
+# copy_context, and into the model thread by the InferenceJob that captured it.
+# When the request finishes its spans feed the tts_stage_seconds histogram; the
+# request also gets them back as a Server-Timing header. METRICS_ENABLED=0 turns
+# spans into no-ops (the counters behind /metrics stay on).
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") != "0"
+# seconds; stages span ~0.1 ms (trim, normalize) to tens of seconds (CPU inference)
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+RTF_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5, 2, 3, 5, 10)
+
+_current_trace = contextvars.ContextVar("trace", default=None)
+
+class Trace:
+    __slots__ = ("pipeline", "t0", "spans", "outcome", "deferred", "finished")
+
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        self.t0 = time.perf_counter()
+        self.spans = []  # (stage, seconds), in completion order
+        self.outcome = "ok"
+        self.deferred = False  # set by streaming responses, which finish the trace themselves
+        self.finished = False
+
+    def add(self, stage, seconds):
+        self.spans.append((stage, seconds))
+
+    def totals(self):
+        """Seconds per stage, summed over repeats (one per segment for the model stages)."""
+        out = {}
+        for stage, seconds in list(self.spans):
+            out[stage] = out.get(stage, 0.0) + seconds
+        return out
+
+    def server_timing(self):
+        return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.totals().items())
+
+    def to_dict(self):
+        return {
+            "pipeline": self.pipeline,
+            "outcome": self.outcome,
+            "total_ms": round((time.perf_counter() - self.t0) * 1000, 1),
+            "stages_ms": {stage: round(seconds * 1000, 2) for stage, seconds in self.totals().items()},
+        }
+
+    def finish(self):
+        """Feeds the spans, the total time and the outcome to the metrics (once)."""
+        if self.finished:
+            return
+        self.finished = True
+        for stage, seconds in list(self.spans) if METRICS_ENABLED else ():
+            stage_seconds.observe(seconds, self.pipeline, stage)
+        request_seconds.observe(time.perf_counter() - self.t0, self.pipeline)
+        requests_total.inc(1, self.pipeline, self.outcome)
+
+@contextmanager
+def traced(pipeline):
+    """
+    A Trace current for the block (and the tasks/threads it starts). On exit it is
+    finished (unless trace.deferred was set); an HTTPException sets the outcome to
+    its status code. Set trace.outcome inside the block to label success (hit,
+    miss, shared, ...).
+    """
+    trace = Trace(pipeline)
+    token = _current_trace.set(trace if METRICS_ENABLED else None)
+    try:
+        yield trace
+    except HTTPException as e:
+        trace.outcome = str(e.status_code)
+        raise
+    except BaseException:
+        trace.outcome = "error"
+        raise
+    finally:
+        _current_trace.reset(token)
+        if not trace.deferred:
+            trace.finish()
+
+@contextmanager
+def span(stage):
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(stage, time.perf_counter() - t0)
+
+def record_render(endpoint, seconds, audio_s):
+    """Real-time factor of audio the model rendered (cache hits and shared renders excluded)."""
+    if audio_s > 0:
+        real_time_factor.observe(seconds / audio_s, endpoint)
+        audio_seconds_total.inc(audio_s, endpoint)
+
+class _Metric:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+
+    def _labels(self, values, extra=()):
+        pairs = list(zip(self.labelnames, values)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{_escape_label(v)}"' for k, v in pairs) + "}"
+
+class Counter(_Metric):
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{self._labels(labels)} {_fmt_value(value)}")
+        return lines
+
+class Histogram(_Metric):
+    def __init__(self, name, help, labelnames=(), buckets=STAGE_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[i] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, n in zip(self.buckets + (float("inf"),), series):
+                    cumulative += n
+                    le = "+Inf" if bound == float("inf") else _fmt_value(bound)
+                    lines.append(f"{self.name}_bucket{self._labels(labels, [('le', le)])} {cumulative}")
+                lines.append(f"{self.name}_sum{self._labels(labels)} {_fmt_value(series[-1])}")
+                lines.append(f"{self.name}_count{self._labels(labels)} {cumulative}")
+        return lines
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _fmt_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class MetricsRegistry:
+    """Counters and histograms updated in place, plus collectors that turn the components' stats() into samples at scrape time."""
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, help, labelnames=()):
+        self._metrics.append(Counter(name, help, labelnames))
+        return self._metrics[-1]
+
+    def histogram(self, name, help, labelnames=(), buckets=STAGE_BUCKETS):
+        self._metrics.append(Histogram(name, help, labelnames, buckets))
+        return self._metrics[-1]
+
+    def collector(self, fn):
+        """fn() -> iterable of (name, type, help, [(labels dict, value), ...])."""
+        self._collectors.append(fn)
+        return fn
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        for fn in self._collectors:
+            try:
+                families = list(fn())
+            except Exception as e:
+                print(f"⚠️ Metrics collector {fn.__name__} failed: {e}")
+                continue
+            for name, kind, help, samples in families:
+                lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+                for labels, value in samples:
+                    label_str = ",".join(f'{k}="{_escape_label(v)}"' for k, v in labels.items())
+                    lines.append(f"{name}{{{label_str}}} {_fmt_value(value)}" if label_str else f"{name} {_fmt_value(value)}")
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+stage_seconds = metrics.histogram(
+    "tts_stage_seconds", "Time spent per pipeline stage.", ("pipeline", "stage"))
+request_seconds = metrics.histogram(
+    "tts_request_seconds", "End-to-end request time.", ("endpoint",))
+requests_total = metrics.counter(
+    "tts_requests_total", "Requests by endpoint and outcome (hit, miss, shared, error, HTTP status).", ("endpoint", "outcome"))
+real_time_factor = metrics.histogram(
+    "tts_real_time_factor", "Synthesis time / audio duration for rendered (uncached) audio.", ("endpoint",), RTF_BUCKETS)
+first_audio_seconds = metrics.histogram(
+    "tts_time_to_first_audio_seconds", "Streaming: request start to the first audio bytes.", ("endpoint",))
+audio_seconds_total = metrics.counter(
+    "tts_audio_seconds_total", "Seconds of audio rendered by the model.", ("endpoint",))
+
+def log_error(context):
+    """Appends the active exception's traceback to error.log with a timestamp (one block per failure)."""
+    with open("error.log", "a") as f:
+        f.write(f"--- {time.strftime('%Y-%m-%d %H:%M:%S')} {context}\n")
+        traceback.print_exc(file=f)
+
 # ==============================
 # Global State
 # ==============================
 tts = None
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
-speaker_cache = {}  # path -> (gpt_latent, speaker_latent) kept on DEVICE (fp16 on cuda)
-inference_lock = asyncio.Lock()  # Prevent race conditions during inference
+DEVICE = "cpu"  # set by import_model_stack() once torch is in
+# path -> (gpt_latent, speaker_latent) kept on DEVICE (fp16 on cuda)
+speaker_cache = SpeakerCache(
+    max_bytes=int(float(os.environ.get("SPEAKER_CACHE_MB", 256)) * 1024 * 1024),
+    ttl_s=float(os.environ.get("SPEAKER_CACHE_TTL_S", 0)),
+)
+# Synthesized WAV bytes; AUDIO_CACHE_DIR enables the on-disk tier
+audio_cache = AudioCache(
+    max_bytes=int(float(os.environ.get("AUDIO_CACHE_MB", 64)) * 1024 * 1024),
+    disk_dir=os.environ.get("AUDIO_CACHE_DIR") or None,
+    disk_max_bytes=int(float(os.environ.get("AUDIO_CACHE_DISK_MB", 1024)) * 1024 * 1024),
+)
+for _pinned_speaker in filter(None, os.environ.get("SPEAKER_CACHE_PINNED", "").split(",")):
+    speaker_cache.pin(_pinned_speaker.strip())
+inference_lock = PriorityLock()  # Exclusive model access (held per batch by the scheduler, per stream by /synthesize_stream)
+
+# ==============================
+# Executors: keep model and DSP work off the event loop
+# ==============================
+# Model work (XTTS inference, latent encoding) runs on a dedicated thread pool so
+# torch releases the GIL and the loop keeps serving chat/health requests.
+# DSP preprocessing (noisereduce, resampling, filters) is pure-Python-heavy and
+# holds the GIL, so it goes to a process pool. DSP_PROCESSES=0 runs it on a thread.
+INFERENCE_THREADS = int(os.environ.get("INFERENCE_THREADS", 1))
+DSP_PROCESSES = int(os.environ.get("DSP_PROCESSES", min(2, os.cpu_count() or 1)))
+
+model_executor = ThreadPoolExecutor(max_workers=INFERENCE_THREADS, thread_name_prefix="xtts")
+_dsp_executor = None
+
+def get_dsp_executor():
+    global _dsp_executor
+    if _dsp_executor is None:
+        if DSP_PROCESSES > 0:
+            # spawn, not fork: forking a process that already runs torch/OpenMP threads can deadlock
+            _dsp_executor = ProcessPoolExecutor(max_workers=DSP_PROCESSES, mp_context=multiprocessing.get_context("spawn"))
+        else:
+            _dsp_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="dsp")
+    return _dsp_executor
+
+async def run_model(fn, *args, **kwargs):
+    # run in a copy of the caller's context so span() inside fn records to the caller's trace
+    ctx = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(model_executor, partial(ctx.run, fn, *args, **kwargs))
+
+async def run_dsp(fn, *args, **kwargs):
+    global _dsp_executor
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(get_dsp_executor(), partial(fn, *args, **kwargs))
+    except BrokenProcessPool:
+        print("⚠️ DSP process pool died, restarting it")
+        _dsp_executor = None
+        return await loop.run_in_executor(get_dsp_executor(), partial(fn, *args, **kwargs))
 
 # ==============================
 # Utility: Loudness normalization (numpy)
 # ==============================
 def normalize_loudness_numpy(x: np.ndarray, sr: int, target_lufs=-16.0):
+    pyln = optional_import("pyloudnorm")
     if pyln is None:
         # fallback: RMS normalization to approximate target LUFS
         rms = np.sqrt(np.mean(x**2) + 1e-12)
@@ -113,51 +991,80 @@ def normalize_loudness_numpy(x: np.ndarray, sr: int, target_lufs=-16.0):
     return norm_audio
 
 # ==============================
-# Utility: Trim silence (webrtcvad if available)
+# Utility: Trim silence (vectorized VAD)
 # ==============================
-def trim_silence(x: np.ndarray, sr: int, aggressiveness=2):
-    if webrtcvad is not None:
-        # webrtcvad requires 16-bit PCM bytes and frame sizes of 10/20/30 ms
-        vad = webrtcvad.Vad(aggressiveness)
-        frame_ms = 30
-        frame_len = int(sr * frame_ms / 1000)
-        if x.ndim > 1:
-            x_mono = x.mean(axis=1)
-        else:
-            x_mono = x
-        # convert to 16-bit PCM bytes
-        pcm16 = (np.clip(x_mono, -1.0, 1.0) * 32767).astype(np.int16).tobytes()
-        num_frames = len(pcm16) // (frame_len * 2)
-        voiced = []
-        for i in range(num_frames):
-            start = i * frame_len * 2
-            chunk = pcm16[start:start + frame_len * 2]
-            try:
-                is_speech = vad.is_speech(chunk, sample_rate=sr)
-            except Exception:
-                is_speech = False
-            voiced.append(is_speech)
-        if any(voiced):
-            first = next(i for i, v in enumerate(voiced) if v)
-            last = len(voiced) - 1 - next(i for i, v in enumerate(reversed(voiced)) if v)
-            start_sample = max(0, first * frame_len)
-            end_sample = min(len(x_mono), (last + 1) * frame_len)
-            return x[start_sample:end_sample]
-        else:
-            return x_mono
+WEBRTCVAD_RATES = (8000, 16000, 32000, 48000)
+
+def frame_features(x_mono: np.ndarray, frame_len: int):
+    """Per-frame energy (dB) and zero-crossing rate over whole frames of x_mono."""
+    n = len(x_mono) // frame_len
+    if n == 0:
+        return np.zeros(0), np.zeros(0)
+    frames = x_mono[:n * frame_len].reshape(n, frame_len)
+    energy_db = 10 * np.log10(np.einsum("ij,ij->i", frames, frames) / frame_len + 1e-12)
+    signs = np.signbit(frames)
+    zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / frame_len
+    return energy_db, zcr
+
+def vad_decision(energy_db: np.ndarray, zcr: np.ndarray, aggressiveness=2):
+    if len(energy_db) == 0:
+        return np.zeros(0, dtype=bool)
+    margin = (6.0, 9.0, 12.0, 15.0)[min(max(int(aggressiveness), 0), 3)]
+    floor_db = np.percentile(energy_db, 10)
+    thresh = max(min(floor_db + margin, energy_db.max() - 20.0), -70.0)
+    voiced = energy_db > thresh
+    voiced |= (zcr >= 0.3) & (energy_db > max(thresh - 10.0, floor_db + margin / 2))
+    return voiced
+
+def voiced_frames(x_mono: np.ndarray, sr: int, frame_ms=30, aggressiveness=2):
+    """
+    Frame-level voice activity from energy + zero-crossing rate, fully vectorized.
+    Frames are a reshaped view of the signal (no copies, no per-frame Python), so
+    this works at any sample rate. The threshold adapts to the clip: a margin above
+    the noise floor (10th percentile frame energy), never closer than 20 dB to the
+    loudest frame and never below -70 dBFS. High-ZCR frames slightly under the
+    threshold (fricatives like "s"/"sh") still count as speech.
+    Returns (frame_len, bool array per frame).
+    """
+    frame_len = max(1, int(sr * frame_ms / 1000))
+    energy_db, zcr = frame_features(x_mono, frame_len)
+    return frame_len, vad_decision(energy_db, zcr, aggressiveness)
+
+def _refine_with_webrtcvad(x_mono, sr, frame_len, first, last, n, aggressiveness, window=1):
+    """Lets webrtcvad extend the energy boundaries by up to `window` frames (only a few calls)."""
+    vad = optional_import("webrtcvad").Vad(aggressiveness)
+    pcm16 = (np.clip(x_mono, -1.0, 1.0) * 32767).astype(np.int16)
+
+    def is_speech(i):
+        try:
+            return vad.is_speech(pcm16[i * frame_len:(i + 1) * frame_len].tobytes(), sample_rate=sr)
+        except Exception:
+            return False
+
+    lo, hi = first, last
+    while lo > 0 and first - lo < window and is_speech(lo - 1):
+        lo -= 1
+    while hi < n - 1 and hi - last < window and is_speech(hi + 1):
+        hi += 1
+    return lo, hi
+
+def trim_silence(x: np.ndarray, sr: int, aggressiveness=2, pad_frames=1):
+    if x.ndim > 1:
+        x_mono = x.mean(axis=1)
     else:
-        # energy threshold fallback
-        if x.ndim > 1:
-            x_mono = x.mean(axis=1)
-        else:
-            x_mono = x
-        energy = x_mono ** 2
-        # threshold: 20th percentile scaled down a bit
-        thresh = max(1e-7, np.percentile(energy, 20) * 0.5)
-        indices = np.where(energy > thresh)[0]
-        if len(indices) == 0:
-            return x_mono
-        return x_mono[indices[0]:indices[-1] + 1]
+        x_mono = x
+    frame_len, voiced = voiced_frames(x_mono, sr, aggressiveness=aggressiveness)
+    if not voiced.any():
+        return x_mono
+    n = len(voiced)
+    first = int(np.argmax(voiced))
+    last = n - 1 - int(np.argmax(voiced[::-1]))
+    # webrtcvad only accepts 8/16/32/48 kHz; when usable, let it adjust just the edges
+    if sr in WEBRTCVAD_RATES and optional_import("webrtcvad") is not None:
+        first, last = _refine_with_webrtcvad(x_mono, sr, frame_len, first, last, n, aggressiveness)
+    start_sample = max(0, (first - pad_frames) * frame_len)
+    end_sample = min(len(x_mono), (last + 1 + pad_frames) * frame_len)
+    return x[start_sample:end_sample]
 
 # ==============================
 # Utility: Noise Reduction & Enhancement
@@ -167,6 +1074,7 @@ def remove_noise(audio: np.ndarray, sr: int):
     Applies stationary noise reduction.
     Assumes the noise is constant throughout the audio or estimated from the whole clip.
     """
+    nr = optional_import("noisereduce")
     if nr is None:
         print("⚠️ noisereduce not installed, skipping noise reduction.")
         return audio
@@ -184,6 +1092,7 @@ def enhance_voice(audio: np.ndarray, sr: int):
     """
     Applies a high-pass filter to remove rumble and a slight presence boost.
     """
+    signal = optional_import("scipy.signal")
     if signal is None:
         return audio
     
@@ -201,36 +1110,136 @@ def enhance_voice(audio: np.ndarray, sr: int):
         print(f"⚠️ Voice enhancement failed: {e}")
         return audio
 
+# ==============================
+# Resampling (rational polyphase, built in)
+# ==============================
+class PolyphaseDesign:
+    """
+    Kaiser-windowed sinc lowpass for orig_sr -> target_sr (the resample_poly design,
+    with a longer kernel and beta 8.6 for ~80 dB stopband instead of ~50 dB), split
+    into `up` phases of `taps` coefficients.
+    """
+    def __init__(self, orig_sr: int, target_sr: int, half_len_factor=16, kaiser_beta=8.6):
+        g = math.gcd(int(orig_sr), int(target_sr))
+        self.up = int(target_sr) // g
+        self.down = int(orig_sr) // g
+        max_rate = max(self.up, self.down)
+        num_taps = 2 * half_len_factor * max_rate + 1
+        fc = 1.0 / max_rate
+        h = fc * np.sinc(fc * (np.arange(num_taps) - (num_taps - 1) / 2.0)) * np.kaiser(num_taps, kaiser_beta)
+        self.lowpass = h / h.sum()
+        self.taps = -(-num_taps // self.up)  # taps per phase
+        padded = np.zeros(self.taps * self.up)
+        padded[:num_taps] = self.lowpass * self.up
+        # kernels[p] = h[p + i*up] reversed, so output phase p is a dot with x[j0-taps+1 .. j0]
+        self.kernels = np.ascontiguousarray(padded.reshape(self.taps, self.up).T[:, ::-1], dtype=np.float32)
+        self.kernels.setflags(write=False)
+        self.delay = (num_taps - 1) // 2  # group delay in the upsampled domain
+
+@lru_cache(maxsize=32)
+def polyphase_design(orig_sr: int, target_sr: int):
+    """Designs are memoized per rate pair; phone uploads only ever hit a handful."""
+    return PolyphaseDesign(orig_sr, target_sr)
+
+class StreamingResampler:
+    """
+    Polyphase resampler that carries its input history across blocks, so a long
+    file (or a synthesis stream) can be resampled chunk by chunk with no seams.
+    Outputs that share a phase read the input at a fixed stride, so each phase is
+    one matrix-vector product over a sliding-window view (no gathers, no copies).
+    """
+    def __init__(self, orig_sr: int, target_sr: int):
+        self.design = polyphase_design(int(orig_sr), int(target_sr))
+        self.up, self.down = self.design.up, self.design.down
+        self._buf = np.zeros(self.design.taps - 1, dtype=np.float32)
+        self._buf_start = -(self.design.taps - 1)  # absolute input index of _buf[0]
+        self._n_in = 0
+        self._n_out = 0
+
+    def _emit(self, n_end):
+        d = self.design
+        n0 = self._n_out
+        count = n_end - n0
+        if count <= 0:
+            return np.zeros(0, dtype=np.float32)
+        out = np.empty(count, dtype=np.float32)
+        windows = np.lib.stride_tricks.sliding_window_view(self._buf, d.taps)
+        for r in range(min(self.up, count)):
+            q = (n0 + r) * self.down + d.delay
+            start = q // self.up - d.taps + 1 - self._buf_start
+            m = len(range(r, count, self.up))
+            # consecutive outputs of this phase advance the input by `down`
+            out[r::self.up] = windows[start:start + (m - 1) * self.down + 1:self.down] @ d.kernels[q % self.up]
+        self._n_out = n_end
+        # drop input history no future output needs
+        keep_from = (n_end * self.down + d.delay) // self.up - d.taps + 1
+        if keep_from > self._buf_start:
+            self._buf = self._buf[keep_from - self._buf_start:]
+            self._buf_start = keep_from
+        return out
+
+    def process(self, x: np.ndarray):
+        x = np.asarray(x, dtype=np.float32).reshape(-1)
+        if self.up == self.down:
+            return x
+        self._buf = np.concatenate([self._buf, x])
+        self._n_in += len(x)
+        # outputs whose newest input sample is already available
+        n_end = (self._n_in * self.up - 1 - self.design.delay) // self.down + 1
+        return self._emit(max(n_end, self._n_out))
+
+    def flush(self):
+        if self.up == self.down:
+            return np.zeros(0, dtype=np.float32)
+        total_out = -(-self._n_in * self.up // self.down)
+        pad = self.design.delay // self.up + self.design.taps
+        self._buf = np.concatenate([self._buf, np.zeros(pad, dtype=np.float32)])
+        return self._emit(total_out)
+
+def resample(x: np.ndarray, orig_sr: int, target_sr: int):
+    """One-shot mono resample; output length is ceil(len(x) * target_sr / orig_sr)."""
+    if int(orig_sr) == int(target_sr):
+        return np.asarray(x, dtype=np.float32)
+    r = StreamingResampler(orig_sr, target_sr)
+    return np.concatenate([r.process(x), r.flush()])
+
 # ==============================
 # Preprocess and save sample
 # ==============================
-def preprocess_and_save_sample(src_path, target_path, target_sr=24000, min_duration_s=30.0):
+# Uploads at least this long go through the block-wise pipeline below
+STREAMING_PREPROCESS_MIN_S = float(os.environ.get("STREAMING_PREPROCESS_MIN_S", 120))
+
+def preprocess_and_save_sample(src_path, target_path, target_sr=24000, min_duration_s=30.0, streaming=None):
+    if streaming is None:
+        streaming = sf.info(src_path).duration >= STREAMING_PREPROCESS_MIN_S
+    if streaming:
+        return preprocess_and_save_sample_streaming(src_path, target_path, target_sr, min_duration_s)
     # read using soundfile
-    data, sr = sf.read(src_path, dtype='float32')
+    with span("read"):
+        data, sr = sf.read(src_path, dtype='float32')
     # to mono
     if data.ndim > 1:
         data = data.mean(axis=1)
     # resample if needed
     if sr != target_sr:
-        if resampy is not None:
-            data = resampy.resample(data, sr, target_sr)
-            sr = target_sr
-        elif librosa is not None:
-            data = librosa.resample(data, orig_sr=sr, target_sr=target_sr)
-            sr = target_sr
-        else:
-            raise RuntimeError("Resampling requires resampy or librosa. Install one: pip install resampy or librosa")
+        with span("resample"):
+            data = resample(data, sr, target_sr)
+        sr = target_sr
     # trim silence
-    data = trim_silence(data, sr)
+    with span("trim_silence"):
+        data = trim_silence(data, sr)
     
     # --- NEW: Noise Reduction & Enhancement ---
     # Apply before normalization
-    data = remove_noise(data, sr)
-    data = enhance_voice(data, sr)
+    with span("denoise"):
+        data = remove_noise(data, sr)
+    with span("enhance"):
+        data = enhance_voice(data, sr)
     # ------------------------------------------
 
     # normalize loudness
-    data = normalize_loudness_numpy(data, sr, target_lufs=-16.0)
+    with span("normalize"):
+        data = normalize_loudness_numpy(data, sr, target_lufs=-16.0)
     # check length
     dur = len(data) / sr
     if dur < min_duration_s:
@@ -240,274 +1249,3652 @@ def preprocess_and_save_sample(src_path, target_path, target_sr=24000, min_durat
     if peak > 1.0:
         data = data / peak
     # write as 24k PCM16
-    sf.write(target_path, data, sr, subtype='PCM_16')
+    with span("write"):
+        sf.write(target_path, data, sr, subtype='PCM_16')
     return target_path
 
 # ==============================
-# Model loading + warmup
+# Streaming preprocessing (bounded memory for long samples)
 # ==============================
-def load_xtts_model():
-    global tts
-    if tts is None:
-        print("⏳ Loading XTTS v2 model...")
-        tts = TTS(
-            model_name="tts_models/multilingual/multi-dataset/xtts_v2",
-            progress_bar=True,
-        ).to(DEVICE)
-        
-        # Monkey-patch Hindi char limit for text splitting
-        try:
-            if "hi" not in tts.synthesizer.tts_model.tokenizer.char_limits:
-                tts.synthesizer.tts_model.tokenizer.char_limits["hi"] = 200
-                print("🔧 Added Hindi char limit to tokenizer")
-        except Exception as e:
-            print(f"⚠️ Could not patch tokenizer: {e}")
+def k_weighting_sos(sr: int):
+    """BS.1770 K-weighting (high shelf + high pass) as second-order sections, same formulas as pyloudnorm."""
+    def biquad(kind, G, Q, fc):
+        A = 10 ** (G / 40.0)
+        w0 = 2.0 * np.pi * (fc / sr)
+        alpha = np.sin(w0) / (2.0 * Q)
+        if kind == "high_shelf":
+            b = [A * ((A + 1) + (A - 1) * np.cos(w0) + 2 * np.sqrt(A) * alpha),
+                 -2 * A * ((A - 1) + (A + 1) * np.cos(w0)),
+                 A * ((A + 1) + (A - 1) * np.cos(w0) - 2 * np.sqrt(A) * alpha)]
+            a = [(A + 1) - (A - 1) * np.cos(w0) + 2 * np.sqrt(A) * alpha,
+                 2 * ((A - 1) - (A + 1) * np.cos(w0)),
+                 (A + 1) - (A - 1) * np.cos(w0) - 2 * np.sqrt(A) * alpha]
+        else:
+            b = [(1 + np.cos(w0)) / 2, -(1 + np.cos(w0)), (1 + np.cos(w0)) / 2]
+            a = [1 + alpha, -2 * np.cos(w0), 1 - alpha]
+        return np.concatenate([np.array(b) / a[0], np.array(a) / a[0]])
+    return np.vstack([biquad("high_shelf", 4.0, 1 / np.sqrt(2.0), 1500.0), biquad("high_pass", 0.0, 0.5, 38.0)])
 
-        tts.synthesizer.tts_model.eval()
-        # Warmup (short inference) to JIT caches and GPU kernels
-        try:
-            with torch.inference_mode():
-                # create tiny dummy latents if config available
-                conf = getattr(tts.synthesizer.tts_model, "config", None)
-                dummy_gpt = None
-                dummy_spk = None
-                try:
-                    if conf is not None:
-                        gpt_len = conf.gpt_cond_len if hasattr(conf, "gpt_cond_len") else 1
-                        spk_dim = conf.spk_emb_dim if hasattr(conf, "spk_emb_dim") else 1
-                        dummy_gpt = torch.zeros((1, gpt_len), device=DEVICE)
-                        dummy_spk = torch.zeros((1, spk_dim), device=DEVICE)
-                except Exception:
-                    dummy_gpt = None
-                    dummy_spk = None
-
-                sample = "Hello world."
-                print("⏳ Performing warmup inference...")
-                _ = tts.synthesizer.tts_model.inference(
-                    text=sample,
-                    language="en",
-                    gpt_cond_latent=dummy_gpt,
-                    speaker_embedding=dummy_spk,
-                    enable_text_splitting=False
-                )
-                print("🚀 Model loaded and warmed up!")
-        except Exception as e:
-            print("⚠ Warmup failed:", e)
+class StreamingLoudness:
+    """
+    Integrated loudness accumulated block by block. With pyloudnorm installed this is
+    the gated BS.1770 measure (400 ms blocks, 75% overlap, -70 LUFS absolute and -10 LU
+    relative gates); otherwise the same RMS approximation normalize_loudness_numpy uses.
+    Only one mean-square per 100 ms is kept, so memory stays tiny for any length.
+    """
+    def __init__(self, sr: int):
+        self.sr = sr
+        self._signal = optional_import("scipy.signal")
+        self.gated = optional_import("pyloudnorm") is not None and self._signal is not None
+        self.hop = int(sr * 0.1)
+        self._sos = k_weighting_sos(sr) if self.gated else None
+        self._zi = np.zeros((2, 2)) if self.gated else None
+        self._carry = np.zeros(0)
+        self._hop_ms = []
+        self._sumsq = 0.0
+        self._count = 0
 
-# Startup event
-@app.on_event("startup")
-async def startup_event():
-    try:
-        load_xtts_model()
-    except Exception as e:
-        print("❌ Error loading XTTS:", e)
-        print("⚠ Running in MOCK MODE.")
+    def process(self, x: np.ndarray):
+        self._sumsq += float(np.dot(x, x))
+        self._count += len(x)
+        if not self.gated:
+            return
+        y, self._zi = self._signal.sosfilt(self._sos, x, zi=self._zi)
+        y = np.concatenate([self._carry, y])
+        n = len(y) // self.hop
+        if n:
+            hops = y[:n * self.hop].reshape(n, self.hop)
+            self._hop_ms.extend(np.einsum("ij,ij->i", hops, hops) / self.hop)
+        self._carry = y[n * self.hop:]
 
-# ==============================
-# Improved get_speaker_latents
-# ==============================
-def get_speaker_latents(path):
-    """Caches speaker embedding on DEVICE. Converts to fp16 on CUDA for speed."""
-    global tts
-    if path not in speaker_cache:
-        print(f"🎧 Encoding speaker → {path}")
-        if tts is None:
-            raise RuntimeError("TTS model not loaded")
-        with torch.inference_mode():
-            gpt_latent, speaker_latent = tts.synthesizer.tts_model.get_conditioning_latents(
-                audio_path=path,
-                gpt_cond_len=tts.synthesizer.tts_model.config.gpt_cond_len,
-                gpt_cond_chunk_len=tts.synthesizer.tts_model.config.gpt_cond_chunk_len
-            )
-            def to_device(t):
-                if isinstance(t, torch.Tensor):
-                    t = t.to(DEVICE)
-                    if DEVICE == "cuda":
-                        try:
-                            t = t.half()
-                        except Exception:
-                            pass
-                return t
-            gpt_latent = to_device(gpt_latent)
-            speaker_latent = to_device(speaker_latent)
-            speaker_cache[path] = (gpt_latent, speaker_latent)
-            
-            # Simple LRU-like eviction: if cache grows too big, remove oldest
-            if len(speaker_cache) > 20:
-                # Python 3.7+ dicts preserve insertion order, so this removes the first inserted item
-                removed_key = next(iter(speaker_cache))
-                del speaker_cache[removed_key]
-                print(f"🧹 Evicted {removed_key} from cache to save memory")
-
-            print("✅ Cached speaker embeddings on device")
-    return speaker_cache[path]
+    def loudness(self):
+        if not self.gated:
+            rms = np.sqrt(self._sumsq / max(self._count, 1) + 1e-12)
+            return 20 * np.log10(rms + 1e-12)
+        hop_ms = np.asarray(self._hop_ms)
+        if len(hop_ms) < 4:
+            return -np.inf
+        z = np.convolve(hop_ms, np.ones(4) / 4.0, mode="valid")  # 400 ms blocks, 100 ms hop
+        lk = -0.691 + 10 * np.log10(z + 1e-20)
+        z = z[lk >= -70.0]
+        if len(z) == 0:
+            return -np.inf
+        rel_gate = -0.691 + 10 * np.log10(np.mean(z)) - 10.0
+        z = z[-0.691 + 10 * np.log10(z) >= rel_gate]
+        return -0.691 + 10 * np.log10(np.mean(z))
 
-# ==============================
-# Clone endpoint with preprocessing
-# ==============================
-# ==============================
-# Clone endpoint with preprocessing
-# ==============================
-@app.post("/clone")
-async def clone_voice(
-    file: UploadFile = File(...),
-    lang: str = Form("en"),
-    user_id: str = Form("default")
-):
+def preprocess_and_save_sample_streaming(src_path, target_path, target_sr=24000, min_duration_s=30.0,
+                                         block_s=10.0, noise_pad_s=0.5, noise_profile_s=5.0):
+    """
+    Same pipeline as preprocess_and_save_sample, but with peak memory bounded by
+    block_s instead of the upload length. Three passes over disk:
+      1. read blocks -> mono -> resample (carried state) into a float temp file,
+         keeping only per-frame VAD features in memory;
+      2. over the trimmed range: noise reduction (blocks with noise_pad_s of context
+         each side and a shared noise profile), 80 Hz high-pass with carried sosfilt
+         state, streaming loudness + peak, into a second temp file;
+      3. apply loudness gain and peak limit, write 24k PCM16.
+    """
+    target_dir = os.path.dirname(os.path.abspath(target_path))
+    stage1 = tempfile.NamedTemporaryFile(suffix=".wav", dir=target_dir, delete=False).name
+    stage2 = tempfile.NamedTemporaryFile(suffix=".wav", dir=target_dir, delete=False).name
+    sr = target_sr
+    frame_len = max(1, int(sr * 0.03))
     try:
-        # Organize by user_id
-        user_dir = f"speakers/{user_id}"
-        os.makedirs(user_dir, exist_ok=True)
-        
-        tmp_in = f"{user_dir}/{lang}_in.wav"
-        with open(tmp_in, "wb") as f:
-            shutil.copyfileobj(file.file, f)
+        # --- pass 1: decode, downmix, resample; collect VAD features ---
+        info = sf.info(src_path)
+        block = max(1, int(info.samplerate * block_s))
+        resampler = StreamingResampler(info.samplerate, target_sr) if info.samplerate != target_sr else None
+        energies, zcrs = [], []
+        carry = np.zeros(0, dtype=np.float32)
+        n_total = 0
+        with sf.SoundFile(stage1, "w", samplerate=sr, channels=1, subtype="FLOAT", format="WAV") as out:
+            def consume(y):
+                nonlocal carry, n_total
+                if len(y) == 0:
+                    return
+                out.write(y)
+                n_total += len(y)
+                y = np.concatenate([carry, y])
+                e, z = frame_features(y, frame_len)
+                energies.append(e)
+                zcrs.append(z)
+                carry = y[len(e) * frame_len:]
 
-        target_path = f"{user_dir}/{lang}.wav"
-        try:
-            preprocess_and_save_sample(tmp_in, target_path, target_sr=24000, min_duration_s=30.0)
-        except ValueError as e:
-            # still save the raw file for experiments, but inform user
-            shutil.copy(tmp_in, target_path)
-            return {
-                "speaker_id": target_path,
-                "message": f"Saved sample, but warning: {e}. For high-quality cloning provide >=30s clean, mono, 24k sample."
-            }
+            with span("read_resample"):
+                for data in sf.blocks(src_path, blocksize=block, dtype="float32", always_2d=True):
+                    mono = data.mean(axis=1)
+                    consume(resampler.process(mono) if resampler is not None else mono)
+                if resampler is not None:
+                    consume(resampler.flush())
 
-        # Remove cached embedding (force re-encode on next TTS)
-        if target_path in speaker_cache:
-            del speaker_cache[target_path]
+        # --- trim boundaries from the whole-clip VAD (features are ~1/720 of the samples) ---
+        with span("trim_silence"):
+            energy_db = np.concatenate(energies) if energies else np.zeros(0)
+            voiced = vad_decision(energy_db, np.concatenate(zcrs) if zcrs else np.zeros(0))
+        if voiced.any():
+            first = int(np.argmax(voiced))
+            last = len(voiced) - 1 - int(np.argmax(voiced[::-1]))
+            start = max(0, (first - 1) * frame_len)
+            end = min(n_total, (last + 2) * frame_len)
+        else:
+            start, end = 0, n_total
+        dur = (end - start) / sr
+        if dur < min_duration_s:
+            raise ValueError(f"Input too short ({dur:.1f}s). Provide >= {min_duration_s}s clean speech for best cloning.")
 
-        return {
-            "speaker_id": target_path,
-            "message": f"Speaker sample saved ({lang}) for user: {user_id}"
-        }
+        # --- pass 2: noise reduction + high-pass + loudness measurement ---
+        nr = optional_import("noisereduce")
+        signal = optional_import("scipy.signal")
+        with sf.SoundFile(stage1) as src:
+            noise_clip = None
+            if nr is not None:
+                # stationary noise profile from the quietest (unvoiced) frames, capped at noise_profile_s
+                quiet = np.flatnonzero(~voiced)
+                quiet = quiet[np.argsort(energy_db[quiet])][:int(noise_profile_s / 0.03)]
+                if len(quiet):
+                    pieces = []
+                    for f in np.sort(quiet):
+                        src.seek(int(f) * frame_len)
+                        pieces.append(src.read(frame_len, dtype="float32"))
+                    noise_clip = np.concatenate(pieces)
+            else:
+                print("⚠️ noisereduce not installed, skipping noise reduction.")
 
+            sos = signal.butter(4, 80, 'hp', fs=sr, output='sos') if signal is not None else None
+            zi = np.zeros((sos.shape[0], 2)) if sos is not None else None
+            meter = StreamingLoudness(sr)
+            peak = 0.0
+            step = int(sr * block_s)
+            pad = int(sr * noise_pad_s)
+            with sf.SoundFile(stage2, "w", samplerate=sr, channels=1, subtype="FLOAT", format="WAV") as out:
+                for b0 in range(start, end, step):
+                    b1 = min(b0 + step, end)
+                    if nr is not None:
+                        c0, c1 = max(start, b0 - pad), min(end, b1 + pad)
+                        src.seek(c0)
+                        ctx = src.read(c1 - c0, dtype="float32")
+                        with span("denoise"):
+                            try:
+                                ctx = nr.reduce_noise(y=ctx, sr=sr, y_noise=noise_clip, prop_decrease=0.5, stationary=True)
+                            except Exception as e:
+                                print(f"⚠️ Noise reduction failed: {e}")
+                        y = np.asarray(ctx[b0 - c0:b0 - c0 + (b1 - b0)], dtype=np.float64)
+                    else:
+                        src.seek(b0)
+                        y = src.read(b1 - b0, dtype="float64")
+                    if sos is not None:
+                        with span("enhance"):
+                            y, zi = signal.sosfilt(sos, y, zi=zi)
+                    with span("normalize"):
+                        meter.process(y)
+                        peak = max(peak, float(np.max(np.abs(y))) if len(y) else 0.0)
+                    out.write(y.astype(np.float32))
+
+        # --- pass 3: loudness gain + peak limit, write PCM16 ---
+        loudness = meter.loudness()
+        gain = 10 ** ((-16.0 - loudness) / 20.0) if np.isfinite(loudness) else 1.0
+        peak_after = peak * gain + 1e-9
+        if peak_after > 1.0:
+            gain /= peak_after
+        with span("write"), sf.SoundFile(stage2) as src, \
+                sf.SoundFile(target_path, "w", samplerate=sr, channels=1, subtype="PCM_16") as out:
+            for y in src.blocks(blocksize=step, dtype="float32"):
+                out.write(y * gain)
+        return target_path
+    finally:
+        for path in (stage1, stage2):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+def preprocess_sample_traced(src_path, target_path, **kwargs):
+    """
+    preprocess_and_save_sample for run_dsp. A DSP process cannot reach this process's
+    metrics, so it returns its stage spans (and the too-short message, which
+    process_clone_sample turns into a warning) for the caller to record.
+    """
+    trace = Trace("preprocess")
+    token = _current_trace.set(trace if METRICS_ENABLED else None)
+    try:
+        preprocess_and_save_sample(src_path, target_path, **kwargs)
+        return trace.spans, None
+    except ValueError as e:
+        return trace.spans, str(e)
+    finally:
+        _current_trace.reset(token)
+
+# ==============================
+# Model loading + warmup
+# ==============================
+class StartupStatus:
+    """
+    Where the background model load is (starting -> import -> load -> optimize ->
+    warmup -> ready, or failed), with the duration of every phase. Served by /readyz.
+    """
+    def __init__(self):
+        self.phase = "starting"
+        self.error = None
+        self.timings = {}
+
+    @contextmanager
+    def stage(self, name):
+        self.phase = name
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[f"{name}_s"] = round(time.perf_counter() - t0, 3)
+
+    def since_module_start(self, key):
+        self.timings[key] = round(time.perf_counter() - _MODULE_T0, 3)
+
+    @property
+    def ready(self):
+        return self.phase == "ready"
+
+    def to_dict(self):
+        return {
+            "ready": self.ready,
+            "phase": self.phase,
+            "error": self.error,
+            "device": DEVICE,
+            "optimizations": cpu_optimizations,
+            "timings": self.timings,
+        }
+
+startup_status = StartupStatus()
+
+# ==============================
+# CPU performance mode
+# ==============================
+# Opt-in for GPU-less nodes. CPU_PERF_MODE=1 turns on int8 + bf16 (bf16 only on
+# CPUs with native bf16 matmul: AVX512-BF16 / AMX); each knob can also be set alone.
+#   CPU_QUANTIZE=int8   dynamic int8 quantization of every Linear in the GPT
+#                       (HF GPT-2's Conv1D projections are converted to Linear first)
+#   CPU_BF16=1|auto     runs the HiFi-GAN decoder (and the GPT, unless it is
+#                       quantized: int8 kernels only take fp32) under bf16 autocast
+#   TORCH_THREADS / TORCH_INTEROP_THREADS   intra-/inter-op pool sizes
+#   TORCH_COMPILE=1     torch.compile the GPT-2 stack and the decoder (mode: TORCH_COMPILE_MODE)
+CPU_PERF_MODE = os.environ.get("CPU_PERF_MODE", "0") == "1"
+CPU_QUANTIZE = os.environ.get("CPU_QUANTIZE", "int8" if CPU_PERF_MODE else "none").lower()
+CPU_BF16 = os.environ.get("CPU_BF16", "auto" if CPU_PERF_MODE else "0").lower()
+TORCH_THREADS = int(os.environ.get("TORCH_THREADS", 0))  # 0 = torch default (one per core)
+TORCH_INTEROP_THREADS = int(os.environ.get("TORCH_INTEROP_THREADS", 0))
+TORCH_COMPILE = os.environ.get("TORCH_COMPILE", "0") == "1"
+TORCH_COMPILE_MODE = os.environ.get("TORCH_COMPILE_MODE", "default")
+cpu_optimizations = {}  # what optimize_cpu_model() applied, shown on /readyz
+
+def cpu_supports_bf16():
+    """Native bf16 dot products; without them bf16 is emulated and slower than fp32."""
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return "avx512_bf16" in flags or "amx_bf16" in flags
+
+def _hf_conv1d_to_linear(root):
+    """HF GPT-2 projections are Conv1D (x @ W + b, W stored transposed); quantize_dynamic only knows nn.Linear."""
+    swapped = 0
+    for parent in list(root.modules()):
+        for name, child in list(parent.named_children()):
+            if type(child).__name__ != "Conv1D" or not hasattr(child, "nf"):
+                continue
+            linear = torch.nn.Linear(child.weight.shape[0], child.nf, bias=child.bias is not None)
+            linear.weight.data = child.weight.data.t().contiguous()
+            if child.bias is not None:
+                linear.bias.data = child.bias.data
+            setattr(parent, name, linear)
+            swapped += 1
+    return swapped
+
+def _float32(out):
+    if torch.is_tensor(out):
+        return out.float() if out.is_floating_point() else out
+    if type(out) in (tuple, list):
+        return type(out)(_float32(o) for o in out)
+    return out
+
+def _run_in_bf16(module, method="forward"):
+    """Wraps module.<method> in bf16 autocast; floating outputs are handed back as fp32."""
+    fn = getattr(module, method)
+
+    def wrapped(*args, **kwargs):
+        with torch.autocast("cpu", dtype=torch.bfloat16):
+            return _float32(fn(*args, **kwargs))
+    setattr(module, method, wrapped)
+
+def optimize_cpu_model(model, quantize="none", bf16="0", compile_model=False, compile_mode="default"):
+    """
+    Applies the CPU performance options to a loaded XTTS model in place (before the
+    replicas fork, so they share the result) and returns what was applied.
+    """
+    import warnings
+    applied = {}
+    gpt = getattr(model, "gpt", None)
+    decoder = getattr(model, "hifigan_decoder", None)
+    if quantize == "int8" and gpt is not None:
+        swapped = _hf_conv1d_to_linear(gpt)
+        with warnings.catch_warnings():
+            # torch marks the quantized tensor constructors deprecated; the kernels are what we use
+            warnings.simplefilter("ignore")
+            torch.ao.quantization.quantize_dynamic(gpt, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        applied["quantize"] = f"int8 (gpt, {swapped} Conv1D converted)"
+    elif quantize not in ("none", "int8"):
+        print(f"⚠️ Unknown CPU_QUANTIZE={quantize!r}, expected none or int8")
+    if bf16 == "1" or (bf16 == "auto" and cpu_supports_bf16()):
+        targets = []
+        if decoder is not None:
+            _run_in_bf16(decoder)
+            targets.append("hifigan_decoder")
+        if gpt is not None and "quantize" not in applied:
+            _run_in_bf16(gpt)
+            _run_in_bf16(gpt, "generate")
+            targets.append("gpt")
+        applied["bf16"] = targets
+    if compile_model and hasattr(torch, "compile"):
+        targets = []
+        for name, module in (("gpt.gpt", getattr(gpt, "gpt", None)), ("hifigan_decoder", decoder)):
+            if module is not None:
+                # dynamic: sequence length grows every decode step (forward, not
+                # Module.compile, which needs torch 2.2+)
+                module.forward = torch.compile(module.forward, mode=compile_mode, dynamic=True)
+                targets.append(name)
+        applied["compile"] = {"mode": compile_mode, "modules": targets}
+    applied["threads"] = {"intra_op": torch.get_num_threads(), "inter_op": torch.get_num_interop_threads()}
+    return applied
+
+def load_xtts_model():
+    global tts
+    if tts is None:
+        with startup_status.stage("import"):
+            import_model_stack()
+
+        print("⏳ Loading XTTS v2 model...")
+        with startup_status.stage("load"):
+            tts = TTS(
+                model_name="tts_models/multilingual/multi-dataset/xtts_v2",
+                progress_bar=True,
+            ).to(DEVICE)
+
+            # Monkey-patch Hindi char limit for text splitting
+            try:
+                if "hi" not in tts.synthesizer.tts_model.tokenizer.char_limits:
+                    tts.synthesizer.tts_model.tokenizer.char_limits["hi"] = 200
+                    print("🔧 Added Hindi char limit to tokenizer")
+            except Exception as e:
+                print(f"⚠️ Could not patch tokenizer: {e}")
+
+            tts.synthesizer.tts_model.eval()
+
+        if DEVICE == "cpu":
+            with startup_status.stage("optimize"):
+                cpu_optimizations.update(optimize_cpu_model(
+                    tts.synthesizer.tts_model,
+                    quantize=CPU_QUANTIZE,
+                    bf16=CPU_BF16,
+                    compile_model=TORCH_COMPILE,
+                    compile_mode=TORCH_COMPILE_MODE,
+                ))
+                print(f"🔧 CPU mode: {cpu_optimizations}")
+
+        # CPU replicas are forked before the parent runs any inference so they
+        # share the freshly loaded weights copy-on-write
+        if REPLICAS > 0:
+            with startup_status.stage("replicas"):
+                start_replica_pool()
+
+        with startup_status.stage("warmup"):
+            warmup_model()
+
+def require_model():
+    """Synthesis needs the model: 503 (with Retry-After while it is still loading) until /readyz is green."""
+    if startup_status.ready:
+        return
+    if startup_status.phase == "failed":
+        raise HTTPException(status_code=503, detail=f"TTS model failed to load: {startup_status.error}")
+    raise HTTPException(
+        status_code=503,
+        detail=f"TTS model is still loading ({startup_status.phase})",
+        headers={"Retry-After": "5"},
+    )
+
+def warmup_model():
+    # Warmup (short inference) to JIT caches and GPU kernels
+    try:
+        with torch.inference_mode():
+            # create tiny dummy latents if config available
+            conf = getattr(tts.synthesizer.tts_model, "config", None)
+            dummy_gpt = None
+            dummy_spk = None
+            try:
+                if conf is not None:
+                    gpt_len = conf.gpt_cond_len if hasattr(conf, "gpt_cond_len") else 1
+                    spk_dim = conf.spk_emb_dim if hasattr(conf, "spk_emb_dim") else 1
+                    dummy_gpt = torch.zeros((1, gpt_len), device=DEVICE)
+                    dummy_spk = torch.zeros((1, spk_dim), device=DEVICE)
+            except Exception:
+                dummy_gpt = None
+                dummy_spk = None
+
+            sample = "Hello world."
+            print("⏳ Performing warmup inference...")
+            _ = tts.synthesizer.tts_model.inference(
+                text=sample,
+                language="en",
+                gpt_cond_latent=dummy_gpt,
+                speaker_embedding=dummy_spk,
+                enable_text_splitting=False
+            )
+            print("🚀 Model loaded and warmed up!")
+    except Exception as e:
+        print("⚠ Warmup failed:", e)
+
+async def load_model_in_background():
+    try:
+        await run_model(load_xtts_model)
+        startup_status.phase = "ready"
+        startup_status.since_module_start("ready_after_s")
+        t = startup_status.timings
+        print(
+            f"✅ Model ready {t['ready_after_s']:.1f}s after import started "
+            f"(import {t.get('import_s', 0):.1f}s, load {t.get('load_s', 0):.1f}s, warmup {t.get('warmup_s', 0):.1f}s)"
+        )
+    except Exception as e:
+        startup_status.phase = "failed"
+        startup_status.error = str(e)
+        print("❌ Error loading XTTS:", e)
+        print("⚠ Running in MOCK MODE.")
+
+_model_load_task = None
+_chat_follow_task = None
+
+# Startup event
+@app.on_event("startup")
+async def startup_event():
+    global _model_load_task, _chat_follow_task
+    n = await asyncio.to_thread(speaker_registry.scan)
+    print(f"📇 Indexed {n} speaker samples")
+    if chat_log is not None:
+        await asyncio.to_thread(chat_log.open)
+        _chat_follow_task = asyncio.create_task(chat_log.follow(lambda: bool(chat_hub._subs)))
+    # The model loads on the model thread while the app already serves chat/health;
+    # synthesis answers 503 + Retry-After until it is ready
+    _model_load_task = asyncio.create_task(load_model_in_background())
+    startup_status.since_module_start("serving_after_s")
+    print(f"⏱ Serving {startup_status.timings['serving_after_s'] * 1000:.0f} ms after import started "
+          f"(module import {startup_status.timings['module_import_s'] * 1000:.0f} ms), model loading in background")
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process and event loop are up."""
+    return {"status": "ok", "uptime_s": round(time.perf_counter() - _MODULE_T0, 1)}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: model loaded and warmed up."""
+    status = startup_status.to_dict()
+    return JSONResponse(status, status_code=200 if startup_status.ready else 503)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    model_executor.shutdown(wait=False, cancel_futures=True)
+    if replica_pool is not None:
+        replica_pool.shutdown()
+    if _dsp_executor is not None:
+        _dsp_executor.shutdown(wait=False, cancel_futures=True)
+
+# ==============================
+# Persistent speaker latent store
+# ==============================
+# Latents computed at clone time are written next to the sample as
+# speakers/{user_id}/{lang}.latents.safetensors (memory-mapped on load).
+# The header records the store version, the encoder settings and the sample's
+# size/mtime/sha256 so a rewritten sample never reuses stale latents.
+LATENT_STORE_VERSION = "1"
+
+def latent_store_path(sample_path):
+    return os.path.splitext(sample_path)[0] + ".latents.safetensors"
+
+def file_sha256(path, block_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+_sample_hashes = {}  # path -> ((size, mtime_ns), sha256)
+
+def speaker_content_hash(path):
+    """sha256 of a speaker sample, memoized on (size, mtime_ns) so repeat calls cost one stat."""
+    st = os.stat(path)
+    stamp = (st.st_size, st.st_mtime_ns)
+    memo = _sample_hashes.get(path)
+    if memo is not None and memo[0] == stamp:
+        return memo[1]
+    digest = file_sha256(path)
+    _sample_hashes[path] = (stamp, digest)
+    return digest
+
+def _latent_encoder_settings():
+    conf = tts.synthesizer.tts_model.config
+    return {
+        "gpt_cond_len": str(conf.gpt_cond_len),
+        "gpt_cond_chunk_len": str(conf.gpt_cond_chunk_len),
+    }
+
+def save_latent_store(sample_path, gpt_latent, speaker_latent):
+    safetensors_torch = optional_import("safetensors.torch")
+    if safetensors_torch is None:
+        return None
+    st = os.stat(sample_path)
+    metadata = {
+        "version": LATENT_STORE_VERSION,
+        "sample_size": str(st.st_size),
+        "sample_mtime_ns": str(st.st_mtime_ns),
+        "sample_sha256": file_sha256(sample_path),
+        **_latent_encoder_settings(),
+    }
+    store_path = latent_store_path(sample_path)
+    tmp_path = store_path + ".tmp"
+    safetensors_torch.save_file(
+        {
+            "gpt_cond_latent": gpt_latent.detach().float().cpu().contiguous(),
+            "speaker_embedding": speaker_latent.detach().float().cpu().contiguous(),
+        },
+        tmp_path,
+        metadata=metadata,
+    )
+    os.replace(tmp_path, store_path)  # atomic, readers never see a partial file
+    return store_path
+
+def load_latent_store(sample_path):
+    """Returns (gpt_latent, speaker_latent) on CPU, or None if missing/stale/unreadable."""
+    if optional_import("safetensors.torch") is None:
+        return None
+    store_path = latent_store_path(sample_path)
+    if not os.path.exists(store_path):
+        return None
+    try:
+        with optional_import("safetensors").safe_open(store_path, framework="pt", device="cpu") as f:
+            meta = f.metadata() or {}
+            if meta.get("version") != LATENT_STORE_VERSION:
+                print(f"⚠️ Latent store version mismatch for {sample_path}, re-encoding")
+                return None
+            if any(meta.get(k) != v for k, v in _latent_encoder_settings().items()):
+                print(f"⚠️ Latent store encoder settings changed for {sample_path}, re-encoding")
+                return None
+            st = os.stat(sample_path)
+            unchanged = (
+                meta.get("sample_size") == str(st.st_size)
+                and meta.get("sample_mtime_ns") == str(st.st_mtime_ns)
+            )
+            # mtime alone is not proof of change (copies, restores), so fall back to the content hash
+            if not unchanged and meta.get("sample_sha256") != file_sha256(sample_path):
+                print(f"⚠️ Sample changed since latents were stored: {sample_path}")
+                return None
+            return f.get_tensor("gpt_cond_latent"), f.get_tensor("speaker_embedding")
+    except Exception as e:
+        print(f"⚠️ Could not read latent store {store_path}: {e}")
+        return None
+
+def invalidate_latent_store(sample_path):
+    speaker_cache.pop(sample_path, None)
+    speaker_registry.mark_latents(sample_path, False)
+    try:
+        os.remove(latent_store_path(sample_path))
+    except FileNotFoundError:
+        pass
+
+# ==============================
+# Speaker registry (in-memory index of speakers/)
+# ==============================
+def file_stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+class SpeakerEntry:
+    def __init__(self, path, content_hash=None, has_latents=False, stamp=None):
+        self.path = path
+        self.content_hash = content_hash  # filled on first use, or by /clone
+        self.has_latents = has_latents
+        self.stamp = stamp  # (size, mtime_ns) of the file the hash belongs to
+
+    def to_dict(self):
+        return {"path": self.path, "content_hash": self.content_hash, "has_latents": self.has_latents}
+
+class SpeakerRegistry:
+    """
+    user_id -> language -> SpeakerEntry for speakers/{user_id}/{lang}.wav, plus the
+    legacy flat speakers/{user_id}_{lang}.wav layout. Built by one directory walk at
+    startup and updated by /clone, so resolving a request's speaker is a couple of
+    dict lookups with no filesystem syscalls. Files added behind the server's back
+    are picked up by rescan (POST /speakers/rescan).
+    """
+    def __init__(self, root="speakers"):
+        self.root = root
+        self._lock = threading.Lock()
+        self._users = {}    # user_id -> {lang: SpeakerEntry}
+        self._legacy = {}   # (user_id, lang) -> SpeakerEntry
+        self._by_path = {}  # sample path -> SpeakerEntry
+        self._any = None    # first sample in sorted order: the last-resort voice
+
+    @staticmethod
+    def _is_sample(name):
+        # {lang}.wav only: clone staging files ({lang}_in_xxxx.wav) are not voices yet
+        stem, ext = os.path.splitext(name)
+        return ext == ".wav" and stem and "_" not in stem and "." not in stem
+
+    def _entry(self, path):
+        return SpeakerEntry(path, has_latents=os.path.exists(latent_store_path(path)), stamp=file_stamp(path))
+
+    def scan(self):
+        users, legacy, by_path = {}, {}, {}
+        if os.path.isdir(self.root):
+            for name in sorted(os.listdir(self.root)):
+                full = os.path.join(self.root, name)
+                if os.path.isdir(full):
+                    for fname in sorted(os.listdir(full)):
+                        if self._is_sample(fname):
+                            entry = self._entry(f"{self.root}/{name}/{fname}")
+                            users.setdefault(name, {})[os.path.splitext(fname)[0]] = entry
+                            by_path[entry.path] = entry
+                elif name.endswith(".wav"):
+                    user_id, _, lang = os.path.splitext(name)[0].rpartition("_")
+                    entry = self._entry(f"{self.root}/{name}")
+                    if user_id:
+                        legacy[(user_id, lang)] = entry
+                    by_path[entry.path] = entry
+        # the old recursive glob listed top-level files before subdirectories
+        first = min(by_path.values(), key=lambda e: (e.path.count("/"), e.path), default=None)
+        changed = []
+        with self._lock:
+            # previously computed hashes stay valid for files we already knew, unless rewritten
+            for path, entry in by_path.items():
+                old = self._by_path.get(path)
+                if old is None:
+                    continue
+                if old.stamp == entry.stamp:
+                    entry.content_hash = old.content_hash
+                else:
+                    changed.append(old)
+            self._users, self._legacy, self._by_path, self._any = users, legacy, by_path, first
+        for old in changed:
+            # replaced outside /clone: latents and audio rendered from the old file must go
+            print(f"🔄 Speaker sample changed on disk: {old.path}")
+            speaker_cache.pop(old.path, None)
+            if old.content_hash:
+                audio_cache.invalidate_speaker(old.content_hash)
+            if replica_pool is not None:
+                replica_pool.invalidate(old.path)
+        return len(by_path)
+
+    def register(self, user_id, lang, path, content_hash=None, has_latents=False):
+        entry = SpeakerEntry(path, content_hash, has_latents, file_stamp(path))
+        with self._lock:
+            self._users.setdefault(user_id, {})[lang] = entry
+            self._by_path[path] = entry
+            if self._any is None:
+                self._any = entry
+        return entry
+
+    def mark_latents(self, path, has_latents=True):
+        entry = self._by_path.get(path)
+        if entry is not None:
+            entry.has_latents = has_latents
+
+    def resolve(self, user_id, language):
+        """Same order as before: language, the other language, legacy flat file, any sample."""
+        langs = self._users.get(user_id, {})
+        entry = langs.get(language)
+        if entry is not None:
+            return entry
+        fallback_lang = "hi" if language == "en" else "en"
+        entry = langs.get(fallback_lang)
+        if entry is not None:
+            print(f"⚠️ Missing {self.root}/{user_id}/{language}.wav, using fallback voice {entry.path}")
+            return entry
+        entry = self._legacy.get((user_id, language))
+        if entry is not None:
+            return entry
+        return self._any
+
+    def cached_hash(self, path):
+        entry = self._by_path.get(path)
+        return entry.content_hash if entry is not None else None
+
+    def content_hash(self, path):
+        """Hashes the sample on first use (file read; call off the event loop) and remembers it."""
+        digest = speaker_content_hash(path)
+        entry = self._by_path.get(path)
+        if entry is not None:
+            entry.content_hash = digest
+            entry.stamp = _sample_hashes[path][0]
+        return digest
+
+    def stats(self):
+        with self._lock:
+            return {
+                "users": len(self._users),
+                "samples": len(self._by_path),
+                "legacy_samples": len(self._legacy),
+                "hashed": sum(1 for e in self._by_path.values() if e.content_hash),
+                "with_latents": sum(1 for e in self._by_path.values() if e.has_latents),
+            }
+
+    def list(self):
+        with self._lock:
+            return {
+                "users": {u: {l: e.to_dict() for l, e in langs.items()} for u, langs in self._users.items()},
+                "legacy": {f"{u}_{l}": e.to_dict() for (u, l), e in self._legacy.items()},
+            }
+
+speaker_registry = SpeakerRegistry("speakers")
+
+# ==============================
+# Improved get_speaker_latents
+# ==============================
+def encode_speaker_latents(path):
+    """Runs the XTTS conditioning encoder on a sample and persists the result."""
+    print(f"🎧 Encoding speaker → {path}")
+    if tts is None:
+        raise RuntimeError("TTS model not loaded")
+    with torch.inference_mode():
+        gpt_latent, speaker_latent = tts.synthesizer.tts_model.get_conditioning_latents(
+            audio_path=path,
+            gpt_cond_len=tts.synthesizer.tts_model.config.gpt_cond_len,
+            gpt_cond_chunk_len=tts.synthesizer.tts_model.config.gpt_cond_chunk_len
+        )
+    try:
+        if save_latent_store(path, gpt_latent, speaker_latent):
+            speaker_registry.mark_latents(path)
+            print(f"💾 Stored speaker latents → {latent_store_path(path)}")
+    except Exception as e:
+        print(f"⚠️ Could not persist latents for {path}: {e}")
+    return gpt_latent, speaker_latent
+
+def get_speaker_latents(path):
+    """Caches speaker embedding on DEVICE. Converts to fp16 on CUDA for speed."""
+    cached = speaker_cache.get(path)
+    if cached is not None:
+        return cached
+    # Concurrent misses for one sample (e.g. a channel's listeners right after a
+    # clone) share one load/encode
+    return latent_flight.do(path, partial(_load_speaker_latents, path))
+
+def _load_speaker_latents(path):
+    cached = speaker_cache.get(path)
+    if cached is not None:
+        return cached  # finished by a flight that ended just before ours began
+
+    with span("latent_load"):
+        stored = load_latent_store(path)
+    if stored is not None:
+        print(f"📂 Loaded stored latents → {path}")
+        gpt_latent, speaker_latent = stored
+    else:
+        with span("latent_encode"):
+            gpt_latent, speaker_latent = encode_speaker_latents(path)
+
+    def to_device(t):
+        if isinstance(t, torch.Tensor):
+            t = t.to(DEVICE)
+            if DEVICE == "cuda":
+                try:
+                    t = t.half()
+                except Exception:
+                    pass
+        return t
+    latents = (to_device(gpt_latent), to_device(speaker_latent))
+    speaker_cache.put(path, latents)
+    print("✅ Cached speaker embeddings on device")
+    return latents
+
+def refresh_speaker_latents(path):
+    """Drops old latents for a rewritten sample and encodes the new ones right away (clone time)."""
+    invalidate_latent_store(path)
+    if tts is None:
+        print("⚠️ TTS model not loaded, latents will be encoded on first synthesis")
+        return False
+    try:
+        get_speaker_latents(path)
+        return True
+    except Exception as e:
+        print(f"⚠️ Clone-time latent encoding failed for {path}: {e}")
+        return False
+
+# ==============================
+# Clone endpoint with preprocessing
+# ==============================
+def save_upload(src, dst_path):
+    with open(dst_path, "wb") as f:
+        shutil.copyfileobj(src, f)
+
+async def process_clone_sample(tmp_in, target_path, lang, user_id, on_stage=None):
+    """Preprocess an uploaded sample into target_path and encode/persist its latents."""
+    def stage(name, progress):
+        if on_stage is not None:
+            on_stage(name, progress)
+
+    old_hash = await asyncio.to_thread(speaker_content_hash, target_path) if os.path.exists(target_path) else None
+    stage("preprocessing", 0.1)
+    with traced("preprocess") as trace:
+        spans, warning = await run_dsp(preprocess_sample_traced, tmp_in, target_path, target_sr=24000, min_duration_s=30.0)
+        trace.spans += spans
+        if warning is not None:
+            trace.outcome = "too_short"
+    if warning is not None:
+        # still save the raw file for experiments, but inform user
+        await asyncio.to_thread(shutil.copy, tmp_in, target_path)
+
+    # Audio synthesized from the previous sample must not be served again
+    if old_hash:
+        audio_cache.invalidate_speaker(old_hash)
+
+    # Encode and persist latents now so the first synthesis doesn't pay for it
+    stage("encoding", 0.7)
+    # behind any live synthesis waiting for the model
+    async with inference_lock.hold(PRIORITIES["background"]):
+        await run_model(refresh_speaker_latents, target_path)
+    if replica_pool is not None:
+        replica_pool.invalidate(target_path)
+    speaker_registry.register(
+        user_id, lang, target_path,
+        content_hash=await asyncio.to_thread(speaker_content_hash, target_path),
+        has_latents=os.path.exists(latent_store_path(target_path)),
+    )
+
+    if warning is not None:
+        return {
+            "speaker_id": target_path,
+            "message": f"Saved sample, but warning: {warning}. For high-quality cloning provide >=30s clean, mono, 24k sample."
+        }
+    return {
+        "speaker_id": target_path,
+        "message": f"Speaker sample saved ({lang}) for user: {user_id}"
+    }
+
+class CloneJob:
+    def __init__(self, user_id, lang, input_path, target_path):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.lang = lang
+        self.input_path = input_path
+        self.target_path = target_path
+        self.status = "queued"  # queued -> running -> done | failed
+        self.stage = "queued"
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+        self.coalesced = 0
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.finished = asyncio.Event()
+
+    def set_stage(self, stage, progress):
+        self.stage = stage
+        self.progress = progress
+        self.updated_at = time.time()
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "user_id": self.user_id,
+            "lang": self.lang,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": self.progress,
+            "result": self.result,
+            "error": self.error,
+            "coalesced": self.coalesced,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+class CloneJobQueue:
+    """
+    Runs clone jobs in the background with bounded concurrency (the DSP work itself
+    runs on the process pool). Jobs for the same user_id/lang run one at a time in
+    submission order, and an upload that arrives while an earlier one for the same
+    user_id/lang is still queued replaces that job's input instead of adding work.
+    """
+    def __init__(self, concurrency: int, history: int):
+        self.concurrency = concurrency
+        self.history = history
+        self._semaphore = None
+        self._jobs = OrderedDict()  # job_id -> CloneJob, oldest first
+        self._queued = {}           # (user_id, lang) -> job_id still waiting to start
+        # (user_id, lang) -> lock; an entry lives only while some job of that key holds a reference
+        self._key_locks = weakref.WeakValueDictionary()
+        self.submitted = 0
+        self.coalesced = 0
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    async def submit(self, user_id, lang, upload):
+        user_dir = f"speakers/{user_id}"
+        os.makedirs(user_dir, exist_ok=True)
+        staging = f"{user_dir}/{lang}_in_{uuid.uuid4().hex[:8]}.part"
+        await asyncio.to_thread(save_upload, upload, staging)
+
+        key = (user_id, lang)
+        # No await between this check and os.replace, so the job cannot start in between
+        queued = self._jobs.get(self._queued.get(key))
+        if queued is not None and queued.status == "queued":
+            os.replace(staging, queued.input_path)
+            queued.coalesced += 1
+            queued.updated_at = time.time()
+            self.coalesced += 1
+            return queued
+
+        job = CloneJob(user_id, lang, staging[:-len(".part")] + ".wav", f"{user_dir}/{lang}.wav")
+        os.replace(staging, job.input_path)
+        self._jobs[job.id] = job
+        self._queued[key] = job.id
+        self.submitted += 1
+        self._trim_history()
+        asyncio.get_running_loop().create_task(self._run(job))
+        return job
+
+    def _trim_history(self):
+        while len(self._jobs) > self.history:
+            oldest_id, oldest = next(iter(self._jobs.items()))
+            if oldest.status not in ("done", "failed"):
+                break
+            del self._jobs[oldest_id]
+
+    async def _run(self, job):
+        key = (job.user_id, job.lang)
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        key_lock = self._key_locks.get(key)
+        if key_lock is None:
+            key_lock = self._key_locks[key] = asyncio.Lock()
+        async with key_lock:
+            async with self._semaphore:
+                if self._queued.get(key) == job.id:
+                    del self._queued[key]
+                job.status = "running"
+                try:
+                    job.result = await process_clone_sample(
+                        job.input_path, job.target_path, job.lang, job.user_id, on_stage=job.set_stage
+                    )
+                    job.status = "done"
+                    job.set_stage("done", 1.0)
+                except Exception as e:
+                    traceback.print_exc()
+                    job.status = "failed"
+                    job.error = str(e)
+                    job.set_stage("failed", job.progress)
+                finally:
+                    try:
+                        os.remove(job.input_path)
+                    except OSError:
+                        pass
+                    job.finished.set()
+        print(f"🧬 Clone job {job.id} for {job.user_id}/{job.lang}: {job.status}")
+
+    def stats(self):
+        by_status = {}
+        for job in self._jobs.values():
+            by_status[job.status] = by_status.get(job.status, 0) + 1
+        return {"submitted": self.submitted, "coalesced": self.coalesced, **by_status}
+
+clone_jobs = CloneJobQueue(
+    concurrency=int(os.environ.get("CLONE_CONCURRENCY", max(1, DSP_PROCESSES))),
+    history=int(os.environ.get("CLONE_JOB_HISTORY", 1000)),
+)
+
+@app.post("/clone")
+async def clone_voice(
+    file: UploadFile = File(...),
+    lang: str = Form("en"),
+    user_id: str = Form("default"),
+    wait: bool = Form(False)
+):
+    """
+    Queues the sample for preprocessing + latent encoding and returns a job right away
+    (202); poll /clone/status/{job_id}. wait=true keeps the old blocking behaviour.
+    """
+    try:
+        job = await clone_jobs.submit(user_id, lang, file.file)
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if not wait:
+        return JSONResponse(status_code=202, content=job.to_dict())
+
+    await job.finished.wait()
+    if job.status == "failed":
+        raise HTTPException(status_code=500, detail=job.error)
+    return job.result
+
+@app.get("/clone/status/{job_id}")
+async def clone_status(job_id: str):
+    job = clone_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown clone job")
+    return job.to_dict()
+
+# ==============================
+# Cache admin
+# ==============================
+@app.get("/speaker_cache/stats")
+async def speaker_cache_stats():
+    return speaker_cache.stats()
+
+@app.get("/audio_cache/stats")
+async def audio_cache_stats():
+    return audio_cache.stats()
+
+@app.get("/singleflight/stats")
+async def singleflight_stats():
+    """leaders did the work, shared joined it: shared is the duplicate work avoided."""
+    return {"latents": latent_flight.stats(), "synthesis": synthesis_flight.stats()}
+
+@app.post("/speaker_cache/pin")
+async def speaker_cache_pin(
+    speaker_id: str = Form(...),
+    pinned: bool = Form(True)
+):
+    """speaker_id is the sample path returned by /clone (e.g. speakers/alice/en.wav)."""
+    if pinned:
+        speaker_cache.pin(speaker_id)
+    else:
+        speaker_cache.unpin(speaker_id)
+    return {"speaker_id": speaker_id, "pinned": pinned}
+
+@app.get("/speakers")
+async def list_speakers():
+    return {**speaker_registry.stats(), **speaker_registry.list()}
+
+@app.post("/speakers/rescan")
+async def rescan_speakers():
+    """Re-indexes speakers/ after samples were added or removed outside /clone."""
+    await asyncio.to_thread(speaker_registry.scan)
+    return speaker_registry.stats()
+
+# ==============================
+# Synthesis helpers (shared by /synthesize and /synthesize_stream)
+# ==============================
+SAMPLE_RATE = 24000
+# Rates clients may ask for; XTTS renders 24k and we resample on the way out
+OUTPUT_SAMPLE_RATES = (8000, 16000, 22050, 24000, 44100, 48000)
+
+def check_output_rate(sample_rate: int):
+    if sample_rate not in OUTPUT_SAMPLE_RATES:
+        raise HTTPException(status_code=400, detail=f"sample_rate must be one of {list(OUTPUT_SAMPLE_RATES)}")
+
+def resolve_speaker(user_id: str, language: str):
+    """Picks the speaker sample for user_id/language, falling back to the other language, the legacy layout, then any sample."""
+    entry = speaker_registry.resolve(user_id, language)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="No speaker found.")
+    return entry.path
+
+async def resolve_speaker_hash(path: str):
+    """Content hash from the registry; only the first request for a sample reads the file."""
+    return speaker_registry.cached_hash(path) or await asyncio.to_thread(speaker_registry.content_hash, path)
+
+def prepare_text(text: str, language: str):
+    # Force punctuation for Hindi
+    if language == "hi" and not text.strip().endswith(("|", "।", "॥", ".", "!", "?")):
+        text += " ."
+    return text
+
+def sampling_params(language: str, target_speaker: str):
+    """
+    Pure Copy / Indian Accent Tuning.
+    To capture the exact tone/accent, we need low temperature and top_p.
+    This reduces the model's "creative" filling and forces it to rely on the speaker embedding.
+    """
+    # Detect cross-lingual
+    is_cross_lingual = (language == "hi" and "en" in target_speaker) or (language == "en" and "hi" in target_speaker)
+
+    # Base settings
+    temp = 0.65
+    top_p = 0.85
+    rep_pen = 5.0
+
+    if language == "hi":
+        # Hindi needs strict control
+        temp = 0.45
+        top_p = 0.8
+    elif language == "en":
+        # For English with Indian accent (assumed if user is cloning),
+        # slightly lower temp helps maintain the prosody.
+        temp = 0.55
+        top_p = 0.85
+
+    if is_cross_lingual:
+        # Cross-lingual needs even more constraint
+        temp = 0.4
+        top_p = 0.75
+
+    return {
+        "temperature": temp,
+        "length_penalty": 1.0,
+        "repetition_penalty": rep_pen,
+        "top_k": 50,
+        "top_p": top_p,
+        "speed": 1.0,
+        # segment_text() splits every language (Hindi included) before XTTS sees it
+        "enable_text_splitting": False,
+    }
+
+AUDIO_CACHE_VERSION = 2
+
+def audio_cache_key(text: str, language: str, speaker_hash: str, params: dict,
+                    sample_rate=SAMPLE_RATE, fmt="wav", channels=1):
+    norm_text = " ".join(unicodedata.normalize("NFC", text).split())
+    payload = json.dumps(
+        [AUDIO_CACHE_VERSION, norm_text, language, speaker_hash, sample_rate, fmt, channels, params],
+        sort_keys=True, ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def autocast_context():
+    if DEVICE == "cuda":
+        return torch.cuda.amp.autocast()
+    return nullcontext()
+
+def pcm16_bytes(x: np.ndarray):
+    return (np.clip(x, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+
+def wav_stream_header(sr: int, channels=1, bits=16):
+    """WAV header for a stream of unknown length (RIFF/data sizes set to 0xFFFFFFFF, which decoders treat as 'until EOF')."""
+    block_align = channels * bits // 8
+    return (
+        b"RIFF" + struct.pack("<I", 0xFFFFFFFF) + b"WAVE"
+        + b"fmt " + struct.pack("<IHHIIHH", 16, 1, channels, sr, sr * block_align, block_align, bits)
+        + b"data" + struct.pack("<I", 0xFFFFFFFF)
+    )
+
+class StreamPostProcessor:
+    """
+    Incremental version of the trim_silence + peak normalization done in /synthesize.
+    Leading silence is dropped until the first voiced frame, silent frames after that are
+    held back until more speech arrives (so trailing silence is never sent), and the gain
+    only ever goes down so chunks already sent stay consistent with later ones.
+    """
+    def __init__(self, sr: int, frame_ms=30, silence_db=-50.0):
+        self.frame_len = max(1, int(sr * frame_ms / 1000))
+        self.thresh = 10 ** (silence_db / 10.0)  # mean-square threshold
+        self.started = False
+        self.pending = []
+        self.gain = 1.0
+
+    def _voiced_frames(self, x: np.ndarray):
+        n = len(x) // self.frame_len
+        if n == 0:
+            return np.array([np.mean(x ** 2) > self.thresh]) if len(x) else np.zeros(0, dtype=bool)
+        frames = x[:n * self.frame_len].reshape(n, self.frame_len)
+        voiced = np.mean(frames ** 2, axis=1) > self.thresh
+        if len(x) > n * self.frame_len:
+            voiced = np.append(voiced, np.mean(x[n * self.frame_len:] ** 2) > self.thresh)
+        return voiced
+
+    def process(self, chunk: np.ndarray):
+        """Returns the audio that can be sent now (possibly empty)."""
+        x = np.asarray(chunk, dtype=np.float32).reshape(-1)
+        voiced = self._voiced_frames(x)
+        if not voiced.any():
+            if self.started:
+                self.pending.append(x)
+            return np.zeros(0, dtype=np.float32)
+
+        first = int(np.argmax(voiced)) * self.frame_len
+        last = (len(voiced) - int(np.argmax(voiced[::-1]))) * self.frame_len
+        if not self.started:
+            self.started = True
+            x_out = x[first:last]
+        else:
+            x_out = np.concatenate(self.pending + [x[:last]])
+        self.pending = [x[last:]] if last < len(x) else []
+
+        peak = float(np.max(np.abs(x_out))) + 1e-9
+        if peak * self.gain > 1.0:
+            self.gain = 1.0 / peak
+        return x_out * self.gain
+
+# ==============================
+# Output formats (negotiable, incrementally encoded)
+# ==============================
+# name -> (media type, libsndfile format, subtype); "pcm" is raw little-endian PCM16
+OUTPUT_FORMATS = {
+    "wav": ("audio/wav", "WAV", "PCM_16"),
+    "flac": ("audio/flac", "FLAC", "PCM_16"),
+    "ogg": ("audio/ogg", "OGG", "VORBIS"),
+    "opus": ("audio/ogg; codecs=opus", "OGG", "OPUS"),
+    "pcm": ("audio/L16", None, None),
+}
+OPUS_RATES = (8000, 12000, 16000, 24000, 48000)
+# 0.0 (fastest / highest bitrate) .. 1.0 (smallest); unset keeps libsndfile's defaults
+AUDIO_COMPRESSION_LEVEL = os.environ.get("AUDIO_COMPRESSION_LEVEL")
+# Accept media types (lowercased, without parameters) -> format name
+ACCEPT_FORMATS = {
+    "audio/wav": "wav", "audio/wave": "wav", "audio/x-wav": "wav", "audio/vnd.wave": "wav",
+    "audio/flac": "flac", "audio/x-flac": "flac",
+    "audio/ogg": "ogg", "audio/vorbis": "ogg", "audio/opus": "opus",
+    "audio/l16": "pcm",
+}
+
+def _format_available(fmt):
+    _, sf_format, subtype = OUTPUT_FORMATS[fmt]
+    if sf_format is None:
+        return True
+    try:
+        return subtype in sf.available_subtypes(sf_format)
+    except Exception:
+        return False
+
+# Depends on the libsndfile build (Opus needs >= 1.0.29)
+AVAILABLE_OUTPUT_FORMATS = tuple(f for f in OUTPUT_FORMATS if _format_available(f))
+
+def negotiate_format(requested, accept, default="wav"):
+    """
+    Explicit form value wins; otherwise the highest-q Accept entry we can produce.
+    Unknown or wildcard-only Accept headers fall back to `default`.
+    """
+    if requested:
+        fmt = requested.strip().lower()
+        if fmt not in OUTPUT_FORMATS:
+            raise HTTPException(status_code=400, detail=f"format must be one of {list(OUTPUT_FORMATS)}")
+        if fmt not in AVAILABLE_OUTPUT_FORMATS:
+            raise HTTPException(status_code=415, detail=f"format '{fmt}' is not supported by this server's libsndfile")
+        return fmt
+    candidates = []
+    for i, entry in enumerate((accept or "").split(",")):
+        parts = [p.strip().lower() for p in entry.split(";")]
+        q = 1.0
+        codecs = ""
+        for p in parts[1:]:
+            key, _, value = p.partition("=")
+            if key.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+            elif key.strip() == "codecs":
+                codecs = value.strip().strip('"')
+        fmt = ACCEPT_FORMATS.get(parts[0])
+        if fmt == "ogg" and codecs == "opus":
+            fmt = "opus"
+        if parts[0] in ("*/*", "audio/*"):
+            fmt = default
+        if fmt in AVAILABLE_OUTPUT_FORMATS and q > 0:
+            candidates.append((-q, i, fmt))
+    return min(candidates)[2] if candidates else default
+
+def check_output_format(fmt, sample_rate, channels):
+    if channels not in (1, 2):
+        raise HTTPException(status_code=400, detail="channels must be 1 or 2")
+    if fmt == "opus" and sample_rate not in OPUS_RATES:
+        raise HTTPException(status_code=400, detail=f"opus needs sample_rate in {list(OPUS_RATES)}")
+
+def output_media_type(fmt, sample_rate, channels):
+    if fmt == "pcm":
+        return f"audio/L16;rate={sample_rate};channels={channels}"
+    return OUTPUT_FORMATS[fmt][0]
+
+class _ByteSink:
+    """Seekable in-memory file for libsndfile; remembers how much was already handed out."""
+    def __init__(self):
+        self.buf = bytearray()
+        self.pos = 0
+
+    def write(self, data):
+        data = bytes(data)
+        if self.pos > len(self.buf):
+            self.buf.extend(b"\0" * (self.pos - len(self.buf)))
+        self.buf[self.pos:self.pos + len(data)] = data
+        self.pos += len(data)
+        return len(data)
+
+    def read(self, size=-1):
+        end = len(self.buf) if size is None or size < 0 else min(len(self.buf), self.pos + size)
+        data = bytes(self.buf[self.pos:end])
+        self.pos = max(self.pos, end)
+        return data
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.pos, io.SEEK_END: len(self.buf)}[whence]
+        self.pos = max(0, base + offset)
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+class AudioEncoder:
+    """
+    Incremental encoder: feed float chunks, get back whatever encoded bytes are ready,
+    so it composes with StreamingResponse. WAV/PCM are written directly (WAV with the
+    open-ended stream header); FLAC and OGG go through libsndfile into a _ByteSink.
+    Headers libsndfile patches on close (FLAC STREAMINFO length) cannot be taken back
+    from a stream, so streamed FLAC keeps its "length unknown" header; getvalue()
+    returns the finalized file for caching. Ogg only emits whole pages, so ogg/opus
+    streams arrive in page-sized bursts. CPU spent encoding is tracked per encoder.
+    """
+    def __init__(self, fmt, sr, channels=1, compression_level=AUDIO_COMPRESSION_LEVEL):
+        self.fmt = fmt
+        self.sr = sr
+        self.channels = channels
+        self.samples = 0
+        self.bytes_out = 0
+        self.encode_cpu_s = 0.0
+        self._sink = _ByteSink()
+        self._sent = 0
+        self._sf = None
+        if fmt == "wav":
+            self._sink.write(wav_stream_header(sr, channels))
+        elif fmt != "pcm":
+            _, sf_format, subtype = OUTPUT_FORMATS[fmt]
+            extra = {"compression_level": float(compression_level)} if compression_level is not None else {}
+            self._sf = sf.SoundFile(self._sink, "w", samplerate=sr, channels=channels,
+                                    format=sf_format, subtype=subtype, **extra)
+
+    def _take(self):
+        data = bytes(self._sink.buf[self._sent:])
+        self._sent = len(self._sink.buf)
+        self.bytes_out += len(data)
+        return data
+
+    def encode(self, x: np.ndarray):
+        t0 = time.thread_time()
+        x = np.clip(np.asarray(x, dtype=np.float32).reshape(-1), -1.0, 1.0)
+        if len(x):
+            frames = np.repeat(x[:, None], self.channels, axis=1) if self.channels > 1 else x
+            if self._sf is None:
+                self._sink.write(pcm16_bytes(frames))
+            else:
+                self._sf.write(frames)
+            self.samples += len(x)
+        self.encode_cpu_s += time.thread_time() - t0
+        return self._take()
+
+    def close(self):
+        t0 = time.thread_time()
+        if self._sf is not None:
+            self._sf.close()
+            self._sf = None
+        self.encode_cpu_s += time.thread_time() - t0
+        return self._take()
+
+    def getvalue(self):
+        """The complete file after close(); WAV gets its real RIFF/data sizes."""
+        data = bytearray(self._sink.buf)
+        if self.fmt == "wav":
+            data[4:8] = struct.pack("<I", len(data) - 8)
+            data[40:44] = struct.pack("<I", len(data) - 44)
+        return bytes(data)
+
+def encode_audio(wav: np.ndarray, sr: int, fmt="wav", channels=1, from_sr=None):
+    """One-shot encode (resampling from from_sr first if it differs). Returns (bytes, encoder)."""
+    if from_sr is not None and from_sr != sr:
+        wav = resample(wav, from_sr, sr)
+    enc = AudioEncoder(fmt, sr, channels)
+    enc.encode(wav)
+    enc.close()
+    return enc.getvalue(), enc
+
+class FormatStats:
+    """Per-format bytes per second of audio and encode CPU cost, for picking a format per network class."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, enc: AudioEncoder):
+        with self._lock:
+            st = self._stats.setdefault(enc.fmt, {"responses": 0, "bytes": 0, "audio_s": 0.0, "encode_cpu_s": 0.0})
+            st["responses"] += 1
+            st["bytes"] += enc.bytes_out
+            st["audio_s"] += enc.samples / enc.sr
+            st["encode_cpu_s"] += enc.encode_cpu_s
+
+    def stats(self):
+        with self._lock:
+            out = {}
+            for fmt, st in self._stats.items():
+                audio_s = st["audio_s"] or 1e-9
+                out[fmt] = {
+                    "responses": st["responses"],
+                    "audio_s": round(st["audio_s"], 3),
+                    "bytes_per_s": round(st["bytes"] / audio_s, 1),
+                    "kbps": round(st["bytes"] * 8 / audio_s / 1000, 2),
+                    "encode_cpu_ms_per_audio_s": round(st["encode_cpu_s"] * 1000 / audio_s, 3),
+                }
+            return out
+
+format_stats = FormatStats()
+
+@app.get("/audio_formats")
+async def audio_formats():
+    return {
+        "available": list(AVAILABLE_OUTPUT_FORMATS),
+        "default": "wav",
+        "sample_rates": list(OUTPUT_SAMPLE_RATES),
+        "stats": format_stats.stats(),
+    }
+
+def _next_stream_chunk(gen):
+    """Advances the XTTS stream generator by one chunk (runs in a worker thread)."""
+    # inference_mode/autocast are thread-local, so they are entered per step
+    with torch.inference_mode():
+        with autocast_context():
+            chunk = next(gen, None)
+    if chunk is None:
+        return None
+    return torch.as_tensor(chunk).float().cpu().reshape(-1).numpy()
+
+# ==============================
+# Text segmentation + segment stitching
+# ==============================
+# Long messages are split into sentences (English . ! ?, Hindi danda । ॥ and the
+# ASCII stand-in |), each under the tokenizer's per-language char limit, and the
+# segments are synthesized as a pipeline and joined with short crossfades.
+SEGMENT_MIN_CHARS = int(os.environ.get("SEGMENT_MIN_CHARS", 24))
+SEGMENT_CROSSFADE_MS = float(os.environ.get("SEGMENT_CROSSFADE_MS", 10))
+SEGMENT_GAP_MS = float(os.environ.get("SEGMENT_GAP_MS", 120))
+# Used until the model is loaded; load_xtts_model adds "hi": 200 to the real tokenizer
+DEFAULT_CHAR_LIMITS = {"en": 250, "hi": 200}
+
+_SENTENCE_BREAK = re.compile(r"[.!?]+[\"')\]]*(?=\s|$)|[।॥|]+")
+_CLAUSE_BREAK = re.compile(r"(?<=[,;:])\s+|\s+(?=[—–-]\s)")
+_ABBREVIATIONS = {"mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "vs", "etc", "approx"}
+# only abbreviations when a number follows ("No. 5"); "I said no. Then..." ends a sentence
+_NUMBER_ABBREVIATIONS = {"no", "nos"}
+_NUMBER_FOLLOWS = re.compile(r"\s*#?\d")
+
+def text_char_limit(language: str):
+    try:
+        limit = tts.synthesizer.tts_model.tokenizer.char_limits.get(language)
+    except AttributeError:
+        limit = None
+    return limit or DEFAULT_CHAR_LIMITS.get(language, 250)
+
+def sentence_ends(text: str):
+    """Offsets just past each sentence-ending punctuation run in text."""
+    start = 0
+    for m in _SENTENCE_BREAK.finditer(text):
+        if m.group()[0] == ".":
+            before = text[start:m.start()].split()
+            word = before[-1].lower().lstrip("(\"'") if before else ""
+            # "Dr. Rao", "J. Smith", "e.g. this", "5 p.m. today", "No. 5" do not end a sentence
+            if word in _ABBREVIATIONS or "." in word or (len(word) == 1 and word.isalpha()):
+                continue
+            if word in _NUMBER_ABBREVIATIONS and _NUMBER_FOLLOWS.match(text, m.end()):
+                continue
+        yield m.end()
+        start = m.end()
+
+def split_sentences(text: str):
+    sentences, start = [], 0
+    for end in sentence_ends(text):
+        piece = text[start:end].strip()
+        if piece:
+            sentences.append(piece)
+        start = end
+    tail = text[start:].strip()
+    if tail:
+        sentences.append(tail)
+    return sentences
+
+def _pack(pieces, limit, sep=" "):
+    """Greedily joins pieces into chunks of at most limit chars."""
+    out, cur = [], ""
+    for p in pieces:
+        if cur and len(cur) + len(sep) + len(p) > limit:
+            out.append(cur)
+            cur = p
+        else:
+            cur = f"{cur}{sep}{p}" if cur else p
+    if cur:
+        out.append(cur)
+    return out
+
+def _split_long(sentence: str, limit: int):
+    if len(sentence) <= limit:
+        return [sentence]
+    out = []
+    for clause in _pack(_CLAUSE_BREAK.split(sentence), limit):
+        if len(clause) <= limit:
+            out.append(clause)
+            continue
+        words = []
+        for w in clause.split():
+            words.extend(w[i:i + limit] for i in range(0, len(w), limit))
+        out.extend(_pack(words, limit))
+    return out
+
+def segment_text(text: str, language: str):
+    """Sentence segments of at most the language's char limit; very short ones ride along with a neighbour."""
+    limit = text_char_limit(language)
+    pieces = [p for s in split_sentences(" ".join(text.split())) for p in _split_long(s, limit)]
+    segments = []
+    for p in pieces:
+        if segments and len(segments[-1]) < SEGMENT_MIN_CHARS and len(segments[-1]) + 1 + len(p) <= limit:
+            segments[-1] = f"{segments[-1]} {p}"
+        else:
+            segments.append(p)
+    if len(segments) > 1 and len(segments[-1]) < SEGMENT_MIN_CHARS and len(segments[-2]) + 1 + len(segments[-1]) <= limit:
+        segments[-2:] = [f"{segments[-2]} {segments[-1]}"]
+    return segments or [text]
+
+class SegmentStitcher:
+    """
+    Joins consecutive segments' audio without clicks. The last crossfade_ms of each
+    segment is held back; at the next boundary it fades out (raised cosine) while the
+    new segment fades in, either overlapped (gap_ms=0, for untrimmed stream audio
+    that keeps its own pauses) or with gap_ms of silence between (trimmed segments).
+    """
+    def __init__(self, sr: int, crossfade_ms=SEGMENT_CROSSFADE_MS, gap_ms=0.0):
+        self.xf = max(1, int(sr * crossfade_ms / 1000))
+        self.gap = np.zeros(int(sr * gap_ms / 1000), dtype=np.float32)
+        self._tail = np.zeros(0, dtype=np.float32)
+        self._at_boundary = False
+        self._started = False
+
+    def boundary(self):
+        """The next add() starts a new segment."""
+        self._at_boundary = self._started
+
+    def add(self, x: np.ndarray):
+        x = np.asarray(x, dtype=np.float32).reshape(-1)
+        if len(x) == 0:
+            return x
+        self._started = True
+        if self._at_boundary:
+            self._at_boundary = False
+            tail, self._tail = self._tail, np.zeros(0, dtype=np.float32)
+            n = min(len(tail), len(x), self.xf)
+            t = (np.arange(n, dtype=np.float32) + 0.5) / n
+            fade_in = np.sin(0.5 * np.pi * t) ** 2
+            fade_out = 1.0 - fade_in
+            tail = tail.copy()
+            tail[len(tail) - n:] *= fade_out
+            head = x[:n] * fade_in
+            if len(self.gap):
+                x = np.concatenate([tail, self.gap, head, x[n:]])
+            else:
+                tail[len(tail) - n:] += head
+                x = np.concatenate([tail, x[n:]])
+        else:
+            x = np.concatenate([self._tail, x])
+        keep = min(self.xf, len(x))
+        self._tail = x[len(x) - keep:]
+        return x[:len(x) - keep]
+
+    def finish(self):
+        tail, self._tail = self._tail, np.zeros(0, dtype=np.float32)
+        return tail
+
+# ==============================
+# Micro-batching inference scheduler
+# ==============================
+def run_inference_job(text, language, gpt_latent, speaker_latent, params):
+    """One XTTS forward pass + trim/peak post-processing. Caller holds the model."""
+    with span("inference"):
+        out = tts.synthesizer.tts_model.inference(
+            text=text,
+            language=language,
+            gpt_cond_latent=gpt_latent,
+            speaker_embedding=speaker_latent,
+            **params
+        )
+
+        wav_tensor = torch.as_tensor(out["wav"])
+        if wav_tensor.dim() == 1:
+            wav_tensor = wav_tensor.unsqueeze(0)
+        if DEVICE == "cuda":
+            wav_tensor = wav_tensor.cpu()
+        wav_np = wav_tensor.squeeze(0).float().numpy()
+
+    with span("trim_silence"):
+        wav_np = trim_silence(wav_np, SAMPLE_RATE)
+
+    with span("normalize"):
+        peak = np.max(np.abs(wav_np)) + 1e-9
+        if peak > 1.0:
+            wav_np = wav_np / peak
+    return wav_np
+
+def run_inference_batch(jobs, on_result=None):
+    """
+    Runs one micro-batch (same language + sampling params) under a single
+    inference_mode/autocast context. XTTS 0.22 only exposes single-sequence
+    generation (its GPT prefix embedding has no padding mask), so the jobs of a
+    batch are run back-to-back in one executor call rather than stacked.
+    Returns one (wav, exception) pair per job; on_result(job, wav, exc) is also
+    called as each job finishes, so callers can use a segment while the next runs.
+    """
+    results = []
+    with torch.inference_mode():
+        with autocast_context():
+            for job in jobs:
+                if job.future.cancelled():
+                    results.append((None, None))
+                    continue
+                if deadline_expired(job.deadline):
+                    # expired while earlier jobs of the batch ran
+                    results.append((None, DeadlineExceeded()))
+                    if on_result is not None:
+                        on_result(job, *results[-1])
+                    continue
+                # spans of this job go to the trace of the request that submitted it
+                token = _current_trace.set(job.trace)
+                try:
+                    results.append((run_inference_job(job.text, job.language, job.gpt_latent, job.speaker_latent, job.params), None))
+                except Exception as e:
+                    traceback.print_exc()
+                    results.append((None, e))
+                finally:
+                    _current_trace.reset(token)
+                if on_result is not None:
+                    on_result(job, *results[-1])
+    return results
+
+class InferenceJob:
+    __slots__ = ("text", "language", "gpt_latent", "speaker_latent", "params", "priority", "deadline",
+                 "group", "future", "enqueued_at", "trace")
+
+    def __init__(self, text, language, gpt_latent, speaker_latent, params, future, priority=0, deadline=None):
+        self.text = text
+        self.language = language
+        self.gpt_latent = gpt_latent
+        self.speaker_latent = speaker_latent
+        self.params = params
+        self.priority = priority
+        self.deadline = deadline
+        # Only requests with the same priority, language and sampling settings share a batch
+        self.group = (priority, language, tuple(sorted(params.items())))
+        self.future = future
+        self.enqueued_at = time.monotonic()
+        self.trace = _current_trace.get()
+
+class BatchScheduler:
+    """
+    Takes the queued /synthesize jobs (up to max_batch), groups them by priority +
+    language + sampling params and runs each group back to back in one executor call
+    while holding inference_lock (see run_inference_batch: nothing is stacked yet).
+    Jobs that arrive meanwhile form the next batch. The queue is ordered by priority
+    class, so interactive jobs overtake queued batch/background ones, and jobs past
+    their deadline are failed unrun. A window_s > 0 also waits that long for more
+    jobs; that only pays off once batches run as one forward pass, so it is opt-in.
+    """
+    def __init__(self, window_s: float, max_batch: int):
+        self.window_s = window_s
+        self.max_batch = max_batch
+        self._loop = None
+        self._queue = None
+        self._task = None
+        self._seq = itertools.count()
+        self.batches = 0
+        self.jobs = 0
+        self.expired = 0
+        self.max_batch_seen = 0
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # first use, or the app is now served from a different event loop
+            self._loop = loop
+            self._queue = asyncio.PriorityQueue()
+            self._task = None
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._run())
+
+    async def submit(self, text, language, gpt_latent, speaker_latent, params, priority=0, deadline=None):
+        """Waits for the job's batch and returns the post-processed waveform."""
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        job = InferenceJob(text, language, gpt_latent, speaker_latent, params, future, priority, deadline)
+        await self._queue.put((priority, next(self._seq), job))
+        return await future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        batch = [(await self._queue.get())[-1]]
+        if self.window_s <= 0:
+            # only what is already queued, so a lone request is not held back
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait()[-1])
+            return batch
+        deadline = loop.time() + self.window_s
+        while len(batch) < self.max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append((await asyncio.wait_for(self._queue.get(), timeout))[-1])
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            groups = OrderedDict()
+            for job in batch:
+                groups.setdefault(job.group, []).append(job)
+            for group in sorted(groups, key=lambda g: g[0]):
+                jobs = []
+                for job in groups[group]:
+                    if job.future.done():
+                        continue  # cancelled: its client is gone
+                    if deadline_expired(job.deadline):
+                        self.expired += 1
+                        job.future.set_exception(DeadlineExceeded())
+                        continue
+                    jobs.append(job)
+                if not jobs:
+                    continue
+                on_result = lambda job, wav, err: loop.call_soon_threadsafe(self._resolve, job, wav, err)
+                try:
+                    async with inference_lock.hold(group[0]):
+                        now = time.monotonic()
+                        for job in jobs:
+                            admission.record_wait(job.priority, now - job.enqueued_at)
+                            if job.trace is not None:
+                                job.trace.add("lock_wait", now - job.enqueued_at)
+                        results = await loop.run_in_executor(model_executor, run_inference_batch, jobs, on_result)
+                except Exception as e:
+                    results = [(None, e)] * len(jobs)
+                self.batches += 1
+                self.jobs += len(jobs)
+                self.max_batch_seen = max(self.max_batch_seen, len(jobs))
+                for job, (wav, err) in zip(jobs, results):
+                    self._resolve(job, wav, err)
+
+    @staticmethod
+    def _resolve(job, wav, err):
+        if job.future.done():
+            return
+        if err is not None:
+            job.future.set_exception(err)
+        else:
+            job.future.set_result(wav)
+
+    def stats(self):
+        return {
+            "window_ms": self.window_s * 1000,
+            "max_batch": self.max_batch,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "batches": self.batches,
+            "jobs": self.jobs,
+            "expired": self.expired,
+            "mean_batch_size": (self.jobs / self.batches) if self.batches else 0.0,
+            "max_batch_seen": self.max_batch_seen,
+        }
+
+batch_scheduler = BatchScheduler(
+    # no waiting by default: run_inference_batch runs a batch's jobs one by one
+    window_s=float(os.environ.get("BATCH_WINDOW_MS", 0)) / 1000.0,
+    max_batch=int(os.environ.get("BATCH_MAX_SIZE", 8)),
+)
+
+@app.get("/admission/stats")
+async def admission_stats():
+    """Queue depth, outcomes and queue wait percentiles per priority class, plus model lock waiters."""
+    return {
+        "classes": admission.stats(),
+        "inference_lock": inference_lock.stats(),
+        "scheduler_queued": batch_scheduler.stats()["queued"],
+    }
+
+@app.get("/scheduler/stats")
+async def scheduler_stats():
+    return batch_scheduler.stats()
+
+# ==============================
+# Multi-replica CPU inference pool
+# ==============================
+# On GPU-less nodes one XTTS instance is the throughput ceiling. With REPLICAS=N
+# the parent loads the model once and forks N workers that share its weights
+# (moved to shared memory, so no copy-on-write faults either). Each worker pins
+# its own torch thread share and keeps its own latent cache, and requests are
+# routed by consistent hashing on the speaker path so a speaker stays warm in
+# one replica. A replica that dies is not re-forked: by then the parent runs
+# request threads whose locks (single-flight entries, registry, metrics, torch
+# pools) a fork would inherit mid-use. Its speakers move to the others, and
+# with none left synthesis falls back to the parent's own model. The parent
+# keeps each replica's queue and hands it one job at a time, interactive first,
+# so priority classes hold across replicas as they do for the in-process model.
+REPLICAS = int(os.environ.get("REPLICAS", 0))
+REPLICA_THREADS = int(os.environ.get("REPLICA_THREADS", 0))  # 0 = cpu_count // REPLICAS
+
+class HashRing:
+    def __init__(self, nodes, vnodes=64):
+        self._ring = sorted(
+            (int(hashlib.md5(f"{node}#{v}".encode()).hexdigest()[:16], 16), node)
+            for node in nodes for v in range(vnodes)
+        )
+        self._keys = [h for h, _ in self._ring]
+
+    def lookup(self, key: str):
+        h = int(hashlib.md5(key.encode()).hexdigest()[:16], 16)
+        i = bisect.bisect(self._keys, h) % len(self._ring)
+        return self._ring[i][1]
+
+def _replica_main(index, num_threads, requests, responses):
+    """Worker process loop. Runs in a fork of the parent, so tts is already loaded."""
+    global speaker_cache
+    torch.set_num_threads(num_threads)
+    # fresh cache: the inherited one may have been mid-update in another parent thread
+    speaker_cache = SpeakerCache(
+        max_bytes=int(float(os.environ.get("SPEAKER_CACHE_MB", 256)) * 1024 * 1024),
+        ttl_s=float(os.environ.get("SPEAKER_CACHE_TTL_S", 0)),
+    )
+    print(f"🧵 Replica {index} up (pid {os.getpid()}, {num_threads} threads)")
+    warmup_model()
+    while True:
+        msg = requests.get()
+        if msg is None:
+            break
+        if msg[0] == "invalidate":
+            speaker_cache.pop(msg[1])
+            continue
+        _, job_id, text, language, path, params, deadline = msg
+        if deadline_expired(deadline):
+            # CLOCK_MONOTONIC is system-wide, so the parent's deadline holds here
+            responses.put((job_id, None, "DeadlineExceeded"))
+            continue
+        try:
+            gpt_latent, speaker_latent = get_speaker_latents(path)
+            with torch.inference_mode():
+                wav = run_inference_job(text, language, gpt_latent, speaker_latent, params)
+            responses.put((job_id, wav, None))
+        except Exception as e:
+            traceback.print_exc()
+            responses.put((job_id, None, f"{type(e).__name__}: {e}"))
+
+class ReplicaPool:
+    def __init__(self, num_replicas: int, threads_per_replica: int):
+        self._ctx = multiprocessing.get_context("fork")
+        self.num_replicas = num_replicas
+        self.threads_per_replica = threads_per_replica
+        self._responses = self._ctx.Queue()
+        self._requests = [None] * num_replicas
+        self._procs = [None] * num_replicas
+        self._ring = HashRing(range(num_replicas))
+        self._pending = {}  # job_id -> (loop, future, replica index)
+        self._queued = [[] for _ in range(num_replicas)]  # heaps of (priority, job_id, msg, enqueued_at, trace)
+        self._running = [None] * num_replicas  # job_id a replica is working on
+        self._lock = threading.Lock()
+        self._job_ids = itertools.count()
+        self.jobs = [0] * num_replicas
+        self.failed = set()
+        for i in range(num_replicas):
+            self._spawn(i)
+        self._reader = threading.Thread(target=self._read_responses, name="replica-reader", daemon=True)
+        self._reader.start()
+
+    def _spawn(self, index):
+        self._requests[index] = self._ctx.Queue()
+        proc = self._ctx.Process(
+            target=_replica_main,
+            args=(index, self.threads_per_replica, self._requests[index], self._responses),
+            daemon=True,
+        )
+        proc.start()
+        self._procs[index] = proc
+
+    def _dispatch(self, index):
+        """Sends the replica its next job, by priority class then arrival, once it is idle. Lock held."""
+        heap = self._queued[index]
+        while self._running[index] is None and heap:
+            priority, job_id, msg, enqueued_at, trace = heapq.heappop(heap)
+            if job_id not in self._pending:
+                continue  # cancelled while queued
+            wait = time.monotonic() - enqueued_at
+            admission.record_wait(priority, wait)
+            if trace is not None:
+                trace.add("lock_wait", wait)
+            self._running[index] = job_id
+            self._requests[index].put(msg)
+
+    def _resolve(self, job_id, wav, err):
+        with self._lock:
+            entry = self._pending.pop(job_id, None)
+            if job_id in self._running:
+                index = self._running.index(job_id)
+                self._running[index] = None
+                self._dispatch(index)
+        if entry is None:
+            return
+        loop, future, _ = entry
+
+        def _set():
+            if future.done():
+                return
+            if err == "DeadlineExceeded":
+                future.set_exception(DeadlineExceeded())
+            elif err is not None:
+                future.set_exception(RuntimeError(f"Replica error: {err}"))
+            else:
+                future.set_result(wav)
+        loop.call_soon_threadsafe(_set)
+
+    def _read_responses(self):
+        while True:
+            try:
+                job_id, wav, err = self._responses.get(timeout=1.0)
+            except queue.Empty:
+                self._check_replicas()
+                continue
+            except (EOFError, OSError):
+                return
+            self._resolve(job_id, wav, err)
+
+    def _check_replicas(self):
+        for i, proc in enumerate(self._procs):
+            if i in self.failed or proc.is_alive():
+                continue
+            print(f"❌ Replica {i} exited (code {proc.exitcode}), routing its speakers to the others")
+            with self._lock:
+                self.failed.add(i)
+                live = [r for r in range(self.num_replicas) if r not in self.failed]
+                self._ring = HashRing(live) if live else None
+                self._queued[i] = []
+                self._running[i] = None
+                lost = [job_id for job_id, (_, _, idx) in self._pending.items() if idx == i]
+            for job_id in lost:
+                self._resolve(job_id, None, f"replica {i} died")
+
+    @property
+    def available(self):
+        return self._ring is not None
+
+    def replica_for(self, speaker_path: str):
+        return self._ring.lookup(speaker_path)
+
+    async def submit(self, speaker_path, text, language, params, priority=0, deadline=None):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        job_id = next(self._job_ids)
+        with self._lock:
+            # under the lock, so a replica failing meanwhile either gets this job or never sees it
+            if self._ring is None:
+                raise RuntimeError("All replicas have exited")
+            index = self.replica_for(speaker_path)
+            self._pending[job_id] = (loop, future, index)
+            msg = ("synth", job_id, text, language, speaker_path, params, deadline)
+            heapq.heappush(self._queued[index], (priority, job_id, msg, time.monotonic(), _current_trace.get()))
+            self._dispatch(index)
+        self.jobs[index] += 1
+        try:
+            return await future
+        finally:
+            with self._lock:
+                self._pending.pop(job_id, None)
+
+    def invalidate(self, speaker_path: str):
+        if self.available:
+            self._requests[self.replica_for(speaker_path)].put(("invalidate", speaker_path))
+
+    def shutdown(self):
+        for q in self._requests:
+            q.put(None)
+        for proc in self._procs:
+            proc.join(timeout=5)
+
+    def stats(self):
+        with self._lock:
+            pending = [0] * self.num_replicas
+            for _, _, idx in self._pending.values():
+                pending[idx] += 1
+        return {
+            "replicas": self.num_replicas,
+            "threads_per_replica": self.threads_per_replica,
+            "alive": [p.is_alive() for p in self._procs],
+            "pending": pending,
+            "jobs": self.jobs,
+            "failed": sorted(self.failed),
+        }
+
+replica_pool = None
+
+def start_replica_pool():
+    global replica_pool
+    if DEVICE != "cpu":
+        print("⚠️ REPLICAS is only used on CPU nodes, ignoring it on", DEVICE)
+        return
+    threads = REPLICA_THREADS or max(1, (os.cpu_count() or 1) // REPLICAS)
+    try:
+        tts.synthesizer.tts_model.share_memory()
     except Exception as e:
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=str(e))
+        print(f"⚠️ Could not move weights to shared memory, relying on copy-on-write: {e}")
+    print(f"⏳ Starting {REPLICAS} CPU replicas ({threads} threads each)...")
+    replica_pool = ReplicaPool(REPLICAS, threads)
+
+@app.get("/replicas/stats")
+async def replicas_stats():
+    if replica_pool is None:
+        return {"replicas": 0}
+    return replica_pool.stats()
 
 # ==============================
 # Synthesis endpoint (fast, in-memory)
 # ==============================
+async def segment_submitter(target_speaker, language, params, priority=0, deadline=None):
+    """
+    Returns submit(segment_text) -> awaitable waveform for one speaker/language/params
+    (priority and deadline can be overridden per call).
+    """
+    if replica_pool is not None and replica_pool.available:
+        # The owning replica resolves latents from its own cache
+        return lambda seg, priority=priority, deadline=deadline: replica_pool.submit(
+            target_speaker, seg, language, params, priority, deadline)
+    # Get cached latents (may encode on a miss, so it runs on the model pool)
+    with span("latents"):
+        gpt_latent, speaker_latent = await run_model(get_speaker_latents, target_speaker)
+    return lambda seg, priority=priority, deadline=deadline: batch_scheduler.submit(
+        seg, language, gpt_latent, speaker_latent, params, priority, deadline)
+
+async def synthesize_segments(submit, segments, sample_rate, fmt, channels):
+    """
+    Submits every segment at once (the scheduler batches them, replicas queue them)
+    and stitches + resamples + encodes each one as soon as it and its predecessors
+    are done, while the model is still generating the following segments.
+    Returns the closed AudioEncoder.
+    """
+    tasks = [asyncio.ensure_future(submit(seg)) for seg in segments]
+    stitcher = SegmentStitcher(SAMPLE_RATE, gap_ms=SEGMENT_GAP_MS)
+    resampler = StreamingResampler(SAMPLE_RATE, sample_rate)
+    enc = AudioEncoder(fmt, sample_rate, channels)
+    enc.encode(np.zeros(0, dtype=np.float32))
+    try:
+        for task in tasks:
+            wav_np = await task
+            with span("resample"):
+                stitcher.boundary()
+                out = resampler.process(stitcher.add(wav_np))
+            with span("encode"):
+                await asyncio.to_thread(enc.encode, out)
+        with span("resample"):
+            out = np.concatenate([resampler.process(stitcher.finish()), resampler.flush()])
+        with span("encode"):
+            await asyncio.to_thread(lambda: (enc.encode(out), enc.close()))
+    finally:
+        for task in tasks:
+            task.cancel()
+    return enc
+
 @app.post("/synthesize")
 async def synthesize(
+    request: Request,
     text: str = Form(...),
     language: str = Form(...),
-    user_id: str = Form("default")
+    user_id: str = Form("default"),
+    sample_rate: int = Form(SAMPLE_RATE),
+    format: str = Form(None),
+    channels: int = Form(1),
+    priority: str = Form("interactive"),
+    deadline_ms: float = Form(None),
+    accept: str = Header(None)
 ):
+    check_output_rate(sample_rate)
+    fmt = negotiate_format(format, accept)
+    check_output_format(fmt, sample_rate, channels)
+    media_type = output_media_type(fmt, sample_rate, channels)
+    with traced("synthesize") as trace:
+        try:
+            with span("resolve_speaker"):
+                target_speaker = resolve_speaker(user_id, language)
+                speaker_hash = await resolve_speaker_hash(target_speaker)
+            print(f"🗣 Synthesizing: \"{text}\" ({language}) using {target_speaker}")
+
+            text = prepare_text(text, language)
+            params = sampling_params(language, target_speaker)
+
+            # Repeated phrases are served from the audio cache without touching the model
+            with span("audio_cache"):
+                cache_key = audio_cache_key(text, language, speaker_hash, params, sample_rate, fmt, channels)
+                cached = audio_cache.get(cache_key)
+            if cached is not None:
+                print("⚡ Audio cache hit")
+                trace.outcome = "hit"
+                return Response(content=cached, media_type=media_type,
+                                headers={"X-Cache": "HIT", "Server-Timing": trace.server_timing()})
+
+            require_model()
+
+            async def render():
+                t0 = time.perf_counter()
+                segments = [prepare_text(seg, language) for seg in segment_text(text, language)]
+                submit = await segment_submitter(target_speaker, language, params, ticket.priority, ticket.deadline)
+                enc = await synthesize_segments(submit, segments, sample_rate, fmt, channels)
+                record_render("synthesize", time.perf_counter() - t0, enc.samples / sample_rate)
+                format_stats.record(enc)
+                audio_cache.put(cache_key, speaker_hash, enc.getvalue())
+                return enc
+
+            with admission.admit(priority, deadline_ms) as ticket:
+                # Identical requests already rendering are joined (same fingerprint as the cache)
+                enc, shared = await run_until_disconnected(request, synthesis_flight.do(cache_key, render))
+            trace.outcome = "shared" if shared else "miss"
+            audio_bytes = enc.getvalue()
+            print(f"⏱ {json.dumps(trace.to_dict())}")
+            return Response(content=audio_bytes, media_type=media_type,
+                            headers={"X-Cache": "SHARED" if shared else "MISS", "Server-Timing": trace.server_timing()})
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            traceback.print_exc()
+            log_error("synthesize")
+            raise HTTPException(status_code=500, detail=f"TTS Error: {e}")
+
+# ==============================
+# Batch synthesis (offline voice packs)
+# ==============================
+# Pre-rendering many prompts for one voice: the speaker and latents are resolved
+# once per language, items share the micro-batcher (at most BATCH_SYNTH_CONCURRENCY
+# in flight, so live requests still get a turn) and each result is streamed back as
+# a tar member the moment it is encoded. A manifest.json member comes last.
+BATCH_SYNTH_MAX_ITEMS = int(os.environ.get("BATCH_SYNTH_MAX_ITEMS", 1000))
+BATCH_SYNTH_CONCURRENCY = int(os.environ.get("BATCH_SYNTH_CONCURRENCY", 16))
+
+_BATCH_ITEM_NAME = re.compile(r"[\w-][\w.-]{0,99}")
+
+def tar_member(name: str, data: bytes, mtime=None):
+    """One ustar/pax member (header + data + padding), so the archive can be streamed."""
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = int(mtime if mtime is not None else time.time())
+    info.mode = 0o644
+    pad = -len(data) % tarfile.BLOCKSIZE
+    return info.tobuf(format=tarfile.PAX_FORMAT) + data + b"\0" * pad
+
+def tar_end():
+    return b"\0" * (2 * tarfile.BLOCKSIZE)
+
+def parse_batch_items(items: str):
     try:
-        # Look in user folder first
-        user_dir = f"speakers/{user_id}"
-        preferred = f"{user_dir}/{language}.wav"
-        fallback_lang = "hi" if language == "en" else "en"
-        fallback = f"{user_dir}/{fallback_lang}.wav"
-
-        # Also check legacy path for backward compatibility
-        legacy_preferred = f"speakers/{user_id}_{language}.wav"
-
-        if os.path.exists(preferred):
-            target_speaker = preferred
-        elif os.path.exists(fallback):
-            print(f"⚠️ Missing {preferred}, using fallback voice {fallback}")
-            target_speaker = fallback
-        elif os.path.exists(legacy_preferred):
-             target_speaker = legacy_preferred
-        else:
-            # Fallback to any available speaker
-            files = glob.glob("speakers/**/*.wav", recursive=True)
-            if not files:
-                raise HTTPException(status_code=404, detail="No speaker found.")
-            target_speaker = files[0]
+        parsed = json.loads(items)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="items must be a JSON list of {text, language} objects")
+    if not isinstance(parsed, list) or not parsed:
+        raise HTTPException(status_code=400, detail="items must be a non-empty JSON list")
+    if len(parsed) > BATCH_SYNTH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"at most {BATCH_SYNTH_MAX_ITEMS} items per batch")
+    out = []
+    for i, item in enumerate(parsed):
+        if not isinstance(item, dict) or not isinstance(item.get("text"), str) or not item["text"].strip():
+            raise HTTPException(status_code=400, detail=f"item {i} needs a non-empty text")
+        language = item.get("language", "en")
+        if not isinstance(language, str):
+            raise HTTPException(status_code=400, detail=f"item {i} has an invalid language")
+        name = item.get("name")
+        if name is not None and not (isinstance(name, str) and _BATCH_ITEM_NAME.fullmatch(name)):
+            raise HTTPException(status_code=400, detail=f"item {i} name may only use letters, digits, '.', '_' and '-'")
+        out.append((item["text"], language, name))
+    names = [name for _, _, name in out if name is not None]
+    if len(set(names)) != len(names):
+        raise HTTPException(status_code=400, detail="item names must be unique")
+    return out
 
-        print(f"🗣 Synthesizing: \"{text}\" ({language}) using {target_speaker}")
-        
-        # Force punctuation for Hindi
-        if language == "hi" and not text.strip().endswith(("|", ".", "!", "?")):
-            text += " ."
+@app.post("/synthesize_batch")
+async def synthesize_batch(
+    items: str = Form(...),
+    user_id: str = Form("default"),
+    sample_rate: int = Form(SAMPLE_RATE),
+    format: str = Form(None),
+    channels: int = Form(1),
+    deadline_ms: float = Form(None),
+    accept: str = Header(None)
+):
+    """
+    items is a JSON list of {"text", "language", optional "name"}. Returns a tar
+    stream: one audio file per successful item, in completion order, named
+    <index>.<ext> (or <name>.<ext>), then manifest.json with per-item status
+    (failed items carry their error instead of aborting the batch) and throughput.
+    Runs in the "batch" priority class, behind interactive synthesis.
+    """
+    check_output_rate(sample_rate)
+    # tar members are whole files, and an Accept of audio/* describes the members
+    fmt = negotiate_format(format, accept)
+    if fmt == "pcm":
+        raise HTTPException(status_code=400, detail="pcm has no header to tell files apart; use wav")
+    check_output_format(fmt, sample_rate, channels)
+    parsed = parse_batch_items(items)
+    require_model()
+    speakers = {lang: resolve_speaker(user_id, lang) for _, lang, _ in parsed}
+    ticket = admission.admit("batch", deadline_ms)
 
-        # Detect cross-lingual
-        is_cross_lingual = (language == "hi" and "en" in target_speaker) or (language == "en" and "hi" in target_speaker)
-        
-        # Get cached latents
-        gpt_latent, speaker_latent = get_speaker_latents(target_speaker)
+    # Speaker, params and latents once per language instead of once per item
+    voices = {}
+    try:
+        for language, target_speaker in speakers.items():
+            params = sampling_params(language, target_speaker)
+            voices[language] = (
+                target_speaker,
+                params,
+                await resolve_speaker_hash(target_speaker),
+                await segment_submitter(target_speaker, language, params, ticket.priority, ticket.deadline),
+            )
+    except BaseException as e:
+        ticket.finish(e)
+        raise
+    print(f"📦 Batch: {len(parsed)} items for {user_id} ({', '.join(voices)})")
 
-        sample_rate = 24000
-        async with inference_lock:
-            with torch.inference_mode():
-                if DEVICE == "cuda":
-                    autocast_ctx = torch.cuda.amp.autocast()
+    ext = "ogg" if fmt == "opus" else fmt
+    slots = asyncio.Semaphore(BATCH_SYNTH_CONCURRENCY)
+
+    async def render(index, text, language, name):
+        target_speaker, params, speaker_hash, submit = voices[language]
+        entry = {"index": index, "language": language, "file": f"{name or f'{index:04d}'}.{ext}"}
+        t0 = time.perf_counter()
+        with traced("synthesize_batch_item") as trace:
+            try:
+                text = prepare_text(text, language)
+                with span("audio_cache"):
+                    cache_key = audio_cache_key(text, language, speaker_hash, params, sample_rate, fmt, channels)
+                    audio_bytes = audio_cache.get(cache_key)
+                entry["cached"] = audio_bytes is not None
+                if audio_bytes is None:
+                    async def work():
+                        async with slots:
+                            t_render = time.perf_counter()
+                            segments = [prepare_text(seg, language) for seg in segment_text(text, language)]
+                            enc = await synthesize_segments(submit, segments, sample_rate, fmt, channels)
+                        record_render("synthesize_batch", time.perf_counter() - t_render, enc.samples / sample_rate)
+                        format_stats.record(enc)
+                        audio_cache.put(cache_key, speaker_hash, enc.getvalue())
+                        return enc
+                    # duplicate prompts (in this batch or live right now) render once
+                    enc, entry["shared"] = await synthesis_flight.do(cache_key, work)
+                    audio_bytes = enc.getvalue()
+                    entry["audio_s"] = round(enc.samples / sample_rate, 3)
+                entry["bytes"] = len(audio_bytes)
+                entry["status"] = "ok"
+                trace.outcome = "hit" if entry["cached"] else "shared" if entry["shared"] else "miss"
+            except Exception as e:
+                traceback.print_exc()
+                audio_bytes = None
+                entry.pop("file")
+                entry["status"] = "failed"
+                entry["error"] = str(e.detail) if isinstance(e, HTTPException) else f"{type(e).__name__}: {e}"
+                trace.outcome = "error"
+        entry["elapsed_s"] = round(time.perf_counter() - t0, 3)
+        return entry, audio_bytes
+
+    async def archive():
+        t_start = time.perf_counter()
+        tasks = [asyncio.ensure_future(render(i, *item)) for i, item in enumerate(parsed)]
+        entries = []
+        error = None
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                entry, audio_bytes = await next_done
+                entries.append(entry)
+                if audio_bytes is not None:
+                    yield tar_member(entry["file"], audio_bytes)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            for task in tasks:
+                task.cancel()
+            ticket.finish(error)
+        elapsed = time.perf_counter() - t_start
+        failed = sum(e["status"] != "ok" for e in entries)
+        manifest = {
+            "user_id": user_id,
+            "format": fmt,
+            "sample_rate": sample_rate,
+            "channels": channels,
+            "items": sorted(entries, key=lambda e: e["index"]),
+            "succeeded": len(entries) - failed,
+            "failed": failed,
+            "elapsed_s": round(elapsed, 3),
+            "items_per_s": round(len(entries) / elapsed, 3) if elapsed > 0 else None,
+        }
+        yield tar_member("manifest.json", json.dumps(manifest, ensure_ascii=False, indent=1).encode("utf-8"))
+        yield tar_end()
+        print(f"⏱ Batch done: {len(entries)} items ({failed} failed) in {elapsed:.2f}s, {manifest['items_per_s']} items/s")
+
+    return GuardedStreamingResponse(
+        archive(),
+        # a finished archive has already left the queue; this covers one that never started
+        on_close=lambda: ticket.finish(ClientDisconnected()),
+        media_type="application/x-tar",
+        headers={"Cache-Control": "no-store", "Content-Disposition": f'attachment; filename="voicepack_{user_id}.tar"'},
+    )
+
+# ==============================
+# Streaming synthesis endpoint (chunked HTTP)
+# ==============================
+@app.post("/synthesize_stream")
+async def synthesize_stream(
+    text: str = Form(...),
+    language: str = Form(...),
+    user_id: str = Form("default"),
+    format: str = Form(None),
+    stream_chunk_size: int = Form(20),
+    sample_rate: int = Form(SAMPLE_RATE),
+    channels: int = Form(1),
+    priority: str = Form("interactive"),
+    deadline_ms: float = Form(None),
+    accept: str = Header(None)
+):
+    """
+    Same voice/tuning as /synthesize, but audio is sent as XTTS decodes it. Text is
+    split into sentence segments; a producer task generates segment after segment
+    while this generator post-processes and sends, joined with short crossfades.
+    The format (wav, pcm, flac, ogg, opus) comes from the form or the Accept header:
+    wav sends a streaming WAV header first, pcm sends raw PCM16, flac/ogg/opus are
+    encoded incrementally as chunks arrive. Audio is rendered at 24k and resampled
+    chunk by chunk to sample_rate. Time-to-first-audio is reported separately from
+    total synthesis time.
+    """
+    check_output_rate(sample_rate)
+    fmt = negotiate_format(format, accept)
+    check_output_format(fmt, sample_rate, channels)
+    media_type = output_media_type(fmt, sample_rate, channels)
+    t_start = time.perf_counter()
+    with traced("synthesize_stream") as trace:
+        try:
+            with span("resolve_speaker"):
+                target_speaker = resolve_speaker(user_id, language)
+                speaker_hash = await resolve_speaker_hash(target_speaker)
+            print(f"🗣 Streaming: \"{text}\" ({language}) using {target_speaker}")
+            text = prepare_text(text, language)
+            params = sampling_params(language, target_speaker)
+            with span("audio_cache"):
+                cache_key = audio_cache_key(text, language, speaker_hash, params, sample_rate, fmt, channels)
+                # raw PCM has no header to tell a cached file apart, so it always streams
+                cached = audio_cache.get(cache_key) if fmt != "pcm" else None
+            if cached is not None:
+                print("⚡ Audio cache hit")
+                trace.outcome = "hit"
+                return Response(content=cached, media_type=media_type, headers={"X-Cache": "HIT"})
+            require_model()
+            segments = [prepare_text(seg, language) for seg in segment_text(text, language)]
+            with span("latents"):
+                gpt_latent, speaker_latent = await run_model(get_speaker_latents, target_speaker)
+            # the deadline covers the wait for the model; a started stream runs to the end.
+            # The model is taken before the response starts, so an expired deadline is a 503
+            # with Retry-After like on the other endpoints rather than a broken body
+            ticket = admission.admit(priority, deadline_ms)
+            t_wait = time.monotonic()
+            try:
+                with span("lock_wait"):
+                    await inference_lock.acquire(ticket.priority, ticket.deadline)
+            except BaseException as e:
+                ticket.finish(e)
+                raise
+            admission.record_wait(ticket.priority, time.monotonic() - t_wait)
+            t_locked = time.perf_counter()
+        except HTTPException:
+            raise
+        except Exception as e:
+            traceback.print_exc()
+            log_error("synthesize_stream")
+            raise HTTPException(status_code=500, detail=f"TTS Error: {e}")
+        # the stream finishes the trace; until it starts, count the request as abandoned
+        trace.deferred = True
+        trace.outcome = "499"
+
+    producer = None
+
+    async def generate(chunks: asyncio.Queue):
+        """Producer: runs the segments through inference_stream back to back, then frees the model."""
+        try:
+            for i, seg in enumerate(segments):
+                gen = tts.synthesizer.tts_model.inference_stream(
+                    seg,
+                    language,
+                    gpt_latent,
+                    speaker_latent,
+                    stream_chunk_size=stream_chunk_size,
+                    **params
+                )
+                model_s = 0.0
+                step = None
+                try:
+                    while True:
+                        t0 = time.perf_counter()
+                        # shielded: cancelling the stream must not abandon a step still running on the model thread
+                        step = asyncio.ensure_future(run_model(_next_stream_chunk, gen))
+                        chunk = await asyncio.shield(step)
+                        model_s += time.perf_counter() - t0
+                        if chunk is None:
+                            break
+                        await chunks.put((i, chunk))
+                finally:
+                    # the generator may only be closed once the model thread has left next(gen),
+                    # and the lock is released only after that
+                    if step is not None and not step.done():
+                        await asyncio.wait({step})
+                    await run_model(gen.close)
+                    trace.add("inference", model_s)
+            await chunks.put(None)
+        finally:
+            inference_lock.release()
+
+    async def audio_chunks():
+        nonlocal producer
+        t_first = None
+        n_samples = 0
+        stitcher = SegmentStitcher(SAMPLE_RATE)
+        post = StreamPostProcessor(SAMPLE_RATE)
+        resampler = StreamingResampler(SAMPLE_RATE, sample_rate)
+        enc = AudioEncoder(fmt, sample_rate, channels)
+        # libsndfile codecs cost real CPU per chunk, so they run off the event loop
+        offload = fmt not in ("wav", "pcm")
+        header = enc.encode(np.zeros(0, dtype=np.float32))
+        if header:
+            yield header
+        # bounded, so a slow client pauses generation instead of buffering the whole utterance
+        chunks = asyncio.Queue(maxsize=8)
+        # from here on the producer owns the model lock
+        producer = asyncio.ensure_future(generate(chunks))
+        segment = 0
+        error = None
+        post_s = encode_s = 0.0
+        try:
+            while True:
+                getter = asyncio.ensure_future(chunks.get())
+                await asyncio.wait({getter, producer}, return_when=asyncio.FIRST_COMPLETED)
+                if not getter.done():
+                    # producer ended without its end marker: it failed
+                    getter.cancel()
+                    producer.result()
+                item = getter.result()
+                if item is None:
+                    break
+                i, chunk = item
+                if i != segment:
+                    segment = i
+                    stitcher.boundary()
+                t0 = time.perf_counter()
+                out = resampler.process(post.process(stitcher.add(chunk)))
+                post_s += time.perf_counter() - t0
+                if len(out) == 0:
+                    continue
+                t0 = time.perf_counter()
+                data = await asyncio.to_thread(enc.encode, out) if offload else enc.encode(out)
+                encode_s += time.perf_counter() - t0
+                if data:
+                    if t_first is None:
+                        t_first = time.perf_counter()
+                    yield data
+            out = np.concatenate([resampler.process(post.process(stitcher.finish())), resampler.flush()])
+            data = enc.encode(out) + enc.close()
+            n_samples = enc.samples
+            if data:
+                if t_first is None:
+                    t_first = time.perf_counter()
+                yield data
+        except Exception as e:
+            error = e
+            trace.outcome = "error"
+            traceback.print_exc()
+            log_error("synthesize_stream")
+            raise
+        except BaseException as e:
+            error = e  # the client went away
+            raise
+        finally:
+            producer.cancel()
+            ticket.finish(error)
+            trace.add("postprocess", post_s)
+            trace.add("encode", encode_s)
+            if error is None:
+                trace.outcome = "miss"
+            trace.finish()
+        t_end = time.perf_counter()
+        format_stats.record(enc)
+        if n_samples and fmt != "pcm":
+            # Only complete streams reach here, so the cached file is the whole utterance
+            audio_cache.put(cache_key, speaker_hash, enc.getvalue())
+        ttfa = (t_first - t_start) if t_first is not None else float("nan")
+        if t_first is not None:
+            first_audio_seconds.observe(ttfa, "synthesize_stream")
+        record_render("synthesize_stream", t_end - t_locked, n_samples / sample_rate)
+        print(
+            f"⏱ Stream done ({fmt}): first audio {ttfa * 1000:.0f} ms (lock wait {(t_locked - t_start) * 1000:.0f} ms), "
+            f"total {(t_end - t_start) * 1000:.0f} ms for {n_samples / sample_rate:.2f}s audio, "
+            f"{enc.bytes_out} bytes, encode CPU {enc.encode_cpu_s * 1000:.1f} ms"
+        )
+
+    def cleanup():
+        # once the producer started it frees the model itself; before that nothing else
+        # will, and the ticket and trace are only still open if the stream never started
+        if producer is None:
+            inference_lock.release()
+        ticket.finish(ClientDisconnected())
+        trace.finish()
+
+    return GuardedStreamingResponse(
+        audio_chunks(),
+        on_close=cleanup,
+        media_type=media_type,
+        headers={"Cache-Control": "no-store"},
+    )
+
+# ==============================
+# Incremental-text synthesis sessions
+# ==============================
+# Live calls produce text a little at a time (partial speech recognition results,
+# then their translation). A session accepts those fragments, synthesizes each
+# stable prefix as soon as it appears (complete sentences, clauses once they are
+# long enough, or whole words once the text outgrows the char limit) and streams
+# the audio on one long-lived response. A fragment that revises text that has not
+# been spoken yet cancels the affected synthesis; spoken text cannot be revised.
+TTS_SESSION_TTL_S = float(os.environ.get("TTS_SESSION_TTL_S", 120))
+TTS_MAX_SESSIONS = int(os.environ.get("TTS_MAX_SESSIONS", 64))
+
+def stable_prefix_end(text: str, start: int, language: str, final=False):
+    """
+    End offset of the part of text[start:] that later fragments should not change.
+    A boundary only counts once something follows it: a trailing "." may still
+    become "p.m." and the last word of a partial transcript is often rewritten.
+    """
+    if final:
+        return len(text)
+    window = text[start:]
+    limit = len(window.rstrip())
+    end = 0
+    for e in sentence_ends(window):
+        if e < limit:
+            end = e
+    for m in _CLAUSE_BREAK.finditer(window):
+        if m.start() >= SEGMENT_MIN_CHARS and m.end() < limit:
+            end = max(end, m.start())
+    char_limit = text_char_limit(language)
+    if limit - end > char_limit:
+        # unpunctuated speech: commit whole words rather than wait for the end of the turn
+        cut = window.rfind(" ", end, end + char_limit)
+        if cut > end:
+            end = cut
+    return start + end
+
+def _common_prefix_len(a: str, b: str):
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+class SessionSpan:
+    """A committed stretch of a session's text and the synthesis tasks of its segments."""
+    __slots__ = ("start", "end", "tasks", "emitted")
+
+    def __init__(self, start, end, tasks):
+        self.start = start
+        self.end = end
+        self.tasks = tasks
+        self.emitted = False  # set once any of its audio was sent; it can no longer be revised
+
+def finish_ticket_when_done(ticket, tasks):
+    """Releases an admission ticket once every task of the work it admitted has ended."""
+    remaining = len(tasks)
+
+    def done(task):
+        nonlocal remaining
+        remaining -= 1
+        if remaining == 0:
+            errors = [asyncio.CancelledError() if t.cancelled() else t.exception() for t in tasks]
+            ticket.finish(next((e for e in errors if e is not None), None))
+
+    for task in tasks:
+        task.add_done_callback(done)
+
+class SpeechSession:
+    """
+    Each newly committed span is admitted like a request of its own (priority class,
+    in-flight cap, deadline for the wait for the model). A span the queue rejects stays
+    uncommitted text: the update answers 429 and the next update, even an empty one,
+    commits it.
+    """
+    def __init__(self, user_id, language, target_speaker, params, sample_rate, fmt, channels, submit,
+                 priority="interactive", deadline_ms=None):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.language = language
+        self.target_speaker = target_speaker
+        self.params = params
+        self.sample_rate = sample_rate
+        self.fmt = fmt
+        self.channels = channels
+        self._submit = submit
+        self.priority = priority
+        self.deadline_ms = deadline_ms
+        self.text = ""
+        self.spans = []
+        self.final = False
+        self.closed = False
+        self.streaming = False
+        self.changed = asyncio.Event()
+        self.touched = time.monotonic()
+        self.counts = {"fragments": 0, "segments": 0, "cancelled_segments": 0, "expired_segments": 0, "revisions": 0}
+
+    @property
+    def committed_end(self):
+        return self.spans[-1].end if self.spans else 0
+
+    @property
+    def spoken_end(self):
+        return max((span.end for span in self.spans if span.emitted), default=0)
+
+    def update(self, fragment: str, offset=None, final=False):
+        """
+        Puts fragment at offset (default: the end, i.e. append), cancels synthesis of
+        any committed span the change touches and starts synthesis of newly stable text.
+        """
+        if self.closed or self.final:
+            raise HTTPException(status_code=409, detail="Session is already finished.")
+        offset = len(self.text) if offset is None else offset
+        if not 0 <= offset <= len(self.text):
+            raise HTTPException(status_code=400, detail=f"offset must be between 0 and {len(self.text)}")
+        # clients may resend the whole transcript; only the first changed char matters
+        unchanged = offset + _common_prefix_len(self.text[offset:], fragment)
+        if unchanged < self.spoken_end:
+            raise HTTPException(status_code=409, detail="Text that was already spoken cannot be revised.")
+        self.touched = time.monotonic()
+        self.counts["fragments"] += 1
+        while self.spans and self.spans[-1].end > unchanged:
+            span = self.spans.pop()
+            self.counts["revisions"] += 1
+            for task in span.tasks:
+                if not task.done():
+                    self.counts["cancelled_segments"] += 1
+                task.cancel()
+        self.text = self.text[:offset] + fragment
+        try:
+            self._commit(final)
+        finally:
+            self.changed.set()
+        self.final = final
+
+    def _commit(self, final):
+        start = self.committed_end
+        end = stable_prefix_end(self.text, start, self.language, final)
+        if not self.text[start:end].strip():
+            return
+        segments = [prepare_text(seg, self.language) for seg in segment_text(self.text[start:end], self.language)]
+        ticket = admission.admit(self.priority, self.deadline_ms)
+        tasks = [asyncio.ensure_future(self._submit(seg, ticket.priority, ticket.deadline)) for seg in segments]
+        finish_ticket_when_done(ticket, tasks)
+        self.spans.append(SessionSpan(start, end, tasks))
+        self.counts["segments"] += len(segments)
+
+    def close(self):
+        self.closed = True
+        for span in self.spans:
+            for task in span.tasks:
+                task.cancel()
+        self.changed.set()
+
+    def to_dict(self):
+        return {
+            "session_id": self.id,
+            "user_id": self.user_id,
+            "language": self.language,
+            "format": self.fmt,
+            "media_type": output_media_type(self.fmt, self.sample_rate, self.channels),
+            "chars": len(self.text),
+            "committed_chars": self.committed_end,
+            "spoken_chars": self.spoken_end,
+            "final": self.final,
+            "streaming": self.streaming,
+            "priority": self.priority,
+            **self.counts,
+        }
+
+class SessionStore:
+    """Live sessions by id; idle ones (no fragments and no listener) expire after ttl_s."""
+    def __init__(self, ttl_s: float, max_sessions: int):
+        self.ttl_s = ttl_s
+        self.max_sessions = max_sessions
+        self._sessions = {}
+        self.created = 0
+        self.expired = 0
+        self._closed_counts = {}
+
+    def _expire(self):
+        now = time.monotonic()
+        for session in list(self._sessions.values()):
+            if not session.streaming and now - session.touched > self.ttl_s:
+                self.expired += 1
+                self.close(session.id)
+
+    def add(self, session):
+        self._expire()
+        if len(self._sessions) >= self.max_sessions:
+            raise HTTPException(status_code=429, detail="Too many live TTS sessions.")
+        self._sessions[session.id] = session
+        self.created += 1
+        return session
+
+    def get(self, session_id):
+        session = self._sessions.get(session_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Unknown TTS session")
+        return session
+
+    def close(self, session_id):
+        session = self._sessions.pop(session_id, None)
+        if session is not None:
+            session.close()
+            for k, v in session.counts.items():
+                self._closed_counts[k] = self._closed_counts.get(k, 0) + v
+        return session
+
+    def stats(self):
+        counts = dict(self._closed_counts)
+        for session in self._sessions.values():
+            for k, v in session.counts.items():
+                counts[k] = counts.get(k, 0) + v
+        return {
+            "active": len(self._sessions),
+            "streaming": sum(s.streaming for s in self._sessions.values()),
+            "created": self.created,
+            "expired": self.expired,
+            **counts,
+        }
+
+tts_sessions = SessionStore(ttl_s=TTS_SESSION_TTL_S, max_sessions=TTS_MAX_SESSIONS)
+
+@app.get("/tts_sessions/stats")
+async def tts_sessions_stats():
+    return tts_sessions.stats()
+
+@app.post("/tts_sessions")
+async def create_tts_session(
+    language: str = Form(...),
+    user_id: str = Form("default"),
+    sample_rate: int = Form(SAMPLE_RATE),
+    format: str = Form(None),
+    channels: int = Form(1),
+    priority: str = Form("interactive"),
+    deadline_ms: float = Form(None),
+    accept: str = Header(None)
+):
+    """
+    Opens a session: post fragments to /tts_sessions/{id}/text and play
+    /tts_sessions/{id}/audio, which streams each stable prefix as it is synthesized.
+    priority/deadline_ms apply to every committed span (see SpeechSession).
+    """
+    check_output_rate(sample_rate)
+    fmt = negotiate_format(format, accept)
+    check_output_format(fmt, sample_rate, channels)
+    if priority not in PRIORITIES:
+        raise HTTPException(status_code=400, detail=f"priority must be one of {list(PRIORITIES)}")
+    require_model()
+    target_speaker = resolve_speaker(user_id, language)
+    params = sampling_params(language, target_speaker)
+    # Latents are resolved once up front, so the first fragment goes straight to the model
+    submit = await segment_submitter(target_speaker, language, params)
+    session = tts_sessions.add(SpeechSession(
+        user_id, language, target_speaker, params, sample_rate, fmt, channels, submit, priority, deadline_ms))
+    print(f"🎙 TTS session {session.id} ({language}) using {target_speaker}")
+    return session.to_dict()
+
+@app.post("/tts_sessions/{session_id}/text")
+async def tts_session_text(
+    session_id: str,
+    text: str = Form(""),
+    offset: int = Form(None),
+    final: bool = Form(False)
+):
+    """
+    Appends text, or with offset replaces everything from that char on (e.g. offset=0
+    with the full, revised transcript). final=true commits the rest and ends the session.
+    429 means the text was kept but its synthesis queue is full: retry after Retry-After.
+    """
+    session = tts_sessions.get(session_id)
+    session.update(text, offset, final)
+    return session.to_dict()
+
+@app.get("/tts_sessions/{session_id}/audio")
+async def tts_session_audio(session_id: str):
+    session = tts_sessions.get(session_id)
+    if session.streaming:
+        raise HTTPException(status_code=409, detail="Session audio is already being streamed.")
+    session.streaming = True
+
+    async def audio_chunks():
+        stitcher = SegmentStitcher(SAMPLE_RATE, gap_ms=SEGMENT_GAP_MS)
+        resampler = StreamingResampler(SAMPLE_RATE, session.sample_rate)
+        enc = AudioEncoder(session.fmt, session.sample_rate, session.channels)
+        offload = session.fmt not in ("wav", "pcm")
+        header = enc.encode(np.zeros(0, dtype=np.float32))
+        if header:
+            yield header
+        i = 0
+        try:
+            while not session.closed:
+                if i == len(session.spans):
+                    if session.final:
+                        break
+                    session.changed.clear()
+                    await session.changed.wait()
+                    continue
+                span = session.spans[i]
+                for task in span.tasks:
+                    await asyncio.wait({task})
+                    if task.cancelled():
+                        break  # revised away (or closed); spans[i] is now its replacement, if any
+                    if isinstance(task.exception(), DeadlineExceeded):
+                        # too late to be useful in a live call: skip it rather than end the stream
+                        session.counts["expired_segments"] += 1
+                        continue
+                    wav_np = task.result()
+                    span.emitted = True
+                    session.touched = time.monotonic()
+                    stitcher.boundary()
+                    out = resampler.process(stitcher.add(wav_np))
+                    data = await asyncio.to_thread(enc.encode, out) if offload else enc.encode(out)
+                    if data:
+                        yield data
                 else:
-                    from contextlib import nullcontext
-                    autocast_ctx = nullcontext()
-
-                with autocast_ctx:
-                    # Pure Copy / Indian Accent Tuning
-                    # To capture the exact tone/accent, we need low temperature and top_p
-                    # This reduces the model's "creative" filling and forces it to rely on the speaker embedding.
-                    
-                    # Base settings
-                    temp = 0.65
-                    top_p = 0.85
-                    rep_pen = 5.0
-                    
-                    if language == "hi":
-                        # Hindi needs strict control
-                        temp = 0.45 
-                        top_p = 0.8
-                    elif language == "en":
-                        # For English with Indian accent (assumed if user is cloning), 
-                        # slightly lower temp helps maintain the prosody.
-                        temp = 0.55
-                        top_p = 0.85
-
-                    if is_cross_lingual:
-                        # Cross-lingual needs even more constraint
-                        temp = 0.4
-                        top_p = 0.75
-
-                    out = tts.synthesizer.tts_model.inference(
-                        text=text,
-                        language=language,
-                        gpt_cond_latent=gpt_latent,
-                        speaker_embedding=speaker_latent,
-                        temperature=temp,
-                        length_penalty=1.0,
-                        repetition_penalty=rep_pen,
-                        top_k=50,
-                        top_p=top_p,
-                        speed=1.0,
-                        enable_text_splitting=(language != "hi")
-                    )
+                    i += 1
+            if session.final and not session.closed:
+                out = np.concatenate([resampler.process(stitcher.finish()), resampler.flush()])
+                data = enc.encode(out) + enc.close()
+                if data:
+                    yield data
+                format_stats.record(enc)
+                print(f"⏱ TTS session {session.id} done: {enc.samples / session.sample_rate:.2f}s audio, {session.counts}")
+        except Exception:
+            traceback.print_exc()
+            log_error(f"tts_session {session.id}")
+            raise
+        finally:
+            tts_sessions.close(session.id)
+
+    media_type = output_media_type(session.fmt, session.sample_rate, session.channels)
+    return StreamingResponse(audio_chunks(), media_type=media_type, headers={"Cache-Control": "no-store"})
 
-                    wav_tensor = torch.as_tensor(out["wav"])
-                    if wav_tensor.dim() == 1:
-                        wav_tensor = wav_tensor.unsqueeze(0)
-                    if DEVICE == "cuda":
-                        wav_tensor = wav_tensor.cpu()
+@app.delete("/tts_sessions/{session_id}")
+async def close_tts_session(session_id: str):
+    session = tts_sessions.get(session_id)
+    tts_sessions.close(session_id)
+    return session.to_dict()
 
-                    wav_np = wav_tensor.squeeze(0).numpy()
-                    wav_np = trim_silence(wav_np, sample_rate)
+# ==============================
+# Durable chat log (append-only segments + per-channel index)
+# ==============================
+# With CHAT_LOG_DIR set, every chat message is written to an append-only log on
+# disk and ChatStore becomes the in-memory tail in front of it, so recent messages
+# are still served without touching the disk. Files in CHAT_LOG_DIR:
+#   MANIFEST            live segments, oldest first (replaced atomically)
+#   {seq}-{gen}.log     records: <u32 payload length><u32 crc32><JSON message>
+#   {seq}-{gen}.idx     one 36-byte entry per record, in seq order, appended after
+#                       the records it points at
+#   {seq}-{gen}.chx     the same entries sorted by (channel hash, seq), written when
+#                       a segment is sealed; memory-mapped for range reads by
+#                       channel, seq and timestamp
+#   LOCK                flock taken to commit, rotate or swap in compacted segments
+# Writes are group-committed: messages posted while a batch is being written and
+# fsynced go out together in the next one. Any number of processes can share the
+# directory. Sequence numbers come from the log tail under the lock, and readers
+# need no lock because sealed files never change and an idx entry only appears once
+# its record is complete. Compaction rewrites the sealed segments without messages
+# older than CHAT_LOG_RETENTION_DAYS or beyond the newest CHAT_LOG_KEEP_PER_CHANNEL
+# of a channel, and merges small segments.
+CHAT_LOG_DIR = os.environ.get("CHAT_LOG_DIR") or None
+CHAT_LOG_SEGMENT_BYTES = int(float(os.environ.get("CHAT_LOG_SEGMENT_MB", 64)) * 1024 * 1024)
+CHAT_LOG_COMMIT_MS = float(os.environ.get("CHAT_LOG_COMMIT_MS", 0))  # extra wait to grow a batch
+CHAT_LOG_FSYNC = os.environ.get("CHAT_LOG_FSYNC", "1") != "0"
+CHAT_LOG_RETENTION_S = float(os.environ.get("CHAT_LOG_RETENTION_DAYS", 0)) * 86400
+CHAT_LOG_KEEP_PER_CHANNEL = int(os.environ.get("CHAT_LOG_KEEP_PER_CHANNEL", 0))
+CHAT_LOG_COMPACT_SEGMENTS = int(os.environ.get("CHAT_LOG_COMPACT_SEGMENTS", 8))
+# how often a process with push subscribers picks up messages other processes wrote
+CHAT_LOG_FOLLOW_MS = float(os.environ.get("CHAT_LOG_FOLLOW_MS", 250))
 
-                    peak = np.max(np.abs(wav_np)) + 1e-9
-                    if peak > 1.0:
-                        wav_np = wav_np / peak
+CHAT_INDEX_DTYPE = np.dtype([("chan", "<u8"), ("seq", "<u8"), ("ts", "<f8"), ("off", "<u8"), ("len", "<u4")])
+_CHAT_RECORD = struct.Struct("<II")
 
-        buf = io.BytesIO()
-        sf.write(buf, wav_np.T, sample_rate, format="WAV", subtype="PCM_16")
-        buf.seek(0)
-        return StreamingResponse(buf, media_type="audio/wav")
+def channel_hash(channel_id: str):
+    return int.from_bytes(hashlib.blake2b(channel_id.encode("utf-8"), digest_size=8).digest(), "little")
 
-    except Exception as e:
-        traceback.print_exc()
-        with open("error.log", "w") as f:
-            traceback.print_exc(file=f)
-        raise HTTPException(status_code=500, detail=f"TTS Error: {e}")
+def _read_entries(path, start=0):
+    """Whole index entries of an idx/chx file from entry `start` on (a torn last entry is left out)."""
+    with open(path, "rb") as f:
+        f.seek(start * CHAT_INDEX_DTYPE.itemsize)
+        data = f.read()
+    n = len(data) // CHAT_INDEX_DTYPE.itemsize
+    return np.frombuffer(data, dtype=CHAT_INDEX_DTYPE, count=n)
+
+def _write_file(path, data):
+    """Writes a complete file under a temporary name, fsyncs it and renames it into place."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def _record_offsets(lengths, start=0):
+    offsets = np.full(len(lengths), start, dtype=np.uint64)
+    offsets[1:] += np.cumsum(lengths[:-1], dtype=np.uint64)
+    return offsets
+
+def _chat_records(msgs):
+    """(record bytes, lengths) for messages in seq order."""
+    records = []
+    for msg in msgs:
+        payload = json.dumps(msg, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        records.append(_CHAT_RECORD.pack(len(payload), zlib.crc32(payload)) + payload)
+    return records
+
+class ChatSegment:
+    """The files of one segment. Sealed segments are read through mmaps of .chx and .log."""
+    def __init__(self, directory, name):
+        self.name = name
+        self.first_seq = int(name.split("-")[0])
+        base = os.path.join(directory, name)
+        self.log_path, self.idx_path, self.chx_path = base + ".log", base + ".idx", base + ".chx"
+        self._chx = None
+        self._log_map = None
+
+    def _sealed(self):
+        if self._chx is None and os.path.exists(self.chx_path):
+            with open(self.chx_path, "rb") as f, open(self.log_path, "rb") as log:
+                chx_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+                self._log_map = mmap.mmap(log.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(log.fileno()).st_size else b""
+            self._chx = np.frombuffer(chx_map, dtype=CHAT_INDEX_DTYPE)
+        return self._chx is not None
+
+    def entries(self):
+        """Index entries in seq order."""
+        return _read_entries(self.idx_path)
+
+    def channel_entries(self, chan, since=0):
+        """Index entries of one channel hash with seq > since, in seq order."""
+        chan, since = np.uint64(chan), np.uint64(max(0, since))
+        if self._sealed():
+            keys = self._chx["chan"]
+            rows = self._chx[np.searchsorted(keys, chan, side="left"):np.searchsorted(keys, chan, side="right")]
+            return rows[np.searchsorted(rows["seq"], since, side="right"):]
+        rows = self.entries()
+        return rows[(rows["chan"] == chan) & (rows["seq"] > since)]
+
+    def read(self, rows):
+        """The messages the index rows point at."""
+        if not len(rows):
+            return []
+        if self._sealed():
+            buf = self._log_map
+            chunks = [buf[off:off + n] for off, n in zip(rows["off"].tolist(), rows["len"].tolist())]
+        else:
+            with open(self.log_path, "rb") as f:
+                chunks = []
+                for off, n in zip(rows["off"].tolist(), rows["len"].tolist()):
+                    f.seek(off)
+                    chunks.append(f.read(n))
+        return [json.loads(chunk[_CHAT_RECORD.size:]) for chunk in chunks]
+
+    def seal(self):
+        """Writes the channel-sorted index (the segment gets no more appends)."""
+        rows = self.entries()
+        _write_file(self.chx_path, rows[np.lexsort((rows["seq"], rows["chan"]))].tobytes())
+
+    def remove(self):
+        for path in (self.log_path, self.idx_path, self.chx_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # already gone, or still mapped (Windows); compaction leaves it behind
+
+class ChatLog:
+    """
+    Append-only, segmented, multi-process message log (layout above), with `hot` (a
+    ChatStore) as its in-memory tail. Every message the process writes or picks up
+    from the log goes through hot.add() and then publish(msg), in seq order.
+    """
+    def __init__(self, directory, hot, publish=None, segment_bytes=CHAT_LOG_SEGMENT_BYTES, commit_s=CHAT_LOG_COMMIT_MS / 1000,
+                 fsync=CHAT_LOG_FSYNC, retention_s=CHAT_LOG_RETENTION_S, keep_per_channel=CHAT_LOG_KEEP_PER_CHANNEL,
+                 compact_segments=CHAT_LOG_COMPACT_SEGMENTS):
+        self.dir = directory
+        self.hot = hot
+        self.publish = publish
+        self.segment_bytes = segment_bytes
+        self.commit_s = commit_s
+        self.fsync = fsync
+        self.retention_s = retention_s
+        self.keep_per_channel = keep_per_channel
+        self.compact_segments = compact_segments
+        self._lock = threading.RLock()  # segment list, tail cursor, append handles
+        self._compact_lock = threading.Lock()
+        self._lock_file = None
+        self._manifest_stamp = None
+        self._generation = 0
+        self._segments = []
+        self._files = None  # (segment name, log file, idx file) of the active segment
+        self._tail = 0  # entries of the active segment already read into _incoming
+        self._log_end = 0  # end of the last of those records in the active .log
+        self._last_seq = 0
+        self._last_ts = 0.0
+        self._incoming = deque()
+        self._pending = []  # (channel_id, text, sender_id, future) for the next commit
+        self._committer = None
+        self._compactor = None
+        self._compact_base = 0  # sealed segments left by the last compaction
+        self._refreshed = 0.0
+        self.opened = False
+        self.commits = 0
+        self.committed = 0
+        self.disk_reads = 0
+        self.compactions = 0
+        self.compacted_away = 0
+
+    # ---------- files ----------
+    @contextmanager
+    def _exclusive(self):
+        """This process's lock plus the directory flock (where fcntl exists; else one process only)."""
+        with self._lock:
+            fcntl = optional_import("fcntl")
+            if fcntl is None:
+                yield
+                return
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _manifest_path(self):
+        return os.path.join(self.dir, "MANIFEST")
+
+    def _write_manifest(self, names):
+        self._generation += 1
+        _write_file(self._manifest_path(), json.dumps({"generation": self._generation, "segments": names}).encode())
+        self._manifest_stamp = None
+
+    def _load_manifest(self):
+        """Picks up rotations and compactions (by any process). Caller holds _lock."""
+        st = os.stat(self._manifest_path())
+        stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if stamp == self._manifest_stamp:
+            return
+        with open(self._manifest_path()) as f:
+            manifest = json.load(f)
+        self._manifest_stamp = stamp
+        self._generation = manifest["generation"]
+        known = {seg.name: seg for seg in self._segments}
+        segments = [known.get(name) or ChatSegment(self.dir, name) for name in manifest["segments"]]
+        if self._segments and segments[-1].name != self._segments[-1].name:
+            # rotated: finish the old active segment and any sealed since, then follow the new one
+            old = self._segments[-1]
+            try:
+                self._read_tail(old)
+                for seg in segments[:-1]:
+                    if seg.first_seq > old.first_seq:
+                        self._tail = 0
+                        self._read_tail(seg)
+            except FileNotFoundError:
+                # already compacted away; reads below the new segment go to disk
+                self.hot.floor_seq = max(self.hot.floor_seq, segments[-1].first_seq - 1)
+            self._tail = self._log_end = 0
+            if self._files is not None:
+                self._files[1].close()
+                self._files[2].close()
+                self._files = None
+        self._segments = segments
+
+    def _active_files(self):
+        active = self._segments[-1]
+        if self._files is None or self._files[0] != active.name:
+            self._files = (active.name, open(active.log_path, "ab"), open(active.idx_path, "ab"))
+        return self._files
+
+    def _read_tail(self, segment=None):
+        """Queues messages appended to the active segment since the last call (by any process)."""
+        segment = segment or self._segments[-1]
+        rows = _read_entries(segment.idx_path, self._tail)
+        if not len(rows):
+            return
+        self._tail += len(rows)
+        self._log_end = int(rows["off"][-1] + rows["len"][-1])
+        self._last_seq = max(self._last_seq, int(rows["seq"][-1]))
+        self._last_ts = max(self._last_ts, float(rows["ts"][-1]))
+        self._incoming.extend(segment.read(rows))
+
+    def _recover(self, segment):
+        """Drops a torn tail after a crash and indexes whole records the idx missed."""
+        rows = segment.entries()
+        log_size = os.path.getsize(segment.log_path) if os.path.exists(segment.log_path) else 0
+        rows = rows[rows["off"] + rows["len"] <= log_size]
+        end = int(rows["off"][-1] + rows["len"][-1]) if len(rows) else 0
+        with open(segment.log_path, "a+b") as f:
+            f.seek(end)
+            data = f.read()
+            found, pos = [], 0
+            while pos + _CHAT_RECORD.size <= len(data):
+                length, crc = _CHAT_RECORD.unpack_from(data, pos)
+                payload = data[pos + _CHAT_RECORD.size:pos + _CHAT_RECORD.size + length]
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    break
+                msg = json.loads(payload)
+                found.append((channel_hash(msg["channel_id"]), msg["seq"], msg["timestamp"], end + pos, _CHAT_RECORD.size + length))
+                pos += _CHAT_RECORD.size + length
+            f.truncate(end + pos)
+        if found or os.path.getsize(segment.idx_path) != rows.nbytes:
+            with open(segment.idx_path, "r+b") as f:
+                f.truncate(rows.nbytes)
+                f.seek(rows.nbytes)
+                f.write(np.array(found, dtype=CHAT_INDEX_DTYPE).tobytes())
+            if found:
+                print(f"🔧 Chat log: re-indexed {len(found)} records of {segment.name}")
+
+    def open(self):
+        """Creates or recovers the log and loads the active segment into the in-memory tail."""
+        with self._lock:
+            if self.opened:
+                return
+            os.makedirs(self.dir, exist_ok=True)
+            self._lock_file = open(os.path.join(self.dir, "LOCK"), "a+b")
+            with self._exclusive():
+                if not os.path.exists(self._manifest_path()):
+                    for ext in (".log", ".idx"):
+                        open(os.path.join(self.dir, f"{1:020d}-0{ext}"), "ab").close()
+                    self._write_manifest([f"{1:020d}-0"])
+                self._load_manifest()
+                active = self._segments[-1]
+                self._recover(active)
+                self._last_seq = active.first_seq - 1
+                if len(self._segments) > 1:
+                    prev = self._segments[-2].entries()
+                    if len(prev):
+                        self._last_seq = max(self._last_seq, int(prev["seq"][-1]))
+                        self._last_ts = float(prev["ts"][-1])
+                self._read_tail()
+            # older segments are read from disk on demand
+            self.hot.floor_seq = max(self.hot.floor_seq, active.first_seq - 1)
+            self.opened = True
+        self._deliver()
+        print(f"🗂 Chat log {self.dir}: {len(self._segments)} segment(s), last seq {self._last_seq}")
+
+    def _deliver(self):
+        """Moves queued messages into the in-memory tail and out to subscribers (event loop / caller thread)."""
+        while self._incoming:
+            msg = self._incoming.popleft()
+            if msg["seq"] <= self.hot._seq:
+                continue
+            self.hot.add(msg)
+            if self.publish is not None:
+                self.publish(msg)
+
+    def refresh(self, max_age_s=0.0):
+        """
+        Picks up what other processes appended, unless that was done less than max_age_s
+        ago; skipped while this process is committing (that catches up anyway).
+        """
+        if not self.opened or time.monotonic() - self._refreshed < max_age_s or not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._load_manifest()
+            self._read_tail()
+            self._refreshed = time.monotonic()
+        finally:
+            self._lock.release()
+        self._deliver()
+
+    # ---------- writes ----------
+    async def append(self, channel_id, text, sender_id):
+        """Durably appends a message (group-committed with concurrent ones) and returns it."""
+        if not self.opened:
+            await asyncio.to_thread(self.open)
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((channel_id, text, sender_id, future))
+        if self._committer is None or self._committer.done():
+            self._committer = asyncio.ensure_future(self._commit_loop())
+        return await future
+
+    async def _commit_loop(self):
+        while self._pending:
+            if self.commit_s > 0:
+                await asyncio.sleep(self.commit_s)
+            batch, self._pending = self._pending, []
+            try:
+                msgs = await asyncio.to_thread(self._write_batch, [item[:3] for item in batch])
+            except Exception as e:
+                traceback.print_exc()
+                for *_, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self._deliver()
+            for (*_, future), msg in zip(batch, msgs):
+                if not future.done():
+                    future.set_result(msg)
+            if len(self._segments) - 1 - self._compact_base >= self.compact_segments > 0 and (self._compactor is None or self._compactor.done()):
+                self._compactor = asyncio.ensure_future(asyncio.to_thread(self.compact))
+
+    def _write_batch(self, items):
+        with self._exclusive():
+            # whatever other processes committed comes first, and seq continues from it
+            self._load_manifest()
+            self._read_tail()
+            if self._log_end >= self.segment_bytes:
+                self._rotate()
+            _, log, idx = self._active_files()
+            # drop anything a writer that died mid-commit left behind (never acknowledged)
+            if os.fstat(log.fileno()).st_size > self._log_end:
+                os.ftruncate(log.fileno(), self._log_end)
+            if os.fstat(idx.fileno()).st_size > self._tail * CHAT_INDEX_DTYPE.itemsize:
+                os.ftruncate(idx.fileno(), self._tail * CHAT_INDEX_DTYPE.itemsize)
+            msgs = []
+            for channel_id, text, sender_id in items:
+                self._last_seq += 1
+                self._last_ts = max(time.time(), self._last_ts)  # timestamps never go back within the log
+                msgs.append({
+                    "id": str(uuid.uuid4()),
+                    "seq": self._last_seq,
+                    "text": text,
+                    "sender_id": sender_id,
+                    "channel_id": channel_id,
+                    "timestamp": self._last_ts,
+                })
+            records = _chat_records(msgs)
+            rows = np.zeros(len(msgs), dtype=CHAT_INDEX_DTYPE)
+            rows["chan"] = [channel_hash(m["channel_id"]) for m in msgs]
+            rows["seq"] = [m["seq"] for m in msgs]
+            rows["ts"] = [m["timestamp"] for m in msgs]
+            rows["len"] = [len(r) for r in records]
+            rows["off"] = _record_offsets(rows["len"], self._log_end)
+            log.write(b"".join(records))
+            log.flush()
+            if self.fsync:
+                os.fsync(log.fileno())
+            # the idx can be rebuilt from the log (_recover), so it is not fsynced
+            idx.write(rows.tobytes())
+            idx.flush()
+            self._tail += len(msgs)
+            self._log_end += int(rows["len"].sum())
+            self._incoming.extend(msgs)
+            self.commits += 1
+            self.committed += len(msgs)
+            return msgs
+
+    def _rotate(self):
+        """Seals the active segment and starts the next one. Caller holds _exclusive()."""
+        self._segments[-1].seal()
+        name = f"{self._last_seq + 1:020d}-{self._generation}"
+        for ext in (".log", ".idx"):
+            open(os.path.join(self.dir, name + ext), "ab").close()
+        self._write_manifest([seg.name for seg in self._segments] + [name])
+        self._load_manifest()
+
+    # ---------- reads ----------
+    def recent(self, channel_id, since=0):
+        """Messages after since from memory, or None when some of them are only on disk."""
+        # polls see other processes' messages within one follow interval, like push subscribers
+        self.refresh(CHAT_LOG_FOLLOW_MS / 1000)
+        if not self.hot.covers(channel_id, since):
+            return None
+        return self.hot.since(channel_id, since)
+
+    def read(self, channel_id, since=0, start_ts=None, end_ts=None, limit=None, newest=False):
+        """
+        Messages of channel_id with seq > since and start_ts <= timestamp < end_ts, from disk,
+        oldest first. limit keeps the oldest (or with newest=True the newest) limit of them.
+        """
+        if not self.opened:
+            self.open()
+        chan = channel_hash(channel_id)
+        for attempt in range(3):
+            with self._lock:
+                self._load_manifest()
+                segments = list(self._segments)
+            try:
+                return self._read_segments(segments, channel_id, chan, since, start_ts, end_ts, limit, newest)
+            except FileNotFoundError:
+                if attempt == 2:
+                    raise
+                self._manifest_stamp = None  # compacted while we read: start over on the new segments
+
+    def _read_segments(self, segments, channel_id, chan, since, start_ts, end_ts, limit, newest):
+        self.disk_reads += 1
+        # every seq in a segment is <= since when the next one starts at or below since + 1
+        live = [seg for i, seg in enumerate(segments) if i + 1 == len(segments) or segments[i + 1].first_seq - 1 > since]
+        pages, n = [], 0
+        for seg in reversed(live) if newest else live:
+            rows = seg.channel_entries(chan, since)
+            if start_ts is not None:
+                rows = rows[np.searchsorted(rows["ts"], start_ts):]
+            if end_ts is not None:
+                rows = rows[:np.searchsorted(rows["ts"], end_ts)]
+            if limit is not None:
+                rows = rows[max(0, len(rows) - (limit - n)):] if newest else rows[:limit - n]
+            page = [m for m in seg.read(rows) if m["channel_id"] == channel_id]  # hash collisions
+            pages.append(page)
+            n += len(page)
+            if limit is not None and n >= limit:
+                break
+        if newest:
+            pages.reverse()
+        return [m for page in pages for m in page]
+
+    # ---------- compaction ----------
+    def compact(self, now=None):
+        """
+        Rewrites the sealed segments without expired/superseded messages, merged up to
+        segment_bytes each, then swaps them in. Returns the number of messages dropped.
+        """
+        if not self._compact_lock.acquire(blocking=False):
+            return 0
+        try:
+            with self._lock:
+                self._load_manifest()
+                sealed, active = self._segments[:-1], self._segments[-1]
+            if not sealed:
+                return 0
+            per_seg = [seg.entries() for seg in sealed]
+            keep = [np.ones(len(rows), dtype=bool) for rows in per_seg]
+            if self.retention_s > 0:
+                cutoff = (now or time.time()) - self.retention_s
+                keep = [k & (rows["ts"] >= cutoff) for k, rows in zip(keep, per_seg)]
+            if self.keep_per_channel > 0:
+                # rank every message of the log by recency within its channel (the active segment counts too)
+                everything = np.concatenate(per_seg + [active.entries()])
+                order = np.lexsort((-everything["seq"].astype(np.int64), everything["chan"]))
+                chans = everything["chan"][order]
+                starts = np.r_[0, np.flatnonzero(chans[1:] != chans[:-1]) + 1]
+                rank = np.empty(len(order), dtype=np.int64)
+                rank[order] = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+                recent = rank[:sum(len(rows) for rows in per_seg)] < self.keep_per_channel
+                keep = [k & r for k, r in zip(keep, np.split(recent, np.cumsum([len(rows) for rows in per_seg])[:-1]))]
+
+            dropped = sum(len(rows) for rows in per_seg) - sum(int(k.sum()) for k in keep)
+            kept_bytes = sum(int(rows["len"][k].sum()) for rows, k in zip(per_seg, keep))
+            if not dropped and math.ceil(kept_bytes / self.segment_bytes) >= len(sealed):
+                self._compact_base = len(sealed)
+                return 0  # nothing to drop or merge
+
+            # copy the survivors into new segments (not yet in the manifest, so invisible to readers)
+            generation = self._generation + 1
+            written, names, out_rows, out_records, size = [], [], [], [], 0
+
+            def flush():
+                nonlocal out_rows, out_records, size
+                if not out_records:
+                    return
+                rows = np.concatenate(out_rows)
+                name = f"{int(rows['seq'][0]):020d}-{generation}"
+                seg = ChatSegment(self.dir, name)
+                rows["off"] = _record_offsets(rows["len"])
+                _write_file(seg.log_path, b"".join(out_records))
+                _write_file(seg.idx_path, rows.tobytes())
+                seg.seal()
+                written.append(seg)
+                names.append(name)
+                out_rows, out_records, size = [], [], 0
+
+            for seg, rows, k in zip(sealed, per_seg, keep):
+                kept = rows[k]
+                with open(seg.log_path, "rb") as f:
+                    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if len(kept) else b""
+                start = 0
+                for i, (off, n) in enumerate(zip(kept["off"].tolist(), kept["len"].tolist())):
+                    out_records.append(data[off:off + n])
+                    size += n
+                    if size >= self.segment_bytes:
+                        out_rows.append(kept[start:i + 1])
+                        start = i + 1
+                        flush()
+                out_rows.append(kept[start:])
+            flush()
+
+            with self._exclusive():
+                self._load_manifest()
+                current = [seg.name for seg in self._segments]
+                if any(seg.name not in current for seg in sealed):
+                    # another process compacted meanwhile: keep its result
+                    for seg in written:
+                        seg.remove()
+                    return 0
+                self._generation = max(self._generation, generation - 1)
+                self._write_manifest(names + [name for name in current if name not in {seg.name for seg in sealed}])
+                self._load_manifest()
+                self._compact_base = len(written)
+            for seg in sealed:
+                seg.remove()
+            self.compactions += 1
+            self.compacted_away += dropped
+            print(f"🧹 Chat log compacted {len(sealed)} segment(s) into {len(written)}, dropped {dropped} message(s)")
+            return dropped
+        finally:
+            self._compact_lock.release()
+
+    async def follow(self, has_subscribers, interval_s=CHAT_LOG_FOLLOW_MS / 1000):
+        """Delivers messages other processes write to this process's push subscribers."""
+        while True:
+            await asyncio.sleep(interval_s)
+            if has_subscribers():
+                self.refresh()
+
+    def stats(self):
+        with self._lock:
+            segments = list(self._segments)
+        disk_bytes = 0
+        for seg in segments:
+            for path in (seg.log_path, seg.idx_path, seg.chx_path):
+                try:
+                    disk_bytes += os.path.getsize(path)
+                except OSError:
+                    pass
+        return {
+            "dir": self.dir,
+            "segments": len(segments),
+            "disk_bytes": disk_bytes,
+            "last_seq": self._last_seq,
+            "memory_floor_seq": self.hot.floor_seq,
+            "commits": self.commits,
+            "committed": self.committed,
+            "mean_commit_batch": (self.committed / self.commits) if self.commits else 0.0,
+            "disk_reads": self.disk_reads,
+            "compactions": self.compactions,
+            "compacted_away": self.compacted_away,
+        }
 
 # ==============================
-# Simple chat endpoints (unchanged)
+# Simple chat endpoints
 # ==============================
-messages_db = []
+class ChatStore:
+    """
+    Per-channel ring buffers of recent messages.
+    Every message gets a sequence number from one process-wide counter, so within a
+    channel seq is strictly increasing and clients can ask for "everything after seq N".
+    Memory is bounded per channel (capacity) and in total (max_bytes); over budget, the
+    oldest messages of the least recently active channels are dropped first.
+    In front of a ChatLog the sequence numbers come from the log (add()), and covers()
+    tells whether a read can be answered from memory.
+    """
+    MSG_OVERHEAD = 256  # rough per-message dict/str overhead in bytes
+
+    def __init__(self, capacity: int, max_bytes: int):
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        self._channels = OrderedDict()  # channel_id -> deque of messages, least recently active first
+        self._seq = 0
+        self.total_bytes = 0
+        self.floor_seq = 0  # messages up to here may exist only in the log
+        self._dropped = {}  # channel_id -> seq of the newest message dropped from its ring
+
+    @classmethod
+    def _msg_bytes(cls, msg):
+        return cls.MSG_OVERHEAD + len(msg["text"].encode("utf-8")) + len(msg["sender_id"]) + len(msg["channel_id"])
+
+    def append(self, channel_id, text, sender_id):
+        return self.add({
+            "id": str(uuid.uuid4()),
+            "seq": self._seq + 1,
+            "text": text,
+            "sender_id": sender_id,
+            "channel_id": channel_id,
+            "timestamp": time.time()
+        })
+
+    def add(self, msg):
+        """Stores a message that already has its seq (higher than any stored so far)."""
+        self._seq = msg["seq"]
+        channel_id = msg["channel_id"]
+        ring = self._channels.get(channel_id)
+        if ring is None:
+            ring = self._channels[channel_id] = deque()
+        else:
+            self._channels.move_to_end(channel_id)
+        ring.append(msg)
+        self.total_bytes += self._msg_bytes(msg)
+        if len(ring) > self.capacity:
+            self._drop(channel_id, ring)
+        while self.total_bytes > self.max_bytes:
+            oldest_id, oldest_ring = next(iter(self._channels.items()))
+            self._drop(oldest_id, oldest_ring)
+            if not oldest_ring:
+                del self._channels[oldest_id]
+        return msg
+
+    def _drop(self, channel_id, ring):
+        msg = ring.popleft()
+        self.total_bytes -= self._msg_bytes(msg)
+        self._dropped[channel_id] = msg["seq"]
+
+    def covers(self, channel_id, since=0):
+        """True when every message of channel_id with seq > since is still in memory."""
+        return since >= max(self.floor_seq, self._dropped.get(channel_id, 0))
+
+    def since(self, channel_id, since=0):
+        """Messages of channel_id with seq > since, oldest first. Cost is O(new messages)."""
+        ring = self._channels.get(channel_id)
+        if not ring:
+            return []
+        out = []
+        for msg in reversed(ring):
+            if msg["seq"] <= since:
+                break
+            out.append(msg)
+        out.reverse()
+        return out
+
+    def stats(self):
+        return {
+            "channels": len(self._channels),
+            "messages": sum(len(r) for r in self._channels.values()),
+            "total_bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "capacity": self.capacity,
+            "last_seq": self._seq,
+        }
+
+class Subscription:
+    """One push consumer: a bounded backlog plus a wakeup event (no timers, so idle costs nothing)."""
+    __slots__ = ("pending", "event", "overflowed", "closed")
+
+    def __init__(self):
+        self.pending = deque()
+        self.event = asyncio.Event()
+        self.overflowed = False
+        self.closed = False
+
+    def drain(self):
+        msgs = list(self.pending)
+        self.pending.clear()
+        return msgs
+
+class ChannelHub:
+    """
+    In-process pub/sub fan-out keyed by channel_id.
+    A subscriber whose backlog reaches queue_size is cut off instead of buffering
+    without bound; it reconnects with its last seq and catches up from chat_store.
+    """
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self._subs = {}  # channel_id -> set of Subscription
+        self.published = 0
+        self.delivered = 0
+        self.overflows = 0
+
+    def subscribe(self, channel_id):
+        sub = Subscription()
+        self._subs.setdefault(channel_id, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, channel_id, sub):
+        subs = self._subs.get(channel_id)
+        if subs is None:
+            return
+        subs.discard(sub)
+        if not subs:
+            del self._subs[channel_id]
+
+    def publish(self, msg):
+        self.published += 1
+        subs = self._subs.get(msg["channel_id"])
+        if not subs:
+            return
+        for sub in list(subs):
+            if len(sub.pending) >= self.queue_size:
+                sub.overflowed = True
+                self.overflows += 1
+                self.unsubscribe(msg["channel_id"], sub)
+            else:
+                sub.pending.append(msg)
+                self.delivered += 1
+            sub.event.set()
+
+    def stats(self):
+        return {
+            "subscribed_channels": len(self._subs),
+            "subscribers": sum(len(s) for s in self._subs.values()),
+            "published": self.published,
+            "delivered": self.delivered,
+            "overflows": self.overflows,
+        }
+
+chat_store = ChatStore(
+    capacity=int(os.environ.get("CHAT_CHANNEL_CAPACITY", 100)),
+    max_bytes=int(float(os.environ.get("CHAT_MAX_MB", 32)) * 1024 * 1024),
+)
+chat_hub = ChannelHub(queue_size=int(os.environ.get("CHAT_SUBSCRIBER_QUEUE", 256)))
+chat_log = ChatLog(CHAT_LOG_DIR, chat_store, chat_hub.publish) if CHAT_LOG_DIR else None
+
+async def chat_history(channel_id, since=0, start_ts=None, end_ts=None, limit=None):
+    """
+    Messages of a channel after since: from memory when it has them all, else from the log.
+    Without a limit, the newest CHAT_CHANNEL_CAPACITY of them (what the in-memory ring
+    holds); with one, the oldest limit of them, so clients can page forward with since.
+    """
+    newest = limit is None
+    if newest:
+        limit = chat_store.capacity
+    if chat_log is None:
+        msgs = chat_store.since(channel_id, since)
+    else:
+        msgs = chat_log.recent(channel_id, since) if start_ts is None and end_ts is None else None
+        if msgs is None:
+            return await asyncio.to_thread(chat_log.read, channel_id, since, start_ts, end_ts, limit, newest)
+    if start_ts is not None or end_ts is not None:
+        msgs = [m for m in msgs if (start_ts is None or m["timestamp"] >= start_ts) and (end_ts is None or m["timestamp"] < end_ts)]
+    return msgs[-limit:] if newest else msgs[:limit]
+
+@app.get("/chat/stats")
+async def chat_stats():
+    stats = {**chat_store.stats(), **chat_hub.stats()}
+    if chat_log is not None:
+        stats["log"] = chat_log.stats()
+    return stats
+
+@app.post("/chat/compact")
+async def chat_compact():
+    """Runs a chat log compaction now (it also runs by itself once CHAT_LOG_COMPACT_SEGMENTS segments are sealed)."""
+    if chat_log is None:
+        raise HTTPException(status_code=404, detail="chat log disabled (set CHAT_LOG_DIR)")
+    dropped = await asyncio.to_thread(chat_log.compact)
+    return {"dropped": dropped, **chat_log.stats()}
 
 @app.post("/send_message")
 async def send_message(
@@ -515,23 +4902,128 @@ async def send_message(
     sender_id: str = Form(...),
     channel_id: str = Form(...),
 ):
-    msg = {
-        "id": str(uuid.uuid4()),
-        "text": text,
-        "sender_id": sender_id,
-        "channel_id": channel_id,
-        "timestamp": time.time()
-    }
+    if chat_log is not None:
+        # published to chat_hub by the log once durable
+        msg = await chat_log.append(channel_id, text, sender_id)
+    else:
+        msg = chat_store.append(channel_id, text, sender_id)
+        chat_hub.publish(msg)
+    return {"status": "sent", "seq": msg["seq"]}
+
+@app.get("/get_messages")
+async def get_messages(channel_id: str, since: int = 0, start_ts: float = None, end_ts: float = None, limit: int = None):
+    """
+    Messages in channel_id with seq > since, oldest first (omit since for the latest
+    history). start_ts/end_ts (unix seconds, end exclusive) narrow it; see chat_history
+    for what limit does.
+    """
+    return await chat_history(channel_id, since, start_ts, end_ts, limit)
 
-    messages_db.append(msg)
-    if len(messages_db) > 100:
-        messages_db.pop(0)
+@app.websocket("/ws/messages")
+async def ws_messages(websocket: WebSocket, channel_id: str, since: int = 0):
+    """
+    Push delivery for a channel. Sends the retained messages after `since`, then every
+    new message the moment it is posted. Reconnect with the last seq received to resume.
+    Close code 1013 means the client fell behind and should reconnect with its cursor.
+    """
+    await websocket.accept()
+    # subscribe before reading the backlog so nothing posted in between is missed
+    sub = chat_hub.subscribe(channel_id)
 
-    return {"status": "sent"}
+    async def watch_disconnect():
+        try:
+            while (await websocket.receive())["type"] != "websocket.disconnect":
+                pass
+        finally:
+            sub.closed = True
+            sub.event.set()
 
-@app.get("/get_messages")
-async def get_messages(channel_id: str):
-    return [msg for msg in messages_db if msg["channel_id"] == channel_id]
+    watcher = asyncio.create_task(watch_disconnect())
+    try:
+        last_seq = since
+        for msg in await chat_history(channel_id, since):
+            await websocket.send_json(msg)
+            last_seq = msg["seq"]
+        while True:
+            await sub.event.wait()
+            sub.event.clear()
+            if sub.closed:
+                return
+            for msg in sub.drain():
+                if msg["seq"] > last_seq:
+                    await websocket.send_json(msg)
+                    last_seq = msg["seq"]
+            if sub.overflowed:
+                await websocket.close(code=1013, reason="slow consumer, reconnect with since")
+                return
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        watcher.cancel()
+        chat_hub.unsubscribe(channel_id, sub)
+
+# ==============================
+# Metrics endpoint (Prometheus text format)
+# ==============================
+@metrics.collector
+def component_metrics():
+    """Samples taken from the components' stats() at scrape time, so nothing extra runs per request."""
+    yield "tts_model_ready", "gauge", "1 once the model is loaded and warmed up.", [({}, int(startup_status.ready))]
+
+    speaker, audio = speaker_cache.stats(), audio_cache.stats()
+    yield "tts_cache_hits_total", "counter", "Cache lookups served from the cache.", [
+        ({"cache": "speaker"}, speaker["hits"]), ({"cache": "audio"}, audio["hits"]), ({"cache": "audio_disk"}, audio["disk_hits"])]
+    yield "tts_cache_misses_total", "counter", "Cache lookups that missed.", [
+        ({"cache": "speaker"}, speaker["misses"]), ({"cache": "audio"}, audio["misses"])]
+    yield "tts_cache_evictions_total", "counter", "Entries evicted for space.", [
+        ({"cache": "speaker"}, speaker["evictions"]), ({"cache": "audio"}, audio["evictions"])]
+    yield "tts_cache_entries", "gauge", "Entries held.", [
+        ({"cache": "speaker"}, speaker["entries"]), ({"cache": "audio"}, audio["mem_entries"]), ({"cache": "audio_disk"}, audio["disk_entries"])]
+    yield "tts_cache_bytes", "gauge", "Bytes held.", [
+        ({"cache": "speaker"}, speaker["resident_bytes"]), ({"cache": "audio"}, audio["mem_bytes"]), ({"cache": "audio_disk"}, audio["disk_bytes"])]
+
+    flights = {"latents": latent_flight.stats(), "synthesis": synthesis_flight.stats()}
+    yield "tts_singleflight_leaders_total", "counter", "Calls that did the work.", [({"flight": k}, v["leaders"]) for k, v in flights.items()]
+    yield "tts_singleflight_shared_total", "counter", "Calls that joined work already running.", [({"flight": k}, v["shared"]) for k, v in flights.items()]
+
+    sched = batch_scheduler.stats()
+    yield "tts_scheduler_queued", "gauge", "Segments waiting for a batch.", [({}, sched["queued"])]
+    yield "tts_scheduler_batches_total", "counter", "Micro-batches run.", [({}, sched["batches"])]
+    yield "tts_scheduler_jobs_total", "counter", "Segments run.", [({}, sched["jobs"])]
+    yield "tts_scheduler_expired_total", "counter", "Segments failed unrun past their deadline.", [({}, sched["expired"])]
+
+    classes = admission.stats()
+    yield "tts_admission_in_flight", "gauge", "Admitted requests queued or running.", [
+        ({"priority": name}, c["in_flight"]) for name, c in classes.items()]
+    yield "tts_admission_total", "counter", "Admission decisions and outcomes.", [
+        ({"priority": name, "outcome": k}, n) for name, counts in admission.counts.items() for k, n in counts.items()]
+    lock = inference_lock.stats()
+    yield "tts_model_lock_held", "gauge", "1 while the model lock is held.", [({}, int(lock["locked"]))]
+    yield "tts_model_lock_waiting", "gauge", "Waiters for the model lock.", [({"priority": k}, v) for k, v in lock["waiting"].items()]
+
+    if replica_pool is not None:
+        rep = replica_pool.stats()
+        yield "tts_replica_pending", "gauge", "Segments sent to a replica and not answered.", [({"replica": str(i)}, n) for i, n in enumerate(rep["pending"])]
+        yield "tts_replicas_failed", "gauge", "Replica processes that exited (they are not restarted).", [({}, len(rep["failed"]))]
+
+    chat = chat_store.stats()
+    yield "chat_channels", "gauge", "Channels with retained messages.", [({}, chat["channels"])]
+    yield "chat_messages", "gauge", "Retained messages.", [({}, chat["messages"])]
+    yield "chat_messages_total", "counter", "Messages posted.", [({}, chat["last_seq"])]
+    if chat_log is not None:
+        log = chat_log.stats()
+        yield "chat_log_segments", "gauge", "Live chat log segments.", [({}, log["segments"])]
+        yield "chat_log_bytes", "gauge", "Chat log size on disk.", [({}, log["disk_bytes"])]
+        yield "chat_log_commits_total", "counter", "Group commits (one fsync each).", [({}, log["commits"])]
+        yield "chat_log_committed_total", "counter", "Messages written by this process.", [({}, log["committed"])]
+        yield "chat_log_disk_reads_total", "counter", "History reads served from disk.", [({}, log["disk_reads"])]
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Stage/request histograms, real-time factor and cache/queue statistics in the Prometheus text format."""
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+startup_status.since_module_start("module_import_s")
 
 # ==============================
 # Run server
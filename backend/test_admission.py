@@ -0,0 +1,114 @@
+import asyncio
+import time
+import types
+from contextlib import nullcontext
+
+import numpy as np
+import pytest
+
+server = pytest.importorskip("server")
+
+
+def test_lock_serves_priority_classes_in_order():
+    async def main():
+        lock = server.PriorityLock()
+        order = []
+
+        async def waiter(priority, tag):
+            async with lock.hold(priority):
+                order.append(tag)
+
+        await lock.acquire()
+        tasks = [asyncio.ensure_future(waiter(p, t)) for p, t in [(2, "clone"), (1, "batch"), (0, "live1"), (0, "live2")]]
+        await asyncio.sleep(0)
+        assert lock.stats()["waiting"] == {"interactive": 2, "batch": 1, "background": 1}
+        lock.release()
+        await asyncio.gather(*tasks)
+        return order, lock
+
+    order, lock = asyncio.run(main())
+    assert order == ["live1", "live2", "batch", "clone"]
+    assert not lock.locked()
+
+
+def test_lock_deadline_and_cancellation_do_not_leak_the_lock():
+    async def main():
+        lock = server.PriorityLock()
+        await lock.acquire()
+        with pytest.raises(server.DeadlineExceeded):
+            await lock.acquire(0, deadline=time.monotonic() + 0.01)
+        gone = asyncio.ensure_future(lock.acquire(0))
+        await asyncio.sleep(0)
+        gone.cancel()
+        lock.release()
+        await asyncio.wait_for(lock.acquire(1), 1)
+        assert lock.locked()
+
+    asyncio.run(main())
+
+
+def test_admission_rejects_fast_and_counts_outcomes():
+    controller = server.AdmissionController({"interactive": 1, "batch": 1, "background": 1}, {"interactive": 500, "batch": 0, "background": 0})
+    ticket = controller.admit("interactive")
+    assert ticket.deadline is not None and ticket.deadline > time.monotonic()
+    with pytest.raises(server.HTTPException) as e:
+        controller.admit("interactive")
+    assert e.value.status_code == 429 and int(e.value.headers["Retry-After"]) >= 1
+    ticket.finish(server.ClientDisconnected())
+    ticket.finish()  # idempotent
+    with controller.admit("interactive", deadline_ms=0) as t:
+        assert t.deadline is None
+    with pytest.raises(server.HTTPException) as e:
+        controller.admit("urgent")
+    assert e.value.status_code == 400
+    stats = controller.stats()["interactive"]
+    assert (stats["admitted"], stats["rejected"], stats["disconnected"], stats["completed"], stats["in_flight"]) == (2, 1, 1, 1, 0)
+
+
+def test_scheduler_runs_interactive_first_and_drops_expired(monkeypatch):
+    ran = []
+
+    def fake_job(text, language, gpt_latent, speaker_latent, params):
+        ran.append(text)
+        return np.zeros(10, dtype=np.float32)
+
+    monkeypatch.setattr(server, "torch", types.SimpleNamespace(inference_mode=nullcontext))
+    monkeypatch.setattr(server, "run_inference_job", fake_job)
+    monkeypatch.setattr(server, "inference_lock", server.PriorityLock())
+
+    async def main():
+        scheduler = server.BatchScheduler(window_s=0.0, max_batch=8)
+        await server.inference_lock.acquire()  # model busy while the queue fills up
+        batch = [asyncio.ensure_future(scheduler.submit(f"b{i}", "en", None, None, {}, priority=1)) for i in range(3)]
+        expired = asyncio.ensure_future(scheduler.submit("late", "en", None, None, {}, deadline=time.monotonic() - 1))
+        live = asyncio.ensure_future(scheduler.submit("live", "en", None, None, {}, priority=0))
+        await asyncio.sleep(0.05)
+        server.inference_lock.release()
+        await asyncio.gather(*batch, live)
+        with pytest.raises(server.DeadlineExceeded):
+            await expired
+        return scheduler
+
+    scheduler = asyncio.run(main())
+    assert "late" not in ran
+    assert ran.index("live") < ran.index("b2")
+    assert scheduler.expired == 1
+
+
+def test_scheduler_without_a_window_takes_what_is_queued(monkeypatch):
+    monkeypatch.setattr(server, "torch", types.SimpleNamespace(inference_mode=nullcontext))
+    monkeypatch.setattr(server, "run_inference_job", lambda *args: np.zeros(10, dtype=np.float32))
+    monkeypatch.setattr(server, "inference_lock", server.PriorityLock())
+
+    async def main():
+        scheduler = server.BatchScheduler(window_s=0.0, max_batch=8)
+        await server.inference_lock.acquire()
+        jobs = [asyncio.ensure_future(scheduler.submit(f"m{i}", "en", None, None, {})) for i in range(5)]
+        await asyncio.sleep(0.05)
+        server.inference_lock.release()
+        await asyncio.gather(*jobs)
+        return scheduler
+
+    scheduler = asyncio.run(main())
+    # all five were queued before the scheduler first looked, so they share one batch
+    assert (scheduler.batches, scheduler.max_batch_seen) == (1, 5)
@@ -0,0 +1,57 @@
+import os
+
+import pytest
+
+server = pytest.importorskip("server")
+
+PARAMS = {"temperature": 0.65, "top_p": 0.8}
+
+
+def key(text="Hello there", speaker_hash="a" * 64, **kw):
+    return server.audio_cache_key(text, "en", speaker_hash, {**PARAMS, **kw.pop("params", {})}, **kw)
+
+
+def test_key_covers_everything_that_changes_the_audio():
+    base = key()
+    assert key("Hello   there") == base  # whitespace-normalized
+    assert key("Hello there!") != base
+    assert key(speaker_hash="b" * 64) != base
+    assert key(params={"temperature": 0.7}) != base
+    assert key(fmt="flac") != base
+    assert key(sample_rate=16000) != base
+
+
+def test_hits_misses_and_the_memory_cap():
+    cache = server.AudioCache(max_bytes=100)
+    assert cache.get("k1") is None
+    cache.put("k1", "s" * 64, b"x" * 40)
+    cache.put("k2", "s" * 64, b"y" * 40)
+    assert cache.get("k1") == b"x" * 40  # k2 is now the least recently used
+    cache.put("k3", "s" * 64, b"z" * 40)
+    assert cache.get("k2") is None and cache.get("k3") == b"z" * 40
+    cache.put("huge", "s" * 64, b"h" * 101)  # larger than the whole cache: not stored
+    assert cache.get("huge") is None
+    stats = cache.stats()
+    assert stats["mem_bytes"] <= 100
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (2, 3, 1)
+
+
+def test_reclone_gets_a_new_key_and_purges_the_old_voice(tmp_path):
+    cache = server.AudioCache(max_bytes=1 << 20, disk_dir=str(tmp_path), disk_max_bytes=1 << 20)
+    old_hash, new_hash, other_hash = "a" * 64, "b" * 64, "c" * 64
+    old_key = key(speaker_hash=old_hash)
+    cache.put(old_key, old_hash, b"old voice")
+    cache.put(key("Other", speaker_hash=old_hash), old_hash, b"old voice 2")
+    cache.put(key(speaker_hash=other_hash), other_hash, b"someone else")
+
+    new_key = key(speaker_hash=new_hash)
+    assert new_key != old_key
+    cache.invalidate_speaker(old_hash)
+    assert cache.get(old_key) is None
+    assert not os.path.exists(os.path.join(tmp_path, old_hash[:16]))
+    assert cache.get(key(speaker_hash=other_hash)) == b"someone else"
+
+    # nothing of the old voice survives a restart either
+    reopened = server.AudioCache(max_bytes=1 << 20, disk_dir=str(tmp_path), disk_max_bytes=1 << 20)
+    assert reopened.get(old_key) is None and reopened.get(new_key) is None
+    assert reopened.get(key(speaker_hash=other_hash)) == b"someone else"
@@ -0,0 +1,125 @@
+import asyncio
+import os
+
+import pytest
+
+server = pytest.importorskip("server")
+
+
+def make_log(path, **kw):
+    hot = server.ChatStore(capacity=kw.pop("capacity", 100), max_bytes=1 << 20)
+    published = []
+    log = server.ChatLog(str(path), hot, published.append, **{"fsync": False, **kw})
+    log.open()
+    return log, published
+
+
+def post(log, items):
+    async def run():
+        return await asyncio.gather(*(log.append(ch, text, "u") for ch, text in items))
+    return asyncio.run(run())
+
+
+def texts(msgs):
+    return [m["text"] for m in msgs]
+
+
+def test_concurrent_appends_are_group_committed_in_order(tmp_path):
+    log, published = make_log(tmp_path)
+    msgs = post(log, [("a" if i % 2 else "b", f"m{i}") for i in range(20)])
+    assert [m["seq"] for m in msgs] == list(range(1, 21))
+    assert log.commits < 20
+    assert [m["seq"] for m in published] == list(range(1, 21))
+    assert texts(log.read("a")) == [f"m{i}" for i in range(1, 20, 2)]
+    assert texts(log.recent("b", since=10)) == [f"m{i}" for i in range(10, 20, 2)]
+
+
+def test_restart_keeps_history_and_drops_a_torn_tail(tmp_path):
+    log, _ = make_log(tmp_path)
+    post(log, [("a", "one"), ("a", "two")])
+    segment = log._segments[-1]
+    # a crash after the log write but before the index write, then a torn record
+    idx_size = os.path.getsize(segment.idx_path)
+    post(log, [("a", "three")])
+    with open(segment.idx_path, "r+b") as f:
+        f.truncate(idx_size + 5)
+    with open(segment.log_path, "ab") as f:
+        f.write(b"\x40\x00\x00\x00garbage")
+
+    log, _ = make_log(tmp_path)
+    assert texts(log.hot.since("a")) == ["one", "two", "three"]
+    assert texts(post(log, [("a", "four")])) == ["four"]
+    assert [m["seq"] for m in log.read("a")] == [1, 2, 3, 4]
+
+
+def test_rotation_and_range_reads_from_sealed_segments(tmp_path):
+    log, _ = make_log(tmp_path, segment_bytes=512, capacity=3, compact_segments=0)
+    for i in range(40):
+        post(log, [("a" if i % 3 else "b", f"m{i}")])
+    assert len(log._segments) > 3
+    assert all(os.path.exists(seg.chx_path) for seg in log._segments[:-1])
+
+    msgs = log.read("a")
+    assert texts(msgs) == [f"m{i}" for i in range(40) if i % 3]
+    t = [m["timestamp"] for m in msgs]
+    assert texts(log.read("a", start_ts=t[5], end_ts=t[9])) == texts(msgs[5:9])
+    assert texts(log.read("a", since=msgs[10]["seq"], limit=3)) == texts(msgs[11:14])
+    # the hot tier only holds the last 3 messages of a channel, older ones come from disk
+    assert log.recent("a") is None
+    assert texts(log.recent("a", since=msgs[-4]["seq"])) == texts(msgs[-3:])
+
+
+def test_compaction_applies_retention_and_per_channel_limits(tmp_path):
+    log, _ = make_log(tmp_path, segment_bytes=512, keep_per_channel=5, compact_segments=0)
+    for i in range(60):
+        post(log, [("a" if i % 2 else "b", f"m{i}")])
+    sealed = len(log._segments) - 1
+    dropped = log.compact()
+    assert dropped > 0 and len(log._segments) - 1 < sealed
+    a = log.read("a")
+    assert len(a) >= 5 and texts(a)[-5:] == [f"m{i}" for i in range(51, 60, 2)]
+
+    log.keep_per_channel, log.retention_s = 0, 60
+    log.compact(now=a[-1]["timestamp"] + 3600)
+    assert len(log.read("b")) < 5
+    assert log.read("a", since=a[-1]["seq"] - 1)[-1]["text"] == "m59"
+
+
+def test_a_second_process_reads_and_appends_to_the_same_log(tmp_path):
+    writer, _ = make_log(tmp_path, segment_bytes=512)
+    reader, published = make_log(tmp_path, segment_bytes=512)
+    for i in range(30):
+        post(writer, [("a", f"w{i}")])
+    reader.refresh()
+    assert texts(published) == [f"w{i}" for i in range(30)]
+    assert texts(reader.read("a")) == [f"w{i}" for i in range(30)]
+    # sequence numbers continue across writers
+    assert post(reader, [("a", "r0")])[0]["seq"] == 31
+    assert texts(writer.read("a", since=30)) == ["r0"]
+
+
+def test_ring_drops_fall_back_to_the_log(tmp_path):
+    hot = server.ChatStore(capacity=2, max_bytes=1 << 20)
+    for i in range(4):
+        hot.append("a", f"m{i}", "u")
+    assert not hot.covers("a", 0) and hot.covers("a", 2)
+    assert hot.covers("b", 0)
+    hot.floor_seq = 3
+    assert not hot.covers("b", 0) and hot.covers("b", 3)
+
+
+def test_history_without_a_limit_is_the_newest_ring_capacity(tmp_path, monkeypatch):
+    log, _ = make_log(tmp_path, segment_bytes=512, capacity=3, compact_segments=0)
+    for i in range(40):
+        post(log, [("a" if i % 3 else "b", f"m{i}")])
+    monkeypatch.setattr(server, "chat_log", log)
+    monkeypatch.setattr(server, "chat_store", log.hot)
+    a = [f"m{i}" for i in range(40) if i % 3]
+    assert texts(asyncio.run(server.chat_history("a"))) == a[-3:]
+    assert texts(log.read("a", limit=5, newest=True)) == a[-5:]
+    # an explicit limit pages forward from since
+    assert texts(asyncio.run(server.chat_history("a", limit=4))) == a[:4]
+    # a poll within the follow interval does not re-read the manifest
+    log._refreshed = server.time.monotonic()
+    monkeypatch.setattr(log, "_load_manifest", lambda: pytest.fail("refreshed again"))
+    assert texts(log.recent("a", since=36)) == a[-2:]
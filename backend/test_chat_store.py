@@ -0,0 +1,41 @@
+import pytest
+
+server = pytest.importorskip("server")
+
+
+def test_since_pages_through_a_channel_by_seq():
+    store = server.ChatStore(capacity=100, max_bytes=1 << 20)
+    for i in range(10):
+        store.append("a" if i % 2 else "b", f"m{i}", "u")
+    msgs = store.since("a")
+    assert [m["text"] for m in msgs] == ["m1", "m3", "m5", "m7", "m9"]
+    assert [m["seq"] for m in msgs] == [2, 4, 6, 8, 10]
+    # a client resumes from the last seq it saw, including seqs of other channels
+    assert [m["text"] for m in store.since("a", 4)] == ["m5", "m7", "m9"]
+    assert [m["text"] for m in store.since("a", 5)] == ["m5", "m7", "m9"]
+    assert store.since("a", 10) == []
+    assert store.since("nobody") == []
+
+
+def test_capacity_keeps_the_newest_per_channel():
+    store = server.ChatStore(capacity=3, max_bytes=1 << 20)
+    for i in range(5):
+        store.append("a", f"m{i}", "u")
+    assert [m["text"] for m in store.since("a")] == ["m2", "m3", "m4"]
+
+
+def test_byte_cap_evicts_from_the_least_recently_active_channel():
+    msg_bytes = server.ChatStore.MSG_OVERHEAD + len("x" * 10) + len("u") + len("a")
+    store = server.ChatStore(capacity=100, max_bytes=5 * msg_bytes)
+    for channel in ("a", "b", "c"):
+        store.append(channel, "x" * 10, "u")
+    store.append("a", "x" * 10, "u")  # a is now more recently active than b and c
+    store.append("b", "x" * 10, "u")
+    assert store.total_bytes == 5 * msg_bytes
+    store.append("d", "x" * 10, "u")
+    # c was least recently active: its only message goes and the channel with it
+    assert store.stats()["channels"] == 3 and store.since("c") == []
+    store.append("d", "x" * 10, "u")
+    assert len(store.since("a")) == 1 and len(store.since("b")) == 2
+    assert store.total_bytes <= store.max_bytes
+    assert store.stats()["last_seq"] == 7
@@ -0,0 +1,34 @@
+import asyncio
+import gc
+
+import pytest
+
+server = pytest.importorskip("server")
+
+
+def test_same_speaker_jobs_run_in_order_and_leave_no_lock_behind(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(server, "save_upload", lambda upload, path: open(path, "wb").write(upload))
+    ran = []
+
+    async def process(input_path, target_path, lang, user_id, on_stage=None):
+        ran.append((user_id, open(input_path, "rb").read()))
+        await asyncio.sleep(0.01)
+        return {}
+    monkeypatch.setattr(server, "process_clone_sample", process)
+
+    async def main():
+        jobs = server.CloneJobQueue(concurrency=2, history=100)
+        first = await jobs.submit("u", "en", b"one")
+        await asyncio.sleep(0)  # first is running now, so the next upload queues behind it
+        second = await jobs.submit("u", "en", b"two")
+        other = await jobs.submit("v", "en", b"three")
+        await asyncio.gather(*(job.finished.wait() for job in (first, second, other)))
+        await asyncio.sleep(0)
+        gc.collect()
+        return jobs, (first, second, other)
+
+    jobs, done = asyncio.run(main())
+    assert [job.status for job in done] == ["done"] * 3
+    assert [data for user, data in ran if user == "u"] == [b"one", b"two"]
+    assert len(jobs._key_locks) == 0
@@ -0,0 +1,57 @@
+import pytest
+
+server = pytest.importorskip("server")
+torch = pytest.importorskip("torch")
+
+
+class Conv1D(torch.nn.Module):
+    """Same layout as transformers.pytorch_utils.Conv1D."""
+    def __init__(self, nf, nx):
+        super().__init__()
+        self.nf = nf
+        self.weight = torch.nn.Parameter(torch.randn(nx, nf) * 0.02)
+        self.bias = torch.nn.Parameter(torch.randn(nf) * 0.02)
+
+    def forward(self, x):
+        return torch.addmm(self.bias, x.view(-1, x.size(-1)), self.weight).view(*x.shape[:-1], self.nf)
+
+
+class ToyXtts(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.gpt = torch.nn.Sequential(Conv1D(96, 32), torch.nn.GELU(), Conv1D(32, 96), torch.nn.Linear(32, 32))
+        self.hifigan_decoder = torch.nn.Conv1d(32, 1, 5, padding=2)
+
+
+@pytest.fixture(autouse=True)
+def model_stack(monkeypatch):
+    monkeypatch.setattr(server, "torch", torch)
+
+
+def test_conv1d_swap_is_exact():
+    model = ToyXtts().eval()
+    x = torch.randn(2, 7, 32)
+    ref = model.gpt(x)
+    assert server._hf_conv1d_to_linear(model.gpt) == 2
+    assert not any(type(m).__name__ == "Conv1D" for m in model.modules())
+    assert torch.allclose(model.gpt(x), ref, atol=1e-6)
+
+
+def test_int8_and_bf16_keep_fp32_interfaces():
+    model = ToyXtts().eval()
+    x = torch.randn(2, 7, 32)
+    ref_gpt, ref_dec = model.gpt(x), model.hifigan_decoder(x.transpose(1, 2))
+    applied = server.optimize_cpu_model(model, quantize="int8", bf16="1")
+    assert applied["quantize"].startswith("int8") and applied["bf16"] == ["hifigan_decoder"]
+    with torch.inference_mode():
+        y, d = model.gpt(x), model.hifigan_decoder(x.transpose(1, 2))
+    assert y.dtype == d.dtype == torch.float32
+    assert torch.nn.functional.cosine_similarity(y.flatten(), ref_gpt.flatten(), dim=0) > 0.99
+    assert torch.nn.functional.cosine_similarity(d.flatten(), ref_dec.flatten(), dim=0) > 0.99
+
+
+def test_defaults_change_nothing():
+    model = ToyXtts()
+    applied = server.optimize_cpu_model(model)
+    assert set(applied) == {"threads"}
+    assert isinstance(model.gpt[0], Conv1D)
@@ -0,0 +1,65 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+server = pytest.importorskip("server")
+torch = pytest.importorskip("torch")
+pytest.importorskip("safetensors.torch")
+
+
+@pytest.fixture
+def sample(tmp_path, monkeypatch):
+    config = SimpleNamespace(gpt_cond_len=30, gpt_cond_chunk_len=4)
+    monkeypatch.setattr(server, "tts", SimpleNamespace(synthesizer=SimpleNamespace(tts_model=SimpleNamespace(config=config))))
+    path = tmp_path / "en.wav"
+    path.write_bytes(b"RIFF" + bytes(range(256)) * 8)
+    gpt_latent, speaker_latent = torch.randn(1, 32, 1024), torch.randn(1, 512, 1)
+    assert server.save_latent_store(str(path), gpt_latent, speaker_latent) == server.latent_store_path(str(path))
+    return str(path), gpt_latent, speaker_latent, config
+
+
+def test_round_trip(sample):
+    path, gpt_latent, speaker_latent, _ = sample
+    loaded = server.load_latent_store(path)
+    assert loaded is not None
+    assert torch.equal(loaded[0], gpt_latent) and torch.equal(loaded[1], speaker_latent)
+
+
+def test_touched_but_identical_sample_still_loads(sample):
+    path = sample[0]
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    assert server.load_latent_store(path) is not None
+
+
+@pytest.mark.parametrize("rewrite", ["longer", "same_size", "encoder_settings"])
+def test_stale_store_is_rejected(sample, rewrite):
+    path, _, _, config = sample
+    st = os.stat(path)
+    data = open(path, "rb").read()
+    if rewrite == "longer":
+        data += b"more audio"  # mtime is put back below; the size change triggers the hash check
+    elif rewrite == "same_size":
+        data = data[:-1] + bytes([data[-1] ^ 0xFF])
+    with open(path, "wb") as f:
+        f.write(data)
+    if rewrite == "same_size":
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    else:
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+    if rewrite == "encoder_settings":
+        config.gpt_cond_len = 12
+    assert server.load_latent_store(path) is None
+
+
+def test_unreadable_or_old_version_store_is_ignored(sample, monkeypatch):
+    path = sample[0]
+    version = server.LATENT_STORE_VERSION
+    monkeypatch.setattr(server, "LATENT_STORE_VERSION", "0")
+    assert server.load_latent_store(path) is None
+    monkeypatch.setattr(server, "LATENT_STORE_VERSION", version)
+    assert server.load_latent_store(path) is not None
+    with open(server.latent_store_path(path), "wb") as f:
+        f.write(b"not a safetensors file")
+    assert server.load_latent_store(path) is None
@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+
+server = pytest.importorskip("server")
+sf = pytest.importorskip("soundfile")
+
+from test_trim_silence import speech_like
+
+
+def test_histogram_and_counter_exposition():
+    reg = server.MetricsRegistry()
+    h = reg.histogram("x_seconds", "X.", ("stage",), buckets=(0.1, 1))
+    c = reg.counter("x_total", "X.", ("outcome",))
+    for v in (0.05, 0.5, 5):
+        h.observe(v, 'a"b')
+    c.inc(1, "ok")
+    c.inc(2, "ok")
+
+    @reg.collector
+    def extra():
+        yield "x_ready", "gauge", "Ready.", [({}, 1)]
+
+    lines = reg.render().splitlines()
+    assert '# TYPE x_seconds histogram' in lines
+    assert 'x_seconds_bucket{stage="a\\"b",le="0.1"} 1' in lines
+    assert 'x_seconds_bucket{stage="a\\"b",le="1"} 2' in lines
+    assert 'x_seconds_bucket{stage="a\\"b",le="+Inf"} 3' in lines
+    assert 'x_seconds_count{stage="a\\"b"} 3' in lines
+    assert 'x_seconds_sum{stage="a\\"b"} 5.55' in lines
+    assert 'x_total{outcome="ok"} 3' in lines
+    assert 'x_ready 1' in lines
+
+
+def test_spans_follow_the_request_into_threads_and_tasks():
+    def timed(stage):
+        with server.span(stage):
+            pass
+
+    async def request():
+        with server.traced("test_pipeline") as trace:
+            timed("resolve")
+            await server.run_model(timed, "model")
+            await asyncio.to_thread(timed, "dsp")
+
+            async def sub():
+                timed("task")
+            await asyncio.ensure_future(sub())
+            trace.outcome = "miss"
+        # outside the block spans go nowhere
+        timed("late")
+        return trace
+
+    trace = asyncio.run(request())
+    assert list(trace.totals()) == ["resolve", "model", "dsp", "task"]
+    assert trace.finished
+    assert 'tts_requests_total{endpoint="test_pipeline",outcome="miss"} 1' in server.metrics.render()
+
+
+def test_model_thread_spans_reach_the_submitting_request():
+    async def request():
+        with server.traced("test_model") as trace:
+            job = server.InferenceJob("hi", "en", None, None, {}, asyncio.get_running_loop().create_future())
+
+            def work():
+                token = server._current_trace.set(job.trace)
+                try:
+                    with server.span("inference"):
+                        pass
+                finally:
+                    server._current_trace.reset(token)
+            await server.run_model(work)
+            with server.span("encode"):
+                await server.run_model(lambda: None)
+        return trace
+
+    trace = asyncio.run(request())
+    assert list(trace.totals()) == ["inference", "encode"]
+    assert "inference;dur=" in trace.server_timing()
+    text = server.metrics.render()
+    assert 'tts_stage_seconds_count{pipeline="test_model",stage="inference"} 1' in text
+
+
+def test_http_errors_set_the_outcome():
+    with pytest.raises(server.HTTPException):
+        with server.traced("test_errors"):
+            raise server.HTTPException(status_code=404)
+    assert 'tts_requests_total{endpoint="test_errors",outcome="404"} 1' in server.metrics.render()
+
+
+def test_preprocess_returns_stage_spans(tmp_path):
+    x, _, _ = speech_like(44100, 0.5, 31.0, 0.5, noise_db=-55)
+    src = tmp_path / "in.wav"
+    sf.write(src, x, 44100)
+    spans, warning = server.preprocess_sample_traced(str(src), str(tmp_path / "out.wav"), streaming=False)
+    assert warning is None
+    assert {"read", "resample", "trim_silence", "normalize", "write"} <= {stage for stage, _ in spans}
+    spans, warning = server.preprocess_sample_traced(str(src), str(tmp_path / "out2.wav"), streaming=True)
+    assert warning is None
+    assert {"read_resample", "trim_silence", "write"} <= {stage for stage, _ in spans}
+    short = tmp_path / "short.wav"
+    sf.write(short, x[:44100 * 5], 44100)
+    spans, warning = server.preprocess_sample_traced(str(short), str(tmp_path / "out3.wav"), streaming=False)
+    assert "too short" in warning and spans
+
+
+def test_component_metrics_render():
+    text = server.metrics.render()
+    assert "tts_model_ready " in text
+    assert 'tts_cache_hits_total{cache="speaker"}' in text
+    assert 'tts_admission_total{priority="interactive",outcome="admitted"}' in text
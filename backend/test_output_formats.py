@@ -0,0 +1,47 @@
+import io
+
+import numpy as np
+import pytest
+
+server = pytest.importorskip("server")
+sf = pytest.importorskip("soundfile")
+
+
+def test_form_value_wins_over_accept():
+    assert server.negotiate_format("FLAC", "audio/ogg") == "flac"
+    with pytest.raises(server.HTTPException):
+        server.negotiate_format("mp3", None)
+
+
+@pytest.mark.parametrize("accept, expected", [
+    (None, "wav"),
+    ("*/*", "wav"),
+    ("audio/flac;q=0.9, audio/wav;q=0.5", "flac"),
+    ("audio/wav;q=0.5, audio/ogg; codecs=opus", "opus"),
+    ("audio/ogg;q=0, audio/x-flac", "flac"),
+    ("text/html, application/json", "wav"),
+])
+def test_accept_negotiation(accept, expected):
+    if expected not in server.AVAILABLE_OUTPUT_FORMATS:
+        pytest.skip(f"{expected} not supported by this libsndfile")
+    assert server.negotiate_format(None, accept) == expected
+
+
+@pytest.mark.parametrize("fmt", ["wav", "flac", "ogg", "opus"])
+def test_incremental_encoding_matches_final_file(fmt):
+    if fmt not in server.AVAILABLE_OUTPUT_FORMATS:
+        pytest.skip(f"{fmt} not supported by this libsndfile")
+    sr = 24000
+    x = (0.5 * np.sin(2 * np.pi * 220 * np.arange(sr * 2) / sr)).astype(np.float32)
+    enc = server.AudioEncoder(fmt, sr, channels=2)
+    parts = [enc.encode(np.zeros(0, dtype=np.float32))]
+    parts += [enc.encode(x[i:i + 3000]) for i in range(0, len(x), 3000)]
+    parts.append(enc.close())
+    streamed, final = b"".join(parts), enc.getvalue()
+    assert len(streamed) == len(final) == enc.bytes_out
+    # only the header fields patched at close may differ (WAV sizes, FLAC STREAMINFO)
+    assert streamed[64:] == final[64:]
+    data, rate = sf.read(io.BytesIO(final))
+    assert rate == sr and data.shape == (len(x), 2)
+    if fmt in ("wav", "flac"):
+        assert np.max(np.abs(data[:, 0] - x)) < 1e-4
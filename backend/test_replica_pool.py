@@ -0,0 +1,121 @@
+import asyncio
+import queue
+from collections import Counter
+
+import pytest
+
+server = pytest.importorskip("server")
+
+SPEAKERS = [f"speakers/user{i}/{lang}.wav" for i in range(500) for lang in ("en", "hi")]
+
+
+def test_ring_lookup_is_stable_and_spread():
+    a, b = server.HashRing(range(4)), server.HashRing(range(4))
+    owners = {key: a.lookup(key) for key in SPEAKERS}
+    assert all(b.lookup(key) == owner for key, owner in owners.items())
+    load = Counter(owners.values())
+    assert set(load) == {0, 1, 2, 3}
+    assert max(load.values()) < 2 * min(load.values())
+
+
+def test_removing_a_replica_only_remaps_its_own_speakers():
+    full, without_2 = server.HashRing(range(4)), server.HashRing([0, 1, 3])
+    moved = [key for key in SPEAKERS if full.lookup(key) != without_2.lookup(key)]
+    assert moved and all(full.lookup(key) == 2 for key in moved)
+    assert len(moved) == sum(full.lookup(key) == 2 for key in SPEAKERS)
+
+
+def pool_without_processes(n):
+    pool = object.__new__(server.ReplicaPool)
+    pool.num_replicas = n
+    pool._ring = server.HashRing(range(n))
+    pool._requests = [queue.Queue() for _ in range(n)]
+    pool._pending = {}
+    pool._queued = [[] for _ in range(n)]
+    pool._running = [None] * n
+    pool._lock = server.threading.Lock()
+    pool._job_ids = server.itertools.count()
+    pool.jobs = [0] * n
+    pool.failed = set()
+    return pool
+
+
+def test_invalidate_goes_to_the_replica_that_owns_the_speaker():
+    pool = pool_without_processes(3)
+    for key in SPEAKERS[:30]:
+        pool.invalidate(key)
+        owner = pool.replica_for(key)
+        assert pool._requests[owner].get_nowait() == ("invalidate", key)
+        assert all(q.empty() for q in pool._requests)
+
+
+class Proc:
+    def __init__(self, alive=True):
+        self.alive = alive
+        self.exitcode = None if alive else -9
+
+    def is_alive(self):
+        return self.alive
+
+
+def test_a_dead_replica_is_routed_around_not_reforked(monkeypatch):
+    pool = pool_without_processes(3)
+    pool._procs = [Proc(), Proc(alive=False), Proc()]
+    failed_jobs = []
+    pool._pending = {7: (None, None, 1), 8: (None, None, 0)}
+    monkeypatch.setattr(pool, "_resolve", lambda job_id, wav, err: failed_jobs.append(job_id))
+    monkeypatch.setattr(pool, "_spawn", lambda index: pytest.fail("re-forked a replica"))
+    owners = {key: pool.replica_for(key) for key in SPEAKERS}
+
+    pool._check_replicas()
+    assert pool.failed == {1} and failed_jobs == [7]
+    # only the dead replica's speakers move
+    for key, owner in owners.items():
+        assert pool.replica_for(key) == owner if owner != 1 else pool.replica_for(key) in (0, 2)
+    pool._check_replicas()
+    assert failed_jobs == [7]
+
+    pool._procs[0].alive = pool._procs[2].alive = False
+    pool._check_replicas()
+    assert not pool.available
+    pool.invalidate(SPEAKERS[0])  # nothing left to tell
+
+
+def test_a_replica_takes_one_job_at_a_time_interactive_first():
+    pool = pool_without_processes(1)
+    sent = pool._requests[0]
+
+    async def main():
+        waits_before = len(server.admission._waits["interactive"])
+        jobs = [asyncio.ensure_future(pool.submit("s.wav", text, "en", {}, server.PRIORITIES[name]))
+                for text, name in [("first", "background"), ("later", "batch"), ("urgent", "interactive")]]
+        await asyncio.sleep(0)
+        order = []
+        while len(order) < 3:
+            msg = sent.get_nowait()
+            assert sent.empty()  # nothing else is handed over before this one is answered
+            order.append(msg[2])
+            pool._resolve(msg[1], msg[2], None)
+        assert await asyncio.gather(*jobs) == ["first", "later", "urgent"]
+        assert len(server.admission._waits["interactive"]) == waits_before + 1
+        return order
+
+    assert asyncio.run(main()) == ["first", "urgent", "later"]
+
+
+def test_a_job_cancelled_while_queued_never_reaches_the_replica():
+    pool = pool_without_processes(1)
+    sent = pool._requests[0]
+
+    async def main():
+        running = asyncio.ensure_future(pool.submit("s.wav", "running", "en", {}))
+        queued = asyncio.ensure_future(pool.submit("s.wav", "gone", "en", {}))
+        await asyncio.sleep(0)
+        queued.cancel()
+        await asyncio.gather(queued, return_exceptions=True)
+        msg = sent.get_nowait()
+        pool._resolve(msg[1], msg[2], None)
+        assert await running == "running"
+        assert sent.empty() and pool._running == [None]
+
+    asyncio.run(main())
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+server = pytest.importorskip("server")
+
+
+def test_hindi_and_english_sentence_boundaries():
+    text = "Dr. Rao went home at 5 p.m. today. He said, \"Fine!\" यह पहला वाक्य है। यह दूसरा वाक्य है | और तीसरा॥"
+    assert server.split_sentences(text) == [
+        "Dr. Rao went home at 5 p.m. today.",
+        "He said, \"Fine!\"",
+        "यह पहला वाक्य है।",
+        "यह दूसरा वाक्य है |",
+        "और तीसरा॥",
+    ]
+
+
+def test_no_ends_a_sentence_unless_a_number_follows():
+    assert server.split_sentences("I said no. Then she left.") == ["I said no.", "Then she left."]
+    assert server.split_sentences("Is it ready? No. We wait.") == ["Is it ready?", "No.", "We wait."]
+    assert server.split_sentences("See No. 5 and nos. 7-9 below.") == ["See No. 5 and nos. 7-9 below."]
+    # a committed live-session prefix is not held back by "no."
+    assert server.stable_prefix_end("I said no. Then she", 0, "en") == len("I said no.")
+
+
+@pytest.mark.parametrize("language", ["en", "hi"])
+def test_segments_respect_char_limit(language):
+    limit = server.text_char_limit(language)
+    text = "यह एक लंबा वाक्य है, जो रुकता नहीं " * 20 + "। " + "x" * (limit + 30) + " end."
+    segments = server.segment_text(text, language)
+    assert len(segments) > 2
+    assert all(len(s) <= limit for s in segments)
+    assert " ".join(segments).replace(" ", "") == text.replace(" ", "")
+
+
+def test_short_sentences_ride_along():
+    assert server.segment_text("Hi. Yes. No.", "en") == ["Hi. Yes. No."]
+    assert server.segment_text("   ", "en") == ["   "]
+
+
+@pytest.mark.parametrize("gap_ms", [0, 100])
+def test_stitcher_lengths_and_no_jumps(gap_ms):
+    sr = 24000
+    t = np.arange(sr // 2) / sr
+    a = (0.5 * np.sin(2 * np.pi * 200 * t)).astype(np.float32)
+    b = (-0.5 * np.ones(sr // 2)).astype(np.float32)  # starts far from where a ends
+    st = server.SegmentStitcher(sr, crossfade_ms=10, gap_ms=gap_ms)
+    parts = [st.add(a[:5000]), st.add(a[5000:])]
+    st.boundary()
+    parts += [st.add(b), st.finish()]
+    y = np.concatenate(parts)
+    xf, gap = int(sr * 0.01), int(sr * gap_ms / 1000)
+    assert len(y) == len(a) + len(b) + (gap if gap else -xf)
+    assert np.max(np.abs(y)) <= 0.5 + 1e-6
+    # the step at the boundary is smeared over the crossfade instead of a click
+    assert np.max(np.abs(np.diff(y))) < 0.03  # the 200 Hz tone itself steps by 0.026
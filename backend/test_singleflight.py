@@ -0,0 +1,96 @@
+import asyncio
+import threading
+import time
+import types
+
+import pytest
+
+server = pytest.importorskip("server")
+
+
+def test_threads_share_one_call_and_its_error():
+    flight = server.SingleFlight()
+    calls = []
+    barrier = threading.Barrier(6)
+
+    def work():
+        calls.append(1)
+        time.sleep(0.1)
+        if len(calls) > 1:
+            raise ValueError("bad sample")
+        return "latents"
+
+    def caller(out):
+        barrier.wait()
+        try:
+            out.append(flight.do("speakers/a/en.wav", work))
+        except ValueError as e:
+            out.append(e)
+
+    for expected in ("latents", ValueError):
+        out = []
+        threads = [threading.Thread(target=caller, args=(out,)) for _ in range(6)]
+        [t.start() for t in threads]
+        [t.join() for t in threads]
+        assert len(out) == 6
+        assert all(o == expected if isinstance(expected, str) else isinstance(o, expected) for o in out)
+    assert len(calls) == 2
+    assert flight.stats() == {"in_flight": 0, "leaders": 2, "shared": 10, "errors": 1}
+
+
+def test_concurrent_latent_misses_encode_once(monkeypatch):
+    encoded = []
+
+    def slow_encode(path):
+        encoded.append(path)
+        time.sleep(0.1)
+        return "gpt", "spk"
+
+    monkeypatch.setattr(server, "torch", types.SimpleNamespace(Tensor=type("NoTensor", (), {})))
+    monkeypatch.setattr(server, "load_latent_store", lambda path: None)
+    monkeypatch.setattr(server, "encode_speaker_latents", slow_encode)
+    monkeypatch.setattr(server, "latent_flight", server.SingleFlight())
+    monkeypatch.setattr(server, "speaker_cache", server.SpeakerCache(max_bytes=1 << 20))
+    out = []
+    threads = [threading.Thread(target=lambda: out.append(server.get_speaker_latents("speakers/new/en.wav"))) for _ in range(4)]
+    [t.start() for t in threads]
+    [t.join() for t in threads]
+    assert encoded == ["speakers/new/en.wav"]
+    assert out == [("gpt", "spk")] * 4
+
+
+def test_async_callers_share_work_and_only_cancel_it_together():
+    async def main():
+        flight = server.AsyncSingleFlight()
+        runs = []
+
+        async def render():
+            runs.append(1)
+            await asyncio.sleep(0.05)
+            return b"audio"
+
+        results = await asyncio.gather(*(flight.do("key", render) for _ in range(4)))
+        assert results == [(b"audio", False)] + [(b"audio", True)] * 3
+
+        async def failing():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("model error")
+
+        outcomes = await asyncio.gather(flight.do("bad", failing), flight.do("bad", failing), return_exceptions=True)
+        assert all(isinstance(o, RuntimeError) for o in outcomes)
+
+        a = asyncio.ensure_future(flight.do("key", render))
+        b = asyncio.ensure_future(flight.do("key", render))
+        await asyncio.sleep(0.01)
+        a.cancel()
+        assert (await b) == (b"audio", True)  # the leader left, the follower still gets the result
+
+        c = asyncio.ensure_future(flight.do("key", render))
+        await asyncio.sleep(0.01)
+        c.cancel()
+        await asyncio.sleep(0.06)
+        return flight, runs
+
+    flight, runs = asyncio.run(main())
+    assert len(runs) == 3
+    assert flight.stats() == {"in_flight": 0, "leaders": 4, "shared": 5, "errors": 1, "abandoned": 1}
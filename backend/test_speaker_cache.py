@@ -0,0 +1,67 @@
+import pytest
+
+server = pytest.importorskip("server")
+
+
+class Latent:
+    """Tensor stand-in: only the size accounting is used by the cache."""
+    def __init__(self, nbytes):
+        self.nbytes = nbytes
+
+    def numel(self):
+        return self.nbytes
+
+    def element_size(self):
+        return 1
+
+
+def value(nbytes):
+    return (Latent(nbytes), Latent(0))
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(server.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_byte_budget_evicts_least_recently_used_first():
+    cache = server.SpeakerCache(max_bytes=300)
+    for key in ("a", "b", "c"):
+        cache.put(key, value(100))
+    assert cache.resident_bytes == 300
+    cache.get("a")  # b is now the least recently used
+    cache.put("d", value(100))
+    assert "b" not in cache and {"a", "c", "d"} <= set(cache._entries)
+    cache.put("e", value(250))
+    # as many old entries go as it takes to fit; the newest always stays
+    assert list(cache._entries) == ["e"]
+    assert cache.resident_bytes == 250
+    assert cache.evictions == 4
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = server.SpeakerCache(max_bytes=1000, ttl_s=60)
+    cache.put("a", value(10))
+    clock[0] += 59
+    assert cache.get("a") is not None
+    clock[0] += 2
+    assert cache.get("a") is None
+    assert "a" not in cache and cache.resident_bytes == 0
+    assert cache.expirations == 1 and cache.misses == 1
+
+
+def test_pinned_entries_survive_eviction_and_expiry(clock):
+    cache = server.SpeakerCache(max_bytes=200, ttl_s=60)
+    cache.pin("vip")
+    cache.put("vip", value(100))
+    cache.put("a", value(100))
+    cache.put("b", value(100))
+    assert "vip" in cache and "a" not in cache
+    clock[0] += 3600
+    assert cache.get("vip") is not None
+    assert cache.get("b") is None
+    cache.unpin("vip")
+    cache.put("c", value(150))
+    assert "vip" not in cache
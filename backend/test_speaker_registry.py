@@ -0,0 +1,70 @@
+import pytest
+
+server = pytest.importorskip("server")
+
+
+@pytest.fixture
+def registry(tmp_path):
+    root = tmp_path / "speakers"
+    (root / "alice").mkdir(parents=True)
+    (root / "bob").mkdir()
+    for path in ("alice/en.wav", "alice/hi.wav", "alice/en_in_1234abcd.wav", "bob/hi.wav", "carol_en.wav"):
+        (root / path).write_bytes(b"RIFF")
+    (root / "bob" / "hi.latents.safetensors").write_bytes(b"")
+    reg = server.SpeakerRegistry(str(root))
+    assert reg.scan() == 4
+    return reg, str(root)
+
+
+def test_resolution_order_matches_filesystem_probing(registry):
+    reg, root = registry
+    assert reg.resolve("alice", "hi").path == f"{root}/alice/hi.wav"
+    assert reg.resolve("bob", "en").path == f"{root}/bob/hi.wav"      # other language
+    assert reg.resolve("carol", "en").path == f"{root}/carol_en.wav"  # legacy flat layout
+    assert reg.resolve("nobody", "en").path == f"{root}/carol_en.wav"  # any sample, top level first
+
+
+def test_staging_files_are_not_voices_and_latents_are_tracked(registry):
+    reg, root = registry
+    listing = reg.list()["users"]
+    assert set(listing["alice"]) == {"en", "hi"}
+    assert listing["bob"]["hi"]["has_latents"] is True
+    assert listing["alice"]["en"]["has_latents"] is False
+
+
+def test_register_and_empty_registry(tmp_path):
+    reg = server.SpeakerRegistry(str(tmp_path / "missing"))
+    assert reg.scan() == 0
+    assert reg.resolve("alice", "en") is None
+    reg.register("alice", "en", "speakers/alice/en.wav", content_hash="abc")
+    assert reg.resolve("alice", "hi").path == "speakers/alice/en.wav"
+    assert reg.cached_hash("speakers/alice/en.wav") == "abc"
+
+
+def test_rescan_drops_the_hash_of_a_rewritten_sample(registry, monkeypatch):
+    reg, root = registry
+    speaker_cache = server.SpeakerCache(max_bytes=1 << 20)
+    audio_cache = server.AudioCache(max_bytes=1 << 20)
+    monkeypatch.setattr(server, "speaker_cache", speaker_cache)
+    monkeypatch.setattr(server, "audio_cache", audio_cache)
+    alice, bob = f"{root}/alice/en.wav", f"{root}/bob/hi.wav"
+    with open(bob, "wb") as f:
+        f.write(b"RIFF, bob")
+    reg.scan()
+    old_hash = reg.content_hash(alice)
+    bob_hash = reg.content_hash(bob)
+    speaker_cache.put(alice, ("latents",))
+    audio_cache.put("k-alice", old_hash, b"old voice")
+    audio_cache.put("k-bob", bob_hash, b"bob")
+
+    reg.scan()
+    assert reg.cached_hash(alice) == old_hash  # unchanged files keep their hash
+
+    with open(alice, "wb") as f:
+        f.write(b"RIFF, but a different voice")
+    reg.scan()
+    assert reg.cached_hash(alice) is None
+    assert alice not in speaker_cache
+    assert audio_cache.get("k-alice") is None
+    assert reg.cached_hash(bob) == bob_hash and audio_cache.get("k-bob") == b"bob"
+    assert reg.content_hash(alice) != old_hash
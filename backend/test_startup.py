@@ -0,0 +1,39 @@
+import subprocess
+import sys
+
+import pytest
+
+server = pytest.importorskip("server")
+
+
+def test_import_leaves_heavy_modules_for_later():
+    code = (
+        "import sys, server; "
+        "print('loaded:' + ','.join(m for m in ('torch', 'TTS', 'scipy.signal', 'pyloudnorm', 'noisereduce') if m in sys.modules))"
+    )
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert out.stdout.strip().splitlines()[-1] == "loaded:"
+
+
+def test_synthesis_is_gated_until_ready(monkeypatch):
+    status = server.StartupStatus()
+    monkeypatch.setattr(server, "startup_status", status)
+    status.phase = "load"
+    with pytest.raises(server.HTTPException) as e:
+        server.require_model()
+    assert e.value.status_code == 503 and e.value.headers["Retry-After"]
+    status.phase = "failed"
+    status.error = "no weights"
+    with pytest.raises(server.HTTPException) as e:
+        server.require_model()
+    assert "no weights" in e.value.detail
+    status.phase = "ready"
+    server.require_model()
+
+
+def test_stage_timings():
+    status = server.StartupStatus()
+    with status.stage("load"):
+        pass
+    assert status.phase == "load" and status.timings["load_s"] >= 0
+    assert status.to_dict()["ready"] is False
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+server = pytest.importorskip("server")
+sf = pytest.importorskip("soundfile")
+scipy_signal = pytest.importorskip("scipy.signal")
+
+from test_trim_silence import speech_like
+
+
+@pytest.mark.parametrize("orig_sr", [16000, 22050, 44100, 48000])
+def test_resampler_matches_resample_poly_across_blocks(orig_sr):
+    x = np.random.default_rng(orig_sr).normal(size=orig_sr * 2).astype(np.float32)
+    g = np.gcd(orig_sr, 24000)
+    design = server.polyphase_design(orig_sr, 24000)
+    ref = scipy_signal.resample_poly(x, 24000 // g, orig_sr // g, window=design.lowpass)
+    r = server.StreamingResampler(orig_sr, 24000)
+    y = np.concatenate([r.process(x[i:i + 5003]) for i in range(0, len(x), 5003)] + [r.flush()])
+    assert len(y) == len(ref)
+    assert np.max(np.abs(y - ref)) < 1e-5
+
+
+def test_one_shot_resample_and_design_cache():
+    x = np.random.default_rng(0).normal(size=44100).astype(np.float32)
+    server.polyphase_design.cache_clear()
+    y = server.resample(x, 44100, 24000)
+    assert len(y) == 24000
+    r = server.StreamingResampler(44100, 24000)
+    assert np.array_equal(np.concatenate([r.process(x), r.flush()]), y)
+    assert server.polyphase_design.cache_info().hits >= 1
+    assert np.array_equal(server.resample(x, 24000, 24000), x)
+
+
+def test_streaming_matches_in_memory(tmp_path):
+    sr = 44100
+    x, _, _ = speech_like(sr, 1.0, 32.0, 1.0, noise_db=-55)
+    src = tmp_path / "in.wav"
+    sf.write(src, np.stack([x, 0.8 * x], axis=1), sr)
+    server.preprocess_and_save_sample(str(src), str(tmp_path / "a.wav"), streaming=False)
+    server.preprocess_and_save_sample(str(src), str(tmp_path / "b.wav"), streaming=True)
+    a, _ = sf.read(tmp_path / "a.wav")
+    b, _ = sf.read(tmp_path / "b.wav")
+    assert len(a) == len(b)
+    if server.optional_import("noisereduce") is None:
+        # without noisereduce both paths are the same filters, up to PCM16 rounding
+        assert np.max(np.abs(a - b)) <= 2 / 32768
+    assert abs(20 * np.log10(np.sqrt(np.mean(b ** 2))) - 20 * np.log10(np.sqrt(np.mean(a ** 2)))) < 0.5
+
+
+def test_streaming_rejects_short_input(tmp_path):
+    x, _, _ = speech_like(24000, 0.5, 5.0, 0.5)
+    src = tmp_path / "short.wav"
+    sf.write(src, x, 24000)
+    with pytest.raises(ValueError):
+        server.preprocess_and_save_sample(str(src), str(tmp_path / "out.wav"), streaming=True)
+    assert not (tmp_path / "out.wav").exists()
+    assert list(tmp_path.iterdir()) == [src]
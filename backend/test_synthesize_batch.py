@@ -0,0 +1,33 @@
+import io
+import json
+import tarfile
+
+import pytest
+
+server = pytest.importorskip("server")
+
+
+def test_streamed_members_form_a_valid_tar():
+    blob = server.tar_member("0000.wav", b"RIFF1234") + server.tar_member("manifest.json", b"{}" * 400) + server.tar_end()
+    assert len(blob) % tarfile.BLOCKSIZE == 0
+    with tarfile.open(fileobj=io.BytesIO(blob)) as tf:
+        assert tf.getnames() == ["0000.wav", "manifest.json"]
+        assert tf.extractfile("0000.wav").read() == b"RIFF1234"
+
+
+def test_item_parsing():
+    items = server.parse_batch_items(json.dumps([{"text": "Hello", "language": "hi", "name": "greet.v2"}, {"text": "Bye"}]))
+    assert items == [("Hello", "hi", "greet.v2"), ("Bye", "en", None)]
+
+
+@pytest.mark.parametrize("items", [
+    "not json",
+    "[]",
+    json.dumps([{"text": "  "}]),
+    json.dumps([{"text": "a", "name": "../etc/passwd"}]),
+    json.dumps([{"text": "a", "name": "x"}, {"text": "b", "name": "x"}]),
+])
+def test_bad_items_are_rejected(items):
+    with pytest.raises(server.HTTPException) as e:
+        server.parse_batch_items(items)
+    assert e.value.status_code == 400
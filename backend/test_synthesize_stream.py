@@ -0,0 +1,151 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+server = pytest.importorskip("server")
+from starlette.requests import ClientDisconnect  # noqa: E402
+
+
+def test_post_processor_trims_leading_and_trailing_silence():
+    sr = 24000
+    post = server.StreamPostProcessor(sr)
+    silence = np.zeros(sr // 10, dtype=np.float32)
+    tone = 0.5 * np.sin(2 * np.pi * 220 * np.arange(sr // 10) / sr).astype(np.float32)
+    assert len(post.process(silence)) == 0
+    first = post.process(np.concatenate([silence, tone]))
+    assert 0 < len(first) <= len(tone) + post.frame_len
+    # a pause is held back until speech resumes, and never sent if it is the end
+    assert len(post.process(silence)) == 0
+    resumed = post.process(tone)
+    assert len(resumed) >= len(silence) + len(tone) - post.frame_len
+    assert len(post.process(silence)) == 0
+
+
+def test_post_processor_gain_only_goes_down():
+    post = server.StreamPostProcessor(24000)
+    quiet = np.full(2400, 0.5, dtype=np.float32)
+    loud = np.full(2400, 2.0, dtype=np.float32)
+    assert np.allclose(post.process(quiet), 0.5)
+    assert np.max(np.abs(post.process(loud))) <= 1.0 + 1e-6
+    # later quiet chunks keep the reduced gain instead of jumping back up
+    assert np.allclose(post.process(quiet), 0.25, atol=1e-3)
+
+
+class StubStream:
+    """inference_stream stand-in whose steps take a while on the model thread."""
+    def __init__(self, chunks=50, step_s=0.02):
+        self.chunks = chunks
+        self.step_s = step_s
+        self.running = threading.Event()
+        self.closed = []
+        self.overlaps = 0
+
+    def inference_stream(self, text, language, gpt_latent, speaker_latent, **kw):
+        def gen():
+            try:
+                for _ in range(self.chunks):
+                    if self.running.is_set():
+                        self.overlaps += 1
+                    self.running.set()
+                    time.sleep(self.step_s)
+                    self.running.clear()
+                    yield np.full(2400, 0.3, dtype=np.float32)
+            finally:
+                self.closed.append(threading.current_thread().name)
+        return gen()
+
+
+@pytest.fixture
+def stub_model(monkeypatch):
+    stub = StubStream()
+    monkeypatch.setattr(server, "tts", SimpleNamespace(synthesizer=SimpleNamespace(tts_model=stub)))
+    monkeypatch.setattr(server, "_next_stream_chunk", lambda gen: next(gen, None))
+    monkeypatch.setattr(server, "require_model", lambda: None)
+    monkeypatch.setattr(server, "resolve_speaker", lambda user_id, language: "stub.wav")
+    monkeypatch.setattr(server, "get_speaker_latents", lambda path: (None, None))
+    monkeypatch.setattr(server, "sampling_params", lambda language, speaker: {})
+
+    async def speaker_hash(path):
+        return "stub"
+    monkeypatch.setattr(server, "resolve_speaker_hash", speaker_hash)
+    return stub
+
+
+def stream(text, **kw):
+    return server.synthesize_stream(**{
+        "text": text, "language": "en", "user_id": "u", "format": "wav", "stream_chunk_size": 20,
+        "sample_rate": server.SAMPLE_RATE, "channels": 1, "priority": "interactive", "deadline_ms": None,
+        "accept": None, **kw,
+    })
+
+
+HTTP = {"type": "http", "asgi": {"spec_version": "2.4"}}
+
+
+async def never_disconnects():
+    await asyncio.Event().wait()
+
+
+def test_disconnect_mid_stream_waits_for_the_model_step_before_freeing_the_model(stub_model):
+    errors = []
+
+    async def main():
+        asyncio.get_running_loop().set_exception_handler(lambda loop, ctx: errors.append(ctx))
+        response = await stream("cancel me mid stream")
+        received = []
+
+        async def send(message):
+            received.append(message)
+
+        consumer = asyncio.create_task(response(HTTP, never_disconnects, send))
+        while len(received) < 3:
+            await asyncio.sleep(0.005)
+        # the client hangs up while the model thread is inside next(gen)
+        while not stub_model.running.is_set():
+            await asyncio.sleep(0.001)
+        consumer.cancel()
+        await asyncio.gather(consumer, return_exceptions=True)
+        while server.inference_lock.locked():
+            assert stub_model.closed == [] or not stub_model.running.is_set()
+            await asyncio.sleep(0.001)
+        # the next request gets the model only after the step finished and the generator closed
+        assert not stub_model.running.is_set()
+        assert len(stub_model.closed) == 1 and stub_model.closed[0].startswith("xtts")
+        await asyncio.sleep(0.05)
+
+    asyncio.run(asyncio.wait_for(main(), 10))
+    assert stub_model.overlaps == 0
+    assert errors == []
+
+
+def test_deadline_expiring_in_the_queue_is_a_503_before_the_stream_starts(stub_model):
+    async def main():
+        await server.inference_lock.acquire()
+        try:
+            expired_before = server.admission.counts["interactive"]["expired"]
+            with pytest.raises(server.HTTPException) as e:
+                await stream("never started", deadline_ms=100)
+            assert e.value.status_code == 503 and "Retry-After" in e.value.headers
+            assert server.admission.counts["interactive"]["expired"] == expired_before + 1
+        finally:
+            server.inference_lock.release()
+        assert not server.inference_lock.locked()
+
+        # a client that leaves before the body starts still frees the model
+        async def gone(message):
+            raise OSError("connection reset")
+
+        disconnected_before = server.admission.counts["interactive"]["disconnected"]
+        response = await stream("abandoned")
+        assert server.inference_lock.locked()
+        with pytest.raises(ClientDisconnect):
+            await response(HTTP, never_disconnects, gone)
+        assert not server.inference_lock.locked()
+        assert server.admission.counts["interactive"]["disconnected"] == disconnected_before + 1
+        assert stub_model.closed == []
+
+    asyncio.run(asyncio.wait_for(main(), 10))
@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+
+# Importing server needs fastapi and the audio stack; skip (rather than fail) where they are not installed
+server = pytest.importorskip("server")
+
+try:
+    import webrtcvad
+except ImportError:
+    webrtcvad = None
+
+# Previous implementation, kept here as the reference for parity and for bench_trim_silence.py
+def legacy_trim_silence(x: np.ndarray, sr: int, aggressiveness=2):
+    if webrtcvad is not None:
+        vad = webrtcvad.Vad(aggressiveness)
+        frame_ms = 30
+        frame_len = int(sr * frame_ms / 1000)
+        if x.ndim > 1:
+            x_mono = x.mean(axis=1)
+        else:
+            x_mono = x
+        pcm16 = (np.clip(x_mono, -1.0, 1.0) * 32767).astype(np.int16).tobytes()
+        num_frames = len(pcm16) // (frame_len * 2)
+        voiced = []
+        for i in range(num_frames):
+            start = i * frame_len * 2
+            chunk = pcm16[start:start + frame_len * 2]
+            try:
+                is_speech = vad.is_speech(chunk, sample_rate=sr)
+            except Exception:
+                is_speech = False
+            voiced.append(is_speech)
+        if any(voiced):
+            first = next(i for i, v in enumerate(voiced) if v)
+            last = len(voiced) - 1 - next(i for i, v in enumerate(reversed(voiced)) if v)
+            start_sample = max(0, first * frame_len)
+            end_sample = min(len(x_mono), (last + 1) * frame_len)
+            return x[start_sample:end_sample]
+        else:
+            return x_mono
+    else:
+        if x.ndim > 1:
+            x_mono = x.mean(axis=1)
+        else:
+            x_mono = x
+        energy = x_mono ** 2
+        thresh = max(1e-7, np.percentile(energy, 20) * 0.5)
+        indices = np.where(energy > thresh)[0]
+        if len(indices) == 0:
+            return x_mono
+        return x_mono[indices[0]:indices[-1] + 1]
+
+def speech_like(sr, lead_s, speech_s, tail_s, noise_db=None, seed=0):
+    """Syllable-modulated harmonic tone between two silences. Returns (signal, speech_start, speech_end)."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(sr * speech_s)) / sr
+    voice = sum(np.sin(2 * np.pi * 140 * k * t) / k for k in range(1, 6))
+    envelope = 0.55 + 0.45 * np.sin(2 * np.pi * 4 * t - np.pi / 2)
+    speech = 0.3 * voice * envelope
+    lead, tail = int(sr * lead_s), int(sr * tail_s)
+    x = np.concatenate([np.zeros(lead), speech, np.zeros(tail)])
+    if noise_db is not None:
+        x = x + rng.normal(0, 10 ** (noise_db / 20), len(x))
+    return x.astype(np.float32), lead, lead + len(speech)
+
+def bounds_in(trimmed, x):
+    """(start, end) sample indices of a trimmed view inside x."""
+    start = (trimmed.__array_interface__["data"][0] - x.__array_interface__["data"][0]) // x.itemsize
+    return start, start + len(trimmed)
+
+@pytest.mark.parametrize("sr", [16000, 22050, 24000, 44100, 48000])
+def test_boundaries_match_legacy_on_clean_padding(sr):
+    x, _, _ = speech_like(sr, 0.5, 2.0, 0.7)
+    frame_len = int(sr * 0.03)
+    old = legacy_trim_silence(x, sr)
+    if len(old) == len(x):
+        pytest.skip("legacy webrtcvad path does not trim at this rate")
+    old_start, old_end = bounds_in(old, x)
+    new_start, new_end = bounds_in(server.trim_silence(x, sr), x)
+    assert abs(new_start - old_start) <= 2 * frame_len
+    assert abs(new_end - old_end) <= 2 * frame_len
+
+@pytest.mark.parametrize("sr", [16000, 24000, 44100])
+@pytest.mark.parametrize("noise_db", [-70, -55])
+def test_boundaries_track_speech_in_noise(sr, noise_db):
+    x, start, end = speech_like(sr, 0.8, 3.0, 1.2, noise_db=noise_db, seed=sr)
+    frame_len = int(sr * 0.03)
+    new_start, new_end = bounds_in(server.trim_silence(x, sr), x)
+    assert abs(new_start - start) <= 3 * frame_len
+    assert abs(new_end - end) <= 3 * frame_len
+
+def test_all_silence_is_returned_untrimmed():
+    x = np.zeros(24000, dtype=np.float32)
+    assert len(server.trim_silence(x, 24000)) == len(x)
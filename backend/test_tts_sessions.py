@@ -0,0 +1,94 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+server = pytest.importorskip("server")
+
+
+def test_stable_prefix_needs_something_after_the_boundary():
+    text = "I will call you tomorrow. Maybe at 5 p.m."
+    end = server.stable_prefix_end(text, 0, "en")
+    assert text[:end] == "I will call you tomorrow."
+    assert server.stable_prefix_end(text, end, "en") == end
+    assert server.stable_prefix_end(text, end, "en", final=True) == len(text)
+    hindi = "मैं कल फोन करूँगा। शायद शाम"
+    assert hindi[:server.stable_prefix_end(hindi, 0, "hi")] == "मैं कल फोन करूँगा।"
+
+
+def test_long_clauses_and_unpunctuated_text_are_committed():
+    text = "When you get to the station tomorrow, call me"
+    assert text[:server.stable_prefix_end(text, 0, "en")] == "When you get to the station tomorrow,"
+    words = "word " * 100
+    end = server.stable_prefix_end(words, 0, "en")
+    assert 0 < end <= server.text_char_limit("en") and words[end] == " "
+
+
+def run_session(script, **kw):
+    async def main():
+        synthesized = []
+
+        async def submit(seg, priority, deadline):
+            await asyncio.sleep(0.01)
+            synthesized.append(seg)
+            return np.ones(100, dtype=np.float32)
+
+        session = server.SpeechSession("u1", "en", "speakers/u1/en.wav", {}, 24000, "pcm", 1, submit, **kw)
+        await script(session)
+        return session, synthesized
+
+    return asyncio.run(main())
+
+
+def test_revision_cancels_only_unspoken_spans():
+    async def script(session):
+        session.update("Hello there my friend. How are")
+        assert session.committed_end == len("Hello there my friend.")
+        session.update("Hi there my friend. How are you doing", offset=0)
+        assert session.counts["revisions"] == 1 and session.counts["cancelled_segments"] == 1
+        session.update(" today?", final=True)
+        await asyncio.gather(*(t for span in session.spans for t in span.tasks))
+        session.spans[0].emitted = True
+        with pytest.raises(server.HTTPException) as e:
+            session.update("Hey", offset=0)
+        assert e.value.status_code == 409
+
+    session, synthesized = run_session(script)
+    assert synthesized == ["Hi there my friend.", "How are you doing today?"]
+    assert session.text == "Hi there my friend. How are you doing today?"
+
+
+def test_resending_the_same_transcript_keeps_work():
+    async def script(session):
+        session.update("Good morning everyone. And")
+        session.update("Good morning everyone. And welcome", offset=0)
+        assert session.counts["revisions"] == 0 and len(session.spans) == 1
+        session.close()
+
+    run_session(script)
+
+
+def test_spans_go_through_admission(monkeypatch):
+    admission = server.AdmissionController(
+        {name: 1 for name in server.PRIORITIES}, {name: 0 for name in server.PRIORITIES})
+    monkeypatch.setattr(server, "admission", admission)
+
+    async def script(session):
+        session.update("First sentence here. Second")
+        assert admission.in_flight["batch"] == 1
+        # the queue is full: the update is refused, but its text is kept
+        with pytest.raises(server.HTTPException) as e:
+            session.update(" sentence here. Third")
+        assert e.value.status_code == 429 and "Retry-After" in e.value.headers
+        assert session.committed_end == len("First sentence here.")
+        await asyncio.gather(*session.spans[0].tasks)
+        await asyncio.sleep(0)
+        assert admission.in_flight["batch"] == 0
+        session.update("", final=True)
+        await asyncio.gather(*session.spans[-1].tasks)
+        await asyncio.sleep(0)
+
+    session, synthesized = run_session(script, priority="batch")
+    assert synthesized == ["First sentence here.", "Second sentence here. Third"]
+    assert admission.counts["batch"]["completed"] == 2 and admission.counts["batch"]["rejected"] == 1
+    assert session.to_dict()["priority"] == "batch"
@@ -3,6 +3,7 @@ import 'package:record/record.dart';
 import 'package:permission_handler/permission_handler.dart';
 import 'package:path_provider/path_provider.dart';
 import 'dart:io';
+import 'dart:convert';
 import 'package:http/http.dart' as http;
 import 'package:audioplayers/audioplayers.dart';
 import 'package:animate_do/animate_do.dart';
@@ -87,6 +88,20 @@ class _VoiceCloningScreenState extends State<VoiceCloningScreen>
     }
   }
 
+  Future<Map<String, dynamic>> _waitForCloneJob(String jobId) async {
+    while (true) {
+      await Future.delayed(const Duration(seconds: 1));
+      final response = await http.get(Uri.parse('$baseUrl/clone/status/$jobId'));
+      if (response.statusCode != 200) {
+        return {'status': 'failed', 'error': 'status ${response.statusCode}'};
+      }
+      final Map<String, dynamic> status = jsonDecode(response.body);
+      if (status['status'] == 'done' || status['status'] == 'failed') {
+        return status;
+      }
+    }
+  }
+
   Future<void> _uploadSample() async {
     if (_recordedFilePath == null) return;
 
@@ -104,7 +119,16 @@ class _VoiceCloningScreenState extends State<VoiceCloningScreen>
       request.fields['user_id'] = username;
 
       var response = await request.send();
-      if (response.statusCode == 200) {
+      // The server queues the clone job (202) and we poll until it finishes
+      bool cloned = response.statusCode == 200;
+      String? failure;
+      if (response.statusCode == 202) {
+        final job = jsonDecode(await response.stream.bytesToString());
+        final status = await _waitForCloneJob(job['job_id']);
+        cloned = status['status'] == 'done';
+        if (!cloned) failure = status['error']?.toString() ?? 'unknown error';
+      }
+      if (cloned) {
         if (mounted) {
           ScaffoldMessenger.of(context).showSnackBar(
             SnackBar(
@@ -117,6 +141,15 @@ class _VoiceCloningScreenState extends State<VoiceCloningScreen>
             ),
           );
         }
+      } else if (failure != null) {
+        if (mounted) {
+          ScaffoldMessenger.of(context).showSnackBar(
+            SnackBar(
+              content: Text("Cloning Failed: $failure"),
+              backgroundColor: Colors.red,
+            ),
+          );
+        }
       } else {
         if (mounted) {
           ScaffoldMessenger.of(context).showSnackBar(
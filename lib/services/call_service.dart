@@ -1,17 +1,20 @@
 import 'dart:async';
 import 'dart:convert';
+import 'dart:io';
 import 'package:http/http.dart' as http;
 
 class CallService {
   // REPLACE WITH YOUR PC's IP ADDRESS
-  static const String baseUrl = "http://192.168.1.88:8000"; 
-  
+  static const String baseUrl = "http://192.168.1.88:8000";
+
   Function(String text, String senderId)? onTextReceived;
-  
+
   String? _currentChannelId;
   String? _userId;
-  Timer? _pollTimer;
+  WebSocket? _socket;
+  Timer? _reconnectTimer;
   Set<String> _receivedMessageIds = {};
+  int _lastSeq = 0; // cursor: server only returns messages with seq > _lastSeq
 
   Future<void> initialize(String userId) async {
     _userId = userId;
@@ -19,43 +22,76 @@ class CallService {
   }
 
   Future<void> joinChannel(String channelId) async {
+    await _closeSocket();
     _currentChannelId = channelId;
     _receivedMessageIds.clear();
-    _startPolling();
-    print("Joined channel (polling): $channelId");
+    _lastSeq = 0;
+    await _connect();
+    print("Joined channel (push): $channelId");
   }
 
-  void _startPolling() {
-    _pollTimer?.cancel();
-    _pollTimer = Timer.periodic(const Duration(seconds: 1), (timer) async {
-      if (_currentChannelId == null) return;
+  // Messages are pushed by the server over /ws/messages. On disconnect we
+  // reconnect with our last seq, so nothing posted in between is lost.
+  Future<void> _connect() async {
+    final channelId = _currentChannelId;
+    if (channelId == null) return;
+
+    final wsUrl = baseUrl.replaceFirst(RegExp(r'^http'), 'ws');
+    try {
+      final socket = await WebSocket.connect(
+        '$wsUrl/ws/messages?channel_id=${Uri.encodeQueryComponent(channelId)}&since=$_lastSeq',
+      );
+      if (_currentChannelId != channelId) {
+        await socket.close();
+        return;
+      }
+      _socket = socket;
+      socket.listen(
+        (data) => _handleMessage(jsonDecode(data)),
+        onDone: () => _onSocketClosed(socket, channelId),
+        onError: (e) {
+          print("Push Error: $e");
+          _onSocketClosed(socket, channelId);
+        },
+        cancelOnError: true,
+      );
+    } catch (e) {
+      print("Push connect failed: $e. Fetching once and retrying.");
       await _fetchMessages();
-    });
+      _scheduleReconnect(channelId);
+    }
+  }
+
+  void _onSocketClosed(WebSocket socket, String channelId) {
+    if (_socket == socket) _socket = null;
+    _scheduleReconnect(channelId);
+  }
+
+  void _scheduleReconnect(String channelId) {
+    if (_currentChannelId != channelId) return;
+    _reconnectTimer?.cancel();
+    _reconnectTimer = Timer(const Duration(seconds: 1), _connect);
+  }
+
+  Future<void> _closeSocket() async {
+    _reconnectTimer?.cancel();
+    final socket = _socket;
+    _socket = null;
+    await socket?.close();
   }
 
   Future<void> _fetchMessages() async {
     try {
       final response = await http.get(
-        Uri.parse('$baseUrl/get_messages?channel_id=$_currentChannelId'),
+        Uri.parse(
+          '$baseUrl/get_messages?channel_id=$_currentChannelId&since=$_lastSeq',
+        ),
       );
 
       if (response.statusCode == 200) {
         final List<dynamic> messages = jsonDecode(response.body);
         for (var msg in messages) {
-          String msgId = msg['id'];
-          String senderId = msg['sender_id'];
-          String text = msg['text'];
-
-          // If new message and NOT sent by me
-          if (!_receivedMessageIds.contains(msgId)) {
-            _receivedMessageIds.add(msgId);
-            
-            if (senderId != _userId) {
-               if (onTextReceived != null) {
-                 onTextReceived!(text, senderId);
-               }
-            }
-          }
+          _handleMessage(msg);
         }
       }
     } catch (e) {
@@ -63,6 +99,25 @@ class CallService {
     }
   }
 
+  void _handleMessage(dynamic msg) {
+    String msgId = msg['id'];
+    String senderId = msg['sender_id'];
+    String text = msg['text'];
+    int seq = msg['seq'] ?? 0;
+    if (seq > _lastSeq) _lastSeq = seq;
+
+    // If new message and NOT sent by me
+    if (!_receivedMessageIds.contains(msgId)) {
+      _receivedMessageIds.add(msgId);
+
+      if (senderId != _userId) {
+         if (onTextReceived != null) {
+           onTextReceived!(text, senderId);
+         }
+      }
+    }
+  }
+
   Future<void> sendText(String text) async {
     if (_currentChannelId == null || _userId == null) return;
 
@@ -82,8 +137,8 @@ class CallService {
   }
 
   Future<void> leaveChannel() async {
-    _pollTimer?.cancel();
     _currentChannelId = null;
+    await _closeSocket();
     print("Left channel");
   }
 
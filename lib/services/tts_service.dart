@@ -15,6 +15,19 @@ class TtsService {
   // REPLACE WITH YOUR PC's IP ADDRESS
   static const String baseUrl = "http://192.168.1.88:8000";
 
+  // Compressed audio is ~4-10x smaller than WAV over mobile links. Android plays
+  // Ogg Vorbis natively; iOS does not, so it gets FLAC. WAV stays as a fallback.
+  static String get _acceptAudio => Platform.isAndroid
+      ? 'audio/ogg, audio/flac;q=0.8, audio/wav;q=0.5'
+      : 'audio/flac, audio/wav;q=0.5';
+
+  static String _extensionFor(String? contentType) {
+    if (contentType == null) return 'wav';
+    if (contentType.startsWith('audio/ogg')) return 'ogg';
+    if (contentType.startsWith('audio/flac')) return 'flac';
+    return 'wav';
+  }
+
   Future<void> initialize() async {
     await _flutterTts.setSharedInstance(true);
 
@@ -66,12 +79,14 @@ class TtsService {
         request.fields['text'] = text;
         request.fields['language'] = languageCode;
         request.fields['user_id'] = userId; // Use provided user ID
+        request.headers['Accept'] = _acceptAudio;
 
         var response = await request.send();
 
         if (response.statusCode == 200) {
           final dir = await getTemporaryDirectory();
-          final file = File('${dir.path}/tts_output.wav');
+          final ext = _extensionFor(response.headers['content-type']);
+          final file = File('${dir.path}/tts_output.$ext');
           await response.stream.pipe(file.openWrite());
 
           await _audioPlayer.play(DeviceFileSource(file.path));